@@ -51,14 +51,36 @@ def create_app(config_name):
     if not os.path.exists(app.config['UPLOAD_FOLDER']):
         os.makedirs(app.config['UPLOAD_FOLDER'])
     
+    # 确保内容寻址存储目录存在
+    if not os.path.exists(app.config['BLOB_FOLDER']):
+        os.makedirs(app.config['BLOB_FOLDER'])
+    
+    # 确保数据集版本目录存在
+    if not os.path.exists(app.config['VERSION_FOLDER']):
+        os.makedirs(app.config['VERSION_FOLDER'])
+    
     # 确保临时文件目录存在
     if not os.path.exists(app.config['TEMP_FOLDER']):
         os.makedirs(app.config['TEMP_FOLDER'])
     
+    # 确保后台任务目录存在
+    if not os.path.exists(app.config['JOB_FOLDER']):
+        os.makedirs(app.config['JOB_FOLDER'])
+    
     # 注册蓝图
-    from app.routes import auth_bp, data_bp, analysis_bp
+    from app.routes import auth_bp, data_bp, analysis_bp, jobs_bp
     app.register_blueprint(auth_bp)
     app.register_blueprint(data_bp)
     app.register_blueprint(analysis_bp)
+    app.register_blueprint(jobs_bp)
+    
+    # 创建缺少的数据表，并为旧数据库中已有的表补充新增的列，无需重建数据库
+    with app.app_context():
+        from app import models  # noqa: F401
+        from app.utils.schema import upgrade_schema
+        try:
+            upgrade_schema(db)
+        except Exception as e:
+            print(f"升级数据库结构失败: {str(e)}")
     
     return app 
\ No newline at end of file
@@ -2,6 +2,12 @@ from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
 import json
+import os
+import sys
+
+# 在app目录下直接运行本脚本时，把项目根目录加入搜索路径以导入app包
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app.utils.schema import upgrade_schema
 
 # 初始化 Flask 应用
 app = Flask(__name__)
@@ -19,15 +25,18 @@ class Dataset(db.Model):
     description = db.Column(db.Text)
     file_path = db.Column(db.String(256))  # 保存文件路径
     file_type = db.Column(db.String(16))   # csv, xlsx 等
+    content_hash = db.Column(db.String(64), index=True)  # 文件内容的SHA-256，共享存储的文件才有值
     columns = db.Column(db.Text)  # 存储列信息的JSON字符串
     row_count = db.Column(db.Integer, default=0)
     cleaned = db.Column(db.Boolean, default=False)  # 是否已清洗
+    version = db.Column(db.Integer, default=0)  # 当前版本号，0表示还没有清洗过（未建立版本记录）
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_modified = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
 
     visualizations = db.relationship('Visualization', backref='dataset', lazy='dynamic')
     predictions = db.relationship('Prediction', backref='dataset', lazy='dynamic')
+    versions = db.relationship('DatasetVersion', backref='dataset', lazy='dynamic')
 
     def to_dict(self):
         return {
@@ -38,10 +47,41 @@ class Dataset(db.Model):
             'columns': json.loads(self.columns) if self.columns else [],
             'row_count': self.row_count,
             'cleaned': self.cleaned,
+            'version': self.version or 0,
             'created_at': self.created_at.isoformat(),
             'last_modified': self.last_modified.isoformat()
         }
 
+class DatasetVersion(db.Model):
+    __tablename__ = 'dataset_versions'
+
+    id = db.Column(db.Integer, primary_key=True)
+    dataset_id = db.Column(db.Integer, db.ForeignKey('datasets.id'), index=True)
+    version = db.Column(db.Integer)  # 版本号，从1开始，1为上传的原始文件
+    parent_version = db.Column(db.Integer)  # 基于哪个版本清洗得到
+    file_path = db.Column(db.String(256))  # 版本文件路径，版本文件创建后不再修改
+    file_type = db.Column(db.String(16))
+    content_hash = db.Column(db.String(64))
+    operations = db.Column(db.Text)  # 生成该版本的清洗操作(JSON)
+    columns = db.Column(db.Text)  # 该版本的列信息(JSON)
+    row_count = db.Column(db.Integer, default=0)
+    cache_key = db.Column(db.String(64), index=True)  # 源数据和清洗操作序列的哈希，相同的键对应相同的数据
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used = db.Column(db.DateTime, default=datetime.utcnow)  # 最近一次切换到该版本的时间，用于淘汰版本文件
+
+    def to_dict(self):
+        columns = json.loads(self.columns) if self.columns else []
+        return {
+            'version': self.version,
+            'parent_version': self.parent_version,
+            'file_type': self.file_type,
+            'operations': json.loads(self.operations) if self.operations else [],
+            'row_count': self.row_count,
+            'column_count': len(columns),
+            'available': bool(self.file_path),
+            'created_at': self.created_at.isoformat()
+        }
+
 class Visualization(db.Model):
     __tablename__ = 'visualizations'
 
@@ -91,6 +131,22 @@ class User(db.Model):
     def __repr__(self):
         return f'<User {self.username}>'
 
+class Job(db.Model):
+    __tablename__ = 'jobs'
+
+    id = db.Column(db.String(32), primary_key=True)  # 任务ID（uuid十六进制字符串）
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    kind = db.Column(db.String(32))  # clean, clustering, classification, dimensionality_reduction, train_price_model
+    status = db.Column(db.String(16), default='queued')  # queued, running, succeeded, failed, cancelled
+    progress = db.Column(db.Float, default=0.0)  # 0~1
+    message = db.Column(db.String(256))  # 当前进度说明
+    params = db.Column(db.Text)  # 提交时的参数(JSON)
+    result = db.Column(db.Text)  # 成功时的结果(JSON)，与同步调用接口的响应相同
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
 # 重建Prediction表的函数
 def recreate_prediction_table():
     with app.app_context():
@@ -114,8 +170,15 @@ def create_tables():
         db.create_all()
     print("Tables created successfully!")
 
+# 为已有的表补充新增的列（create_all不会修改已存在的表），与启动后端服务时执行的升级相同
+def upgrade_tables():
+    with app.app_context():
+        upgrade_schema(db)
+
 if __name__ == '__main__':
     # 重建Prediction表
     recreate_prediction_table()
     # 创建所有表
-    create_tables()
\ No newline at end of file
+    create_tables()
+    # 旧数据库补充新增的列
+    upgrade_tables()
\ No newline at end of file
@@ -1,3 +1,4 @@
 # 导入模型供应用使用
 from app.models.user import User
-from app.models.dataset import Dataset 
\ No newline at end of file
+from app.models.dataset import Dataset 
+from app.models.job import Job
@@ -10,15 +10,18 @@ class Dataset(db.Model):
     description = db.Column(db.Text)
     file_path = db.Column(db.String(256))  # 保存文件路径
     file_type = db.Column(db.String(16))   # csv, xlsx 等
+    content_hash = db.Column(db.String(64), index=True)  # 文件内容的SHA-256，共享存储的文件才有值
     columns = db.Column(db.Text)  # 存储列信息的JSON字符串
     row_count = db.Column(db.Integer, default=0)
     cleaned = db.Column(db.Boolean, default=False)  # 是否已清洗
+    version = db.Column(db.Integer, default=0)  # 当前版本号，0表示还没有清洗过（未建立版本记录）
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_modified = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     
     visualizations = db.relationship('Visualization', backref='dataset', lazy='dynamic')
     predictions = db.relationship('Prediction', backref='dataset', lazy='dynamic')
+    versions = db.relationship('DatasetVersion', backref='dataset', lazy='dynamic')
     
     def to_dict(self):
         return {
@@ -29,10 +32,41 @@ class Dataset(db.Model):
             'columns': json.loads(self.columns) if self.columns else [],
             'row_count': self.row_count,
             'cleaned': self.cleaned,
+            'version': self.version or 0,
             'created_at': self.created_at.isoformat(),
             'last_modified': self.last_modified.isoformat()
         }
 
+class DatasetVersion(db.Model):
+    __tablename__ = 'dataset_versions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    dataset_id = db.Column(db.Integer, db.ForeignKey('datasets.id'), index=True)
+    version = db.Column(db.Integer)  # 版本号，从1开始，1为上传的原始文件
+    parent_version = db.Column(db.Integer)  # 基于哪个版本清洗得到
+    file_path = db.Column(db.String(256))  # 版本文件路径，版本文件创建后不再修改
+    file_type = db.Column(db.String(16))
+    content_hash = db.Column(db.String(64))
+    operations = db.Column(db.Text)  # 生成该版本的清洗操作(JSON)
+    columns = db.Column(db.Text)  # 该版本的列信息(JSON)
+    row_count = db.Column(db.Integer, default=0)
+    cache_key = db.Column(db.String(64), index=True)  # 源数据和清洗操作序列的哈希，相同的键对应相同的数据
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_used = db.Column(db.DateTime, default=datetime.utcnow)  # 最近一次切换到该版本的时间，用于淘汰版本文件
+    
+    def to_dict(self):
+        columns = json.loads(self.columns) if self.columns else []
+        return {
+            'version': self.version,
+            'parent_version': self.parent_version,
+            'file_type': self.file_type,
+            'operations': json.loads(self.operations) if self.operations else [],
+            'row_count': self.row_count,
+            'column_count': len(columns),
+            'available': bool(self.file_path),
+            'created_at': self.created_at.isoformat()
+        }
+
 class Visualization(db.Model):
     __tablename__ = 'visualizations'
     
@@ -0,0 +1,33 @@
+from app import db
+from datetime import datetime
+import json
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+    
+    id = db.Column(db.String(32), primary_key=True)  # 任务ID（uuid十六进制字符串）
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    kind = db.Column(db.String(32))  # clean, clustering, classification, dimensionality_reduction, train_price_model
+    status = db.Column(db.String(16), default='queued')  # queued, running, succeeded, failed, cancelled
+    progress = db.Column(db.Float, default=0.0)  # 0~1
+    message = db.Column(db.String(256))  # 当前进度说明
+    params = db.Column(db.Text)  # 提交时的参数(JSON)
+    result = db.Column(db.Text)  # 成功时的结果(JSON)，与同步调用接口的响应相同
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress or 0.0,
+            'message': self.message,
+            'params': json.loads(self.params) if self.params else {},
+            'error': self.error,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -4,6 +4,7 @@ from flask import Blueprint
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 data_bp = Blueprint('data', __name__, url_prefix='/api/data')
 analysis_bp = Blueprint('analysis', __name__, url_prefix='/api/analysis')
+jobs_bp = Blueprint('jobs', __name__, url_prefix='/api/jobs')
 
 # 导入路由视图
-from app.routes import auth, data, analysis 
\ No newline at end of file
+from app.routes import auth, data, analysis, jobs 
\ No newline at end of file
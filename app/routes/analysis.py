@@ -3,27 +3,98 @@ from flask_login import login_required, current_user
 import os
 import json
 from app import db
-from app.models.dataset import Dataset, Visualization, Prediction
+from app.models.dataset import Dataset, DatasetVersion, Visualization, Prediction
 from app.routes import analysis_bp
-from app.services.visualizer import create_visualization
+from app.services.visualizer import image_directory, CHART_TYPES
+from app.services import render_pool
+from app.services.chart_data import (create_chart_data, required_columns, load_chart_frame,
+                                     saved_correlation)
+from app.services import render_cache
+from app.services import image_variants
+from app.services.snapshot_cache import file_key
 from app.services.predictor import train_model, evaluate_model
-import pandas as pd
+from app.services.analysis_tasks import (run_clustering, run_classification, run_dimensionality_reduction,
+                                         run_price_training)
+from app.services import job_queue
+from app.services.scheduler import scheduled, INTERACTIVE, BATCH
+from app.utils.helpers import split_file_extension, file_extension
 import numpy as np
-from sklearn.cluster import KMeans, DBSCAN, AgglomerativeClustering
-from sklearn.decomposition import PCA
-from sklearn.manifold import TSNE
-from sklearn.linear_model import LogisticRegression
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.svm import SVC
-from sklearn.model_selection import train_test_split
-import joblib
 # 导入房价预测模块
-from app.services.predict_methods import load_data, preprocess_data, full_training_pipeline, predict, evaluate_model as evaluate_house_price_model
+from app.services.predict_methods import load_data, predict
 import time
 import app.services.predict_methods
 
+def chart_image_path(dataset, chart_type, config):
+    """图表在渲染缓存中的图片路径，由数据版本、图表类型和配置决定；无法缓存时返回None"""
+    if chart_type in CHART_TYPES and os.path.exists(dataset.file_path):
+        key = render_cache.render_key(file_key(dataset.file_path), chart_type, config)
+        return render_cache.cached_image_path(image_directory(), chart_type, key)
+    return None
+
+def image_urls(visualization):
+    """图表图片和缩略图的URL，带有按图片内容计算的版本参数v，图片变化时URL随之变化，可以被浏览器长期缓存"""
+    url = f'/api/analysis/image/{visualization.id}'
+    try:
+        url = f'{url}?v={image_variants.content_hash(visualization.image_path)[:16]}'
+        thumbnail_url = f'{url}&size=thumb&format=webp'
+    except OSError:
+        thumbnail_url = f'{url}?size=thumb&format=webp'
+    return {'image_url': url, 'thumbnail_url': thumbnail_url}
+
+def prune_render_cache(app, new_images):
+    """清理渲染缓存，刚生成、需要返回给客户端的图片new_images不会被删除
+
+    图表记录引用的图片也可以被清理，之后请求该图片时按记录重新绘制（见restore_image）。
+    """
+    render_cache.prune(image_directory(), app.config['RENDER_CACHE_BYTES'], keep=new_images)
+
+@scheduled(INTERACTIVE)
+def restore_image(dataset, chart_type, config, image_path):
+    """渲染缓存中的图片被清理后，按图表记录的类型和配置重新绘制到原路径
+
+    图片路径由数据版本、图表类型和配置确定，在数据集当前文件和各版本文件中找到生成该图片的数据重新绘制；
+    数据文件已被删除时无法恢复。成功时返回None，否则返回错误响应。
+    """
+    config = json.loads(config or '{}')
+    app = current_app._get_current_object()
+    candidates = [(dataset.file_path, dataset.file_type)] + [
+        (version.file_path, version.file_type)
+        for version in DatasetVersion.query.filter_by(dataset_id=dataset.id)]
+    for file_path, file_type in candidates:
+        if not file_path or not os.path.exists(file_path):
+            continue
+        key = render_cache.render_key(file_key(file_path), chart_type, config)
+        if os.path.abspath(render_cache.cached_image_path(image_directory(), chart_type, key)) != os.path.abspath(image_path):
+            continue
+        # 变体由旧图片生成，与重新绘制的图片不一定一致
+        image_variants.remove_variants(image_path)
+        if chart_type == 'cluster':
+            result = render_pool.render_clusters(app, file_path, file_type, config, image_path=image_path)
+        else:
+            result = render_pool.render_file(app, file_path, file_type, chart_type, config, image_path)
+        if not result['success']:
+            return jsonify({'error': f"重新生成图像失败: {result['error']}"}), 500
+        prune_render_cache(app, [image_path])
+        return None
+    return jsonify({'error': '找不到图像文件'}), 404
+
+def add_visualization(dataset_id, name, chart_type, config, image_path):
+    """添加图表记录（不提交），同一数据集已有指向该图片的记录时直接复用"""
+    visualization = Visualization.query.filter_by(dataset_id=dataset_id, image_path=image_path).first()
+    if visualization is None:
+        visualization = Visualization(
+            name=name,
+            chart_type=chart_type,
+            config=json.dumps(config),
+            image_path=image_path,
+            dataset_id=dataset_id
+        )
+        db.session.add(visualization)
+    return visualization
+
 @analysis_bp.route('/visualize/<int:dataset_id>', methods=['POST'])
 @login_required
+@scheduled(INTERACTIVE)
 def visualize_data(dataset_id):
     dataset = Dataset.query.get_or_404(dataset_id)
     
@@ -36,56 +107,223 @@ def visualize_data(dataset_id):
     config = data.get('config', {})
     name = data.get('name', f'{chart_type} chart')
     
-    # 创建可视化
-    result = create_visualization(dataset.file_path, dataset.file_type, chart_type, config)
+    # 相同数据版本、图表类型和配置的图表直接返回已生成的图片，不读取数据也不重新绘图
+    image_path = chart_image_path(dataset, chart_type, config)
+    
+    if image_path is not None and render_cache.lookup(image_path):
+        result = {'success': True, 'image_path': image_path}
+    else:
+        # 创建可视化（在渲染进程中读取数据并绘图）
+        result = render_pool.render_file(current_app._get_current_object(), dataset.file_path,
+                                         dataset.file_type, chart_type, config, image_path=image_path)
+        if result['success']:
+            prune_render_cache(current_app, [result['image_path']])
     
     if result['success']:
         # 保存图表信息
-        visualization = Visualization(
-            name=name,
-            chart_type=chart_type,
-            config=json.dumps(config),
-            image_path=result['image_path'],
-            dataset_id=dataset_id
-        )
-        
-        db.session.add(visualization)
+        visualization = add_visualization(dataset_id, name, chart_type, config, result['image_path'])
         db.session.commit()
         
         return jsonify({
             'message': '可视化创建成功',
             'visualization_id': visualization.id,
-            'image_url': f'/api/analysis/image/{visualization.id}'
+            **image_urls(visualization)
         })
     
     return jsonify({'error': result['error']}), 400
 
+@analysis_bp.route('/visualize-batch/<int:dataset_id>', methods=['POST'])
+@login_required
+@scheduled(INTERACTIVE)
+def visualize_batch(dataset_id):
+    """一次创建多个图表
+
+    请求体 {"charts": [{"chart_type", "config", "name"}, ...]}。命中渲染缓存的图表直接返回；
+    其余图表用到的列只读取一次，交给渲染进程并行绘制，所有图表记录在一个事务中提交。
+    返回的列表与charts一一对应，单个图表失败不影响其他图表。
+    """
+    dataset = Dataset.query.get_or_404(dataset_id)
+    
+    # 检查权限
+    if dataset.user_id != current_user.id:
+        return jsonify({'error': '无权访问该数据集'}), 403
+    
+    data = request.get_json() or {}
+    charts = data.get('charts')
+    if not isinstance(charts, list) or not charts:
+        return jsonify({'error': '缺少图表列表: charts'}), 400
+    if len(charts) > current_app.config['VISUALIZE_BATCH_MAX']:
+        return jsonify({'error': f"一次最多创建{current_app.config['VISUALIZE_BATCH_MAX']}个图表"}), 400
+    
+    app = current_app._get_current_object()
+    specs = []
+    results = {}
+    pending = {}
+    for index, spec in enumerate(charts):
+        spec = spec if isinstance(spec, dict) else {}
+        chart_type = spec.get('chart_type')
+        config = spec.get('config') or {}
+        image_path = chart_image_path(dataset, chart_type, config)
+        # 相同的图表（图片路径相同）只绘制一次，无法缓存的图表各自绘制
+        key = image_path if image_path is not None else index
+        specs.append((chart_type, config, spec.get('name', f'{chart_type} chart'), key))
+        
+        if key in results or key in pending:
+            continue
+        if image_path is not None and render_cache.lookup(image_path):
+            results[key] = {'success': True, 'image_path': image_path}
+        elif chart_type not in CHART_TYPES:
+            results[key] = {'success': False, 'error': f'不支持的图表类型: {chart_type}'}
+        else:
+            # 热图可以由保存的相关系数统计量得到时，在这里取得矩阵后交给渲染进程
+            corr = saved_correlation(dataset.file_path, chart_type, config)
+            pending[key] = (chart_type, config, image_path, corr)
+    
+    if pending:
+        # 各图表用到的列合并后只读取一次
+        columns = []
+        for chart_type, config, _, corr in pending.values():
+            # 由保存的统计量得到相关系数矩阵的热图不需要读取数据
+            if corr is None:
+                columns.extend(required_columns(chart_type, config))
+        source = ('frame', None)
+        if columns:
+            try:
+                df = load_chart_frame(dataset.file_path, dataset.file_type, list(dict.fromkeys(columns)))
+            except Exception as e:
+                return jsonify({'error': f'读取数据失败: {str(e)}'}), 400
+            source = render_pool.share_frame(app, df)
+        try:
+            futures = {
+                key: render_pool.submit(app, source, chart_type, config, image_path,
+                                        dataset.file_path, dataset.file_type, corr)
+                for key, (chart_type, config, image_path, corr) in pending.items()
+            }
+            for key, future in futures.items():
+                results[key] = render_pool.result(future)
+        finally:
+            render_pool.release_frame(source)
+        
+        prune_render_cache(app, [result['image_path'] for result in results.values() if result['success']])
+    
+    # 所有图表记录在一个事务中提交
+    items = []
+    for chart_type, config, name, key in specs:
+        result = results[key]
+        if result['success']:
+            visualization = add_visualization(dataset_id, name, chart_type, config, result['image_path'])
+            items.append((visualization, None))
+        else:
+            items.append((None, result['error']))
+    db.session.commit()
+    
+    visualizations = []
+    for index, (visualization, error) in enumerate(items):
+        if visualization is None:
+            visualizations.append({'index': index, 'success': False, 'error': error})
+        else:
+            visualizations.append({
+                'index': index,
+                'success': True,
+                'visualization_id': visualization.id,
+                **image_urls(visualization)
+            })
+    
+    return jsonify({
+        'message': '可视化创建完成',
+        'created': sum(1 for item in visualizations if item['success']),
+        'visualizations': visualizations
+    })
+
+@analysis_bp.route('/chart-data/<int:dataset_id>', methods=['POST'])
+@login_required
+@scheduled(INTERACTIVE)
+def get_chart_data(dataset_id):
+    """返回图表的聚合数据（JSON），由前端绘制，参数与 /visualize 相同"""
+    dataset = Dataset.query.get_or_404(dataset_id)
+    
+    # 检查权限
+    if dataset.user_id != current_user.id:
+        return jsonify({'error': '无权访问该数据集'}), 403
+    
+    data = request.get_json() or {}
+    chart_type = data.get('chart_type')
+    config = data.get('config', {})
+    profile = json.loads(dataset.columns) if dataset.columns else []
+    
+    result = create_chart_data(dataset.file_path, dataset.file_type, chart_type, config, profile)
+    if not result['success']:
+        return jsonify({'error': result['error']}), 400
+    
+    return jsonify(result)
+
 @analysis_bp.route('/image/<int:visualization_id>')
 @login_required
 def get_visualization_image(visualization_id):
-    visualization = Visualization.query.get_or_404(visualization_id)
-    dataset = Dataset.query.get(visualization.dataset_id)
+    """返回图表图片
+
+    查询参数size为thumb时返回缩略图，format为webp时返回WebP图片，变体在第一次请求时生成并保存。
+    响应带有按图片内容计算的ETag，If-None-Match一致时返回304不再传输图片；
+    URL中的版本参数v与当前图片一致时（见image_urls）允许浏览器长期缓存，不再重新验证。
+    """
+    # 一次查询同时取得图表记录和所属数据集
+    visualization, dataset = db.session.query(Visualization, Dataset).join(
+        Dataset, Dataset.id == Visualization.dataset_id).filter(
+        Visualization.id == visualization_id).first_or_404()
+    image_path = visualization.image_path
     
     # 检查权限
     if dataset.user_id != current_user.id:
         return jsonify({'error': '无权访问该可视化'}), 403
     
-    # 获取图像路径并检查文件是否存在
-    image_path = visualization.image_path
+    size = request.args.get('size', 'full')
+    fmt = request.args.get('format', 'png')
+    if size not in image_variants.IMAGE_SIZES:
+        return jsonify({'error': f'不支持的图片尺寸: {size}'}), 400
+    if fmt not in image_variants.IMAGE_FORMATS:
+        return jsonify({'error': f'不支持的图片格式: {fmt}'}), 400
+    if fmt == 'webp' and not image_variants.webp_available():
+        fmt = 'png'
+    
+    # 获取图像路径并检查文件是否存在，渲染缓存中被清理的图片重新绘制
     if not os.path.exists(image_path):
-        current_app.logger.error(f"找不到图像文件: {image_path}")
-        return jsonify({'error': '找不到图像文件'}), 404
+        if render_cache.CACHED_IMAGE_NAME.match(os.path.basename(image_path)):
+            error = restore_image(dataset, visualization.chart_type, visualization.config, image_path)
+        else:
+            error = jsonify({'error': '找不到图像文件'}), 404
+        if error is not None:
+            current_app.logger.error(f"找不到图像文件: {image_path}")
+            return error
+    
+    # 变体由原图确定地生成，ETag由原图内容和变体决定
+    version = image_variants.content_hash(image_path)
+    etag = f'{version[:32]}-{size}-{fmt}'
+    if request.args.get('v') == version[:16]:
+        cache_control = f"private, max-age={current_app.config['IMAGE_CACHE_MAX_AGE']}, immutable"
+    else:
+        cache_control = 'private, no-cache'
+    # 作为渲染缓存中最近使用的图片，减少被清理的可能
+    render_cache.lookup(image_path)
+    
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        return response
     
     # 返回图像文件
     try:
-        from flask import send_file
-        return send_file(image_path, mimetype='image/png')
+        path = image_variants.get_variant(image_path, size, fmt)
+        response = send_file(path, mimetype=image_variants.IMAGE_FORMATS[fmt], etag=etag)
+        response.headers['Cache-Control'] = cache_control
+        return response
     except Exception as e:
         current_app.logger.error(f"返回图像文件时出错: {str(e)}")
         return jsonify({'error': f'返回图像文件时出错: {str(e)}'}), 500
 
 @analysis_bp.route('/predict/<int:dataset_id>', methods=['POST'])
 @login_required
+@scheduled(BATCH)
 def predict(dataset_id):
     dataset = Dataset.query.get_or_404(dataset_id)
     
@@ -167,8 +405,9 @@ def evaluate_model_route():
 
 @analysis_bp.route('/perform_clustering', methods=['POST'])
 @login_required
+@scheduled(BATCH, allows_async=True)
 def api_perform_clustering():
-    """API端点：执行聚类分析"""
+    """API端点：执行聚类分析（请求中指定async时提交为后台任务，立即返回任务ID）"""
     data = request.get_json()
     dataset_id = data.get('dataset_id')
     algorithm_config = data.get('algorithm_config', {})
@@ -180,79 +419,84 @@ def api_perform_clustering():
     if dataset.user_id != current_user.id:
         return jsonify({'success': False, 'error': '无权访问该数据集'}), 403
     
+    # 提取特征
+    if not feature_columns:
+        return jsonify({'success': False, 'error': '请选择至少一个特征列'}), 400
+    
+    task_args = {
+        'file_path': dataset.file_path,
+        'file_type': dataset.file_type,
+        'feature_columns': feature_columns,
+        'algorithm_config': algorithm_config,
+        'result_path': os.path.join(current_app.config['TEMP_FOLDER'], f'cluster_{dataset_id}_{current_user.id}.joblib'),
+        'store_dir': current_app.config['CLUSTER_FOLDER']
+    }
+    
+    if job_queue.wants_async(data):
+        job = job_queue.submit(current_app._get_current_object(), 'clustering', current_user.id, run_clustering,
+                               task_args, params={'dataset_id': dataset_id, 'algorithm_config': algorithm_config})
+        return jsonify(job_queue.accepted_response(job)), 202
+    
     try:
-        # 加载数据
-        df = pd.read_csv(dataset.file_path)
-        
-        # 提取特征
-        if not feature_columns:
-            return jsonify({'success': False, 'error': '请选择至少一个特征列'}), 400
-        
-        features_df = df[feature_columns].dropna()
-        
-        # 检查并处理分类特征
-        categorical_columns = []
-        numerical_columns = []
-        
-        for column in features_df.columns:
-            if features_df[column].dtype == 'object' or pd.api.types.is_categorical_dtype(features_df[column]):
-                categorical_columns.append(column)
-            else:
-                numerical_columns.append(column)
-        
-        # 如果所有选择的特征都是分类型，返回错误
-        if len(numerical_columns) == 0:
-            return jsonify({
-                'success': False, 
-                'error': '请至少选择一个数值型特征进行聚类分析'
-            }), 400
-        
-        # 如果存在分类特征，发送警告信息
-        warning_message = None
-        if categorical_columns:
-            warning_message = f'已忽略以下分类特征: {", ".join(categorical_columns)}。聚类分析仅使用数值特征。'
-            # 只使用数值特征
-            features_df = features_df[numerical_columns]
-        
-        # 执行聚类
-        result = perform_clustering(features_df, algorithm_config)
-        
-        # 保存结果
-        tmp_file = os.path.join(current_app.config['TEMP_FOLDER'], f'cluster_{dataset_id}_{current_user.id}.joblib')
-        joblib.dump(result, tmp_file)
-        
-        # 返回结果摘要
-        if isinstance(result.get('labels'), np.ndarray):
-            # 分析每个簇的大小
-            unique_labels = np.unique(result['labels'])
-            # 将numpy类型转换为Python原生类型
-            cluster_sizes = [int(np.sum(result['labels'] == label)) for label in unique_labels]
-            
-            response = {
-                'success': True,
-                'cluster_count': int(len(unique_labels)),
-                'cluster_sizes': cluster_sizes,
-                'total_samples': int(len(result['labels'])),
-                'outliers_count': int(np.sum(result['labels'] == -1)) if -1 in unique_labels else 0,
-                'warning': warning_message
-            }
-        else:
-            response = {
-                'success': True,
-                'message': '聚类完成，但无法解析簇信息',
-                'warning': warning_message
-            }
-        
+        response = run_clustering(**task_args)
+        if not response['success']:
+            return jsonify(response), 400
         return jsonify(response)
     
     except Exception as e:
         current_app.logger.error(f"聚类分析错误: {str(e)}")
         return jsonify({'success': False, 'error': f'聚类分析失败: {str(e)}'}), 500
 
+@analysis_bp.route('/visualize-clusters/<int:dataset_id>', methods=['POST'])
+@login_required
+@scheduled(INTERACTIVE)
+def visualize_clusters(dataset_id):
+    """绘制聚类图
+
+    请求体 {"config": {"feature_columns", "algorithm_config"}, "name"}，参数与聚类分析接口相同
+    （也支持features/algorithm/n_clusters等旧参数）。已执行过相同配置的聚类分析时直接使用保存的聚类结果绘图，
+    相同数据版本和配置的图表直接返回已生成的图片。
+    """
+    dataset = Dataset.query.get_or_404(dataset_id)
+    
+    # 检查权限
+    if dataset.user_id != current_user.id:
+        return jsonify({'error': '无权访问该数据集'}), 403
+    
+    data = request.get_json() or {}
+    config = data.get('config') or {}
+    name = data.get('name', 'cluster chart')
+    
+    image_path = None
+    if os.path.exists(dataset.file_path):
+        key = render_cache.render_key(file_key(dataset.file_path), 'cluster', config)
+        image_path = render_cache.cached_image_path(image_directory(), 'cluster', key)
+    
+    if image_path is not None and render_cache.lookup(image_path):
+        result = {'success': True, 'image_path': image_path}
+    else:
+        result = render_pool.render_clusters(current_app._get_current_object(), dataset.file_path,
+                                             dataset.file_type, config, image_path=image_path)
+        if result['success']:
+            prune_render_cache(current_app, [result['image_path']])
+    
+    if result['success']:
+        visualization = add_visualization(dataset_id, name, 'cluster', config, result['image_path'])
+        db.session.commit()
+        
+        return jsonify({
+            'message': '可视化创建成功',
+            'visualization_id': visualization.id,
+            **image_urls(visualization)
+        })
+    
+    return jsonify({'error': result['error']}), 400
+
 @analysis_bp.route('/perform_classification', methods=['POST'])
 @login_required
+@scheduled(BATCH, allows_async=True)
 def api_perform_classification():
-    """API端点：执行分类分析"""
+    """API端点：执行分类分析（请求中指定async时提交为后台任务，立即返回任务ID）"""
     data = request.get_json()
     dataset_id = data.get('dataset_id')
     algorithm_config = data.get('algorithm_config', {})
@@ -266,82 +510,34 @@ def api_perform_classification():
     if dataset.user_id != current_user.id:
         return jsonify({'success': False, 'error': '无权访问该数据集'}), 403
     
+    # 参数验证
+    if not feature_columns:
+        return jsonify({'success': False, 'error': '请选择至少一个特征列'}), 400
+    
+    if not target_column:
+        return jsonify({'success': False, 'error': '请选择目标列'}), 400
+    
+    task_args = {
+        'file_path': dataset.file_path,
+        'file_type': dataset.file_type,
+        'feature_columns': feature_columns,
+        'target_column': target_column,
+        'test_size': test_size,
+        'algorithm_config': algorithm_config,
+        'result_path': os.path.join(current_app.config['TEMP_FOLDER'], f'classification_{dataset_id}_{current_user.id}.joblib')
+    }
+    
+    if job_queue.wants_async(data):
+        job = job_queue.submit(current_app._get_current_object(), 'classification', current_user.id,
+                               run_classification, task_args,
+                               params={'dataset_id': dataset_id, 'algorithm_config': algorithm_config})
+        return jsonify(job_queue.accepted_response(job)), 202
+    
     try:
-        # 参数验证
-        if not feature_columns:
-            return jsonify({'success': False, 'error': '请选择至少一个特征列'}), 400
-        
-        if not target_column:
-            return jsonify({'success': False, 'error': '请选择目标列'}), 400
-        
-        # 加载数据
-        df = pd.read_csv(dataset.file_path)
-        
-        # 提取特征和目标变量
-        features_df = df[feature_columns].copy()
-        
-        # 检查并进行特征预处理
-        categorical_columns = []
-        for column in features_df.columns:
-            if features_df[column].dtype == 'object' or pd.api.types.is_categorical_dtype(features_df[column]):
-                categorical_columns.append(column)
-        
-        # 通过pandas的get_dummies进行分类特征编码
-        if categorical_columns:
-            # 仅对分类特征进行独热编码，保留数值特征
-            # 创建一个临时数据框，避免警告
-            encoded_features = pd.get_dummies(features_df, columns=categorical_columns, drop_first=True)
-            features_df = encoded_features
-        
-        # 处理完成后进行特征选择，删除掉有缺失值的行
-        features_df_clean = features_df.dropna()
-        y = df[target_column].loc[features_df_clean.index]
-        
-        # 检查数据是否足够
-        if len(features_df_clean) < 10:
-            return jsonify({'success': False, 'error': '清理缺失值后的有效数据不足，请选择其他特征'}), 400
-        
-        # 划分训练集和测试集
-        X_train, X_test, y_train, y_test = train_test_split(
-            features_df_clean, y, test_size=test_size, random_state=42
-        )
-        
-        # 执行分类
-        result = perform_classification(X_train, y_train, X_test, algorithm_config)
-        result['y_test'] = y_test.values  # 添加真实标签用于评估
-        
-        # 保存结果
-        tmp_file = os.path.join(current_app.config['TEMP_FOLDER'], f'classification_{dataset_id}_{current_user.id}.joblib')
-        joblib.dump(result, tmp_file)
-        
-        # 计算基本指标
-        from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
-        
-        try:
-            metrics = {
-                'accuracy': float(accuracy_score(y_test, result['predictions'])),
-                'samples': int(len(y_test))
-            }
-            
-            # 对于二分类问题，计算更多指标
-            if len(np.unique(y)) == 2:
-                metrics.update({
-                    'precision': float(precision_score(y_test, result['predictions'], average='binary')),
-                    'recall': float(recall_score(y_test, result['predictions'], average='binary')),
-                    'f1': float(f1_score(y_test, result['predictions'], average='binary'))
-                })
-                
-            # 如果有分类特征，添加一个提示信息
-            if categorical_columns:
-                metrics['categorical_features_processed'] = True
-                metrics['categorical_features'] = categorical_columns
-        except Exception as e:
-            metrics = {'error': str(e)}
-        
-        return jsonify({
-            'success': True,
-            'metrics': metrics
-        })
+        response = run_classification(**task_args)
+        if not response['success']:
+            return jsonify(response), 400
+        return jsonify(response)
     
     except Exception as e:
         current_app.logger.error(f"分类分析错误: {str(e)}")
@@ -349,8 +545,9 @@ def api_perform_classification():
 
 @analysis_bp.route('/perform_dimensionality_reduction', methods=['POST'])
 @login_required
+@scheduled(BATCH, allows_async=True)
 def api_perform_dimensionality_reduction():
-    """API端点：执行降维分析"""
+    """API端点：执行降维分析（请求中指定async时提交为后台任务，立即返回任务ID）"""
     data = request.get_json()
     dataset_id = data.get('dataset_id')
     algorithm_config = data.get('algorithm_config', {})
@@ -362,82 +559,62 @@ def api_perform_dimensionality_reduction():
     if dataset.user_id != current_user.id:
         return jsonify({'success': False, 'error': '无权访问该数据集'}), 403
     
+    # 参数验证
+    if not feature_columns:
+        return jsonify({'success': False, 'error': '请选择至少一个特征列'}), 400
+    
+    task_args = {
+        'file_path': dataset.file_path,
+        'file_type': dataset.file_type,
+        'feature_columns': feature_columns,
+        'algorithm_config': algorithm_config,
+        'result_path': os.path.join(current_app.config['TEMP_FOLDER'], f'reduction_{dataset_id}_{current_user.id}.joblib')
+    }
+    
+    if job_queue.wants_async(data):
+        job = job_queue.submit(current_app._get_current_object(), 'dimensionality_reduction', current_user.id,
+                               run_dimensionality_reduction, task_args,
+                               params={'dataset_id': dataset_id, 'algorithm_config': algorithm_config})
+        return jsonify(job_queue.accepted_response(job)), 202
+    
     try:
-        # 参数验证
-        if not feature_columns:
-            return jsonify({'success': False, 'error': '请选择至少一个特征列'}), 400
-        
-        # 加载数据
-        df = pd.read_csv(dataset.file_path)
-        
-        # 提取特征
-        features_df = df[feature_columns].dropna()
-        
-        # 检查并处理分类特征
-        categorical_columns = []
-        numerical_columns = []
-        
-        for column in features_df.columns:
-            if features_df[column].dtype == 'object' or pd.api.types.is_categorical_dtype(features_df[column]):
-                categorical_columns.append(column)
-            else:
-                numerical_columns.append(column)
-        
-        # 如果所有选择的特征都是分类型，返回错误
-        if len(numerical_columns) == 0:
-            return jsonify({
-                'success': False, 
-                'error': '请至少选择一个数值型特征进行降维分析'
-            }), 400
-        
-        # 如果存在分类特征，发送警告信息
-        warning_message = None
-        if categorical_columns:
-            warning_message = f'已忽略以下分类特征: {", ".join(categorical_columns)}。降维分析仅使用数值特征。'
-            # 只使用数值特征
-            features_df = features_df[numerical_columns]
-        
-        # 执行降维
-        result = perform_dimensionality_reduction(features_df, algorithm_config)
-        
-        # 保存结果
-        tmp_file = os.path.join(current_app.config['TEMP_FOLDER'], f'reduction_{dataset_id}_{current_user.id}.joblib')
-        joblib.dump(result, tmp_file)
-        
-        # 为了前端可视化，返回降维后的前两个维度数据
-        if isinstance(result.get('transformed_data'), np.ndarray):
-            # 仅返回前1000个点以避免数据过大
-            data_sample = result['transformed_data'][:1000]
-            if data_sample.shape[1] >= 2:
-                data_2d = data_sample[:, :2].tolist()
-            else:
-                data_2d = data_sample.tolist()
-            
-            response = {
-                'success': True,
-                'data_2d': data_2d,
-                'total_samples': int(len(result['transformed_data'])),
-                'returned_samples': int(len(data_2d)),
-                'explained_variance': result.get('explained_variance', None),
-                'warning': warning_message
-            }
-        else:
-            response = {
-                'success': True,
-                'message': '降维完成，但无法提取可视化数据',
-                'warning': warning_message
-            }
-        
+        response = run_dimensionality_reduction(**task_args)
+        if not response['success']:
+            return jsonify(response), 400
         return jsonify(response)
     
     except Exception as e:
         current_app.logger.error(f"降维分析错误: {str(e)}")
         return jsonify({'success': False, 'error': f'降维分析失败: {str(e)}'}), 500
 
+def save_price_model(dataset_id, model_name, model_path, preprocessor_path, result):
+    """训练完成后保存模型信息到数据库，返回接口的响应内容"""
+    prediction = Prediction(
+        name=model_name,
+        algorithm='xgboost',  # 固定使用XGBoost算法
+        features=json.dumps(result['feature_names']),
+        target='SalePrice',  # 固定目标变量
+        metrics=json.dumps(result['metrics']),
+        model_path=model_path,
+        dataset_id=dataset_id,
+        preprocessor_path=preprocessor_path  # 新增字段，存储预处理器路径
+    )
+    
+    db.session.add(prediction)
+    db.session.commit()
+    
+    return {
+        'success': True,
+        'message': '房价预测模型训练成功',
+        'prediction_id': prediction.id,
+        'metrics': result['metrics']
+    }
+
 @analysis_bp.route('/train_price_model', methods=['POST'])
 @login_required
+@scheduled(BATCH, allows_async=True)
 def train_price_model():
-    """训练房价预测模型的API端点"""
+    """训练房价预测模型的API端点（请求中指定async时提交为后台任务，立即返回任务ID）"""
     try:
         data = request.get_json()
         dataset_id = data.get('dataset_id')
@@ -457,51 +634,27 @@ def train_price_model():
         model_path = os.path.join(current_app.config['TEMP_FOLDER'], model_filename)
         preprocessor_path = os.path.join(current_app.config['TEMP_FOLDER'], preprocessor_filename)
         
-        # 确保临时目录存在
-        os.makedirs(current_app.config['TEMP_FOLDER'], exist_ok=True)
-        
-        # 执行完整训练流程
-        model, preprocessor_objects = full_training_pipeline(
-            train_file_path=dataset.file_path,
-            model_save_path=model_path,
-            preprocessor_save_path=preprocessor_path
-        )
-        
-        # 加载数据用于评估
-        df = load_data(dataset.file_path)
-        
-        # 提取特征和标签
-        features, target, _, _ = preprocess_data(df, training=True)
+        task_args = {
+            'file_path': dataset.file_path,
+            'file_type': dataset.file_type,
+            'model_path': model_path,
+            'preprocessor_path': preprocessor_path
+        }
         
-        # 划分训练集和测试集
-        X_train, X_test, y_train, y_test = train_test_split(
-            features, target, test_size=0.2, random_state=42
-        )
+        if job_queue.wants_async(data):
+            # 模型记录在任务完成后由服务进程写入数据库
+            job = job_queue.submit(
+                current_app._get_current_object(), 'train_price_model', current_user.id, run_price_training,
+                task_args, params={'dataset_id': dataset_id, 'model_name': model_name},
+                on_success=lambda result: save_price_model(dataset_id, model_name, model_path,
+                                                           preprocessor_path, result))
+            return jsonify(job_queue.accepted_response(job)), 202
         
-        # 评估模型
-        metrics = evaluate_house_price_model(model, X_test, y_test)
+        # 执行完整训练流程并评估模型
+        result = run_price_training(**task_args)
         
         # 保存模型信息到数据库
-        prediction = Prediction(
-            name=model_name,
-            algorithm='xgboost',  # 固定使用XGBoost算法
-            features=json.dumps(preprocessor_objects.get('feature_names', [])),
-            target='SalePrice',  # 固定目标变量
-            metrics=json.dumps(metrics),
-            model_path=model_path,
-            dataset_id=dataset_id,
-            preprocessor_path=preprocessor_path  # 新增字段，存储预处理器路径
-        )
-        
-        db.session.add(prediction)
-        db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'message': '房价预测模型训练成功',
-            'prediction_id': prediction.id,
-            'metrics': metrics
-        })
+        return jsonify(save_price_model(dataset_id, model_name, model_path, preprocessor_path, result))
         
     except Exception as e:
         current_app.logger.error(f"训练房价预测模型出错: {str(e)}")
@@ -512,6 +665,7 @@ def train_price_model():
 
 @analysis_bp.route('/predict_house_price', methods=['POST'])
 @login_required
+@scheduled(INTERACTIVE)
 def predict_house_price():
     """使用训练好的模型预测房价"""
     try:
@@ -525,8 +679,8 @@ def predict_house_price():
         if file.filename == '':
             return jsonify({'success': False, 'error': '没有选择文件'}), 400
         
-        # 检查是否为CSV文件
-        if not file.filename.endswith('.csv'):
+        # 检查是否为CSV文件（支持gz/bz2/zst压缩）
+        if split_file_extension(file.filename)[0] != 'csv':
             return jsonify({'success': False, 'error': '只支持CSV文件'}), 400
         
         # 获取预测模型ID
@@ -549,11 +703,11 @@ def predict_house_price():
         temp_folder = current_app.config['TEMP_FOLDER']
         os.makedirs(temp_folder, exist_ok=True)
         
-        test_file_path = os.path.join(temp_folder, f'test_file_{current_user.id}_{int(time.time())}.csv')
+        test_file_path = os.path.join(temp_folder, f'test_file_{current_user.id}_{int(time.time())}.{file_extension(file.filename)}')
         file.save(test_file_path)
         
         # 加载测试数据集
-        test_data = load_data(test_file_path)
+        test_data = load_data(test_file_path, use_cache=False)
         
         # 进行预测
         predictions, id_column = app.services.predict_methods.predict(
@@ -600,280 +754,3 @@ def predict_house_price():
             'success': False, 
             'error': f'预测失败: {str(e)}'
         }), 500
-
-def perform_clustering(data, algorithm_config):
-    """
-    执行聚类分析
-    
-    参数:
-        data: pandas.DataFrame 或 numpy.ndarray
-        algorithm_config: 字典，包含算法类型和参数
-    
-    返回:
-        包含聚类结果的字典
-    """
-    algorithm = algorithm_config.get('algorithm', 'kmeans').lower()
-    params = algorithm_config.get('params', {})
-    
-    # 确保数据是numpy数组
-    if isinstance(data, pd.DataFrame):
-        features = data.values
-    else:
-        features = data
-    
-    result = {'algorithm': algorithm}
-    
-    if algorithm == 'kmeans':
-        # 设置默认参数，并覆盖用户提供的参数
-        n_clusters = params.get('n_clusters', 3)
-        init = params.get('init', 'k-means++')
-        n_init = params.get('n_init', 10)
-        max_iter = params.get('max_iter', 300)
-        random_state = params.get('random_state', 42)
-        
-        # 执行K-means聚类
-        kmeans = KMeans(
-            n_clusters=n_clusters,
-            init=init,
-            n_init=n_init,
-            max_iter=max_iter,
-            random_state=random_state
-        )
-        
-        labels = kmeans.fit_predict(features)
-        
-        # 保存结果
-        result.update({
-            'labels': labels,
-            'model': kmeans,
-            'inertia': kmeans.inertia_,
-            'centers': kmeans.cluster_centers_
-        })
-    
-    elif algorithm == 'dbscan':
-        # 设置默认参数
-        eps = params.get('eps', 0.5)
-        min_samples = params.get('min_samples', 5)
-        
-        # 执行DBSCAN聚类
-        dbscan = DBSCAN(
-            eps=eps,
-            min_samples=min_samples
-        )
-        
-        labels = dbscan.fit_predict(features)
-        
-        # 保存结果
-        result.update({
-            'labels': labels,
-            'model': dbscan,
-            'n_clusters': len(set(labels)) - (1 if -1 in labels else 0)  # 不包括噪声点
-        })
-    
-    elif algorithm == 'hierarchical':
-        # 设置默认参数
-        n_clusters = params.get('n_clusters', 3)
-        linkage = params.get('linkage', 'ward')
-        
-        # 执行层次聚类
-        hc = AgglomerativeClustering(
-            n_clusters=n_clusters,
-            linkage=linkage
-        )
-        
-        labels = hc.fit_predict(features)
-        
-        # 保存结果
-        result.update({
-            'labels': labels,
-            'model': hc,
-            'n_clusters': n_clusters
-        })
-    
-    else:
-        raise ValueError(f"不支持的聚类算法: {algorithm}")
-    
-    return result
-
-def perform_classification(X_train, y_train, X_test, algorithm_config):
-    """
-    执行分类分析
-    
-    参数:
-        X_train: 训练集特征
-        y_train: 训练集标签
-        X_test: 测试集特征
-        algorithm_config: 字典，包含算法类型和参数
-    
-    返回:
-        包含分类结果的字典
-    """
-    algorithm = algorithm_config.get('algorithm', 'logistic_regression').lower()
-    params = algorithm_config.get('params', {})
-    
-    # 确保数据是numpy数组
-    if isinstance(X_train, pd.DataFrame):
-        X_train = X_train.values
-    if isinstance(y_train, pd.Series):
-        y_train = y_train.values
-    if isinstance(X_test, pd.DataFrame):
-        X_test = X_test.values
-    
-    result = {'algorithm': algorithm}
-    
-    if algorithm == 'logistic_regression':
-        # 设置默认参数
-        penalty = params.get('penalty', 'l2')
-        C = params.get('C', 1.0)
-        solver = params.get('solver', 'liblinear')
-        max_iter = params.get('max_iter', 100)
-        random_state = params.get('random_state', 42)
-        
-        # 执行逻辑回归
-        clf = LogisticRegression(
-            penalty=penalty,
-            C=C,
-            solver=solver,
-            max_iter=max_iter,
-            random_state=random_state
-        )
-        
-        clf.fit(X_train, y_train)
-        predictions = clf.predict(X_test)
-        
-        # 保存结果
-        result.update({
-            'model': clf,
-            'predictions': predictions,
-            'probabilities': clf.predict_proba(X_test) if hasattr(clf, 'predict_proba') else None
-        })
-    
-    elif algorithm == 'random_forest':
-        # 设置默认参数
-        n_estimators = params.get('n_estimators', 100)
-        max_depth = params.get('max_depth', None)
-        min_samples_split = params.get('min_samples_split', 2)
-        random_state = params.get('random_state', 42)
-        
-        # 执行随机森林分类
-        clf = RandomForestClassifier(
-            n_estimators=n_estimators,
-            max_depth=max_depth,
-            min_samples_split=min_samples_split,
-            random_state=random_state
-        )
-        
-        clf.fit(X_train, y_train)
-        predictions = clf.predict(X_test)
-        
-        # 保存结果
-        result.update({
-            'model': clf,
-            'predictions': predictions,
-            'feature_importances': clf.feature_importances_,
-            'probabilities': clf.predict_proba(X_test) if hasattr(clf, 'predict_proba') else None
-        })
-    
-    elif algorithm == 'svm':
-        # 设置默认参数
-        C = params.get('C', 1.0)
-        kernel = params.get('kernel', 'rbf')
-        gamma = params.get('gamma', 'scale')
-        
-        # 执行SVM分类
-        clf = SVC(
-            C=C,
-            kernel=kernel,
-            gamma=gamma,
-            probability=True
-        )
-        
-        clf.fit(X_train, y_train)
-        predictions = clf.predict(X_test)
-        
-        # 保存结果
-        result.update({
-            'model': clf,
-            'predictions': predictions,
-            'probabilities': clf.predict_proba(X_test) if hasattr(clf, 'predict_proba') else None
-        })
-    
-    else:
-        raise ValueError(f"不支持的分类算法: {algorithm}")
-    
-    return result
-
-def perform_dimensionality_reduction(data, algorithm_config):
-    """
-    执行降维分析
-    
-    参数:
-        data: pandas.DataFrame 或 numpy.ndarray
-        algorithm_config: 字典，包含算法类型和参数
-    
-    返回:
-        包含降维结果的字典
-    """
-    algorithm = algorithm_config.get('algorithm', 'pca').lower()
-    params = algorithm_config.get('params', {})
-    
-    # 确保数据是numpy数组
-    if isinstance(data, pd.DataFrame):
-        features = data.values
-    else:
-        features = data
-    
-    result = {'algorithm': algorithm}
-    
-    if algorithm == 'pca':
-        # 设置默认参数
-        n_components = params.get('n_components', 2)
-        svd_solver = params.get('svd_solver', 'auto')
-        random_state = params.get('random_state', 42)
-        
-        # 执行PCA降维
-        pca = PCA(
-            n_components=n_components,
-            svd_solver=svd_solver,
-            random_state=random_state
-        )
-        
-        transformed_data = pca.fit_transform(features)
-        
-        # 保存结果
-        result.update({
-            'model': pca,
-            'transformed_data': transformed_data,
-            'components': pca.components_,
-            'explained_variance': pca.explained_variance_ratio_.tolist() if hasattr(pca, 'explained_variance_ratio_') else None
-        })
-    
-    elif algorithm == 'tsne':
-        # 设置默认参数
-        n_components = params.get('n_components', 2)
-        perplexity = params.get('perplexity', 30.0)
-        learning_rate = params.get('learning_rate', 'auto')
-        n_iter = params.get('n_iter', 1000)
-        random_state = params.get('random_state', 42)
-        
-        # 执行t-SNE降维
-        tsne = TSNE(
-            n_components=n_components,
-            perplexity=perplexity,
-            learning_rate=learning_rate,
-            n_iter=n_iter,
-            random_state=random_state
-        )
-        
-        transformed_data = tsne.fit_transform(features)
-        
-        # 保存结果
-        result.update({
-            'model': tsne,
-            'transformed_data': transformed_data
-        })
-    
-    else:
-        raise ValueError(f"不支持的降维算法: {algorithm}")
-    
-    return result 
\ No newline at end of file
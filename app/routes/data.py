@@ -1,18 +1,24 @@
-from flask import request, jsonify, current_app, session
+from flask import request, jsonify, current_app, session, Response, stream_with_context
 from flask_login import login_required, current_user
 import os
-import pandas as pd
 import json
 from werkzeug.utils import secure_filename
 from app import db
-from app.models.dataset import Dataset
+from app.models.dataset import Dataset, DatasetVersion
 from app.routes import data_bp
-from app.services.data_cleaner import preview_data, clean_data
+from app.services.data_cleaner import (preview_data, read_preview, read_head, clean_data, read_file,
+                                       auto_suggest_cleaning)
+from app.services.row_query import query_rows
+from app.services.data_export import EXPORT_FORMATS, stream_export
+from app.services import columnar_cache, snapshot_cache, sketches, correlation, job_queue
+from app.services.scheduler import scheduled, INTERACTIVE, BATCH
+from app.services.blob_store import save_blob, commit_blob
+from app.services.chunked_upload import (UploadError, init_upload, upload_status, append_chunk,
+                                         complete_upload, abort_upload)
 import numpy as np
-
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
+import uuid
+from datetime import datetime
+from app.utils.helpers import allowed_file, split_file_extension, file_extension
 
 @data_bp.route('/upload', methods=['POST', 'OPTIONS'])
 def upload_data_route():
@@ -29,14 +35,7 @@ def upload_data_route():
     print("文件:", request.files)
     
     # 获取用户ID（使用多种方法尝试）
-    user_id = None
-    if current_user.is_authenticated:
-        user_id = current_user.id
-    elif 'user_id' in session:
-        user_id = session['user_id']
-    else:
-        # 使用请求中的用户ID或默认ID
-        user_id = request.form.get('user_id') or 1
+    user_id = get_upload_user_id(request.form)
     
     print(f"使用用户ID: {user_id}")
     
@@ -54,24 +53,51 @@ def upload_data_route():
     if not allowed_file(file.filename):
         return jsonify({'error': '不支持的文件类型'}), 400
     
-    # 保存文件
+    # 保存文件：边写入边计算内容哈希，相同内容的文件只保存一份
+    # 压缩的CSV文件原样保存，读取时流式解压
     filename = secure_filename(file.filename)
-    file_type = filename.rsplit('.', 1)[1].lower()
-    
-    # 创建用户目录
-    user_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], str(user_id))
-    if not os.path.exists(user_folder):
-        os.makedirs(user_folder)
-    
-    # 生成唯一文件名
-    import uuid
-    unique_filename = f"{uuid.uuid4().hex}_{filename}"
-    file_path = os.path.join(user_folder, unique_filename)
-    file.save(file_path)
+    file_type, _ = split_file_extension(filename)
+    file_path, content_hash, is_new_file = save_blob(file.stream, current_app.config['BLOB_FOLDER'],
+                                                     file_extension(filename))
     
+    return register_upload(file_path, file_type, content_hash, is_new_file, filename, description, user_id)
+
+def get_upload_user_id(params):
+    """获取上传文件的用户ID（使用多种方法尝试）"""
+    if current_user.is_authenticated:
+        return current_user.id
+    elif 'user_id' in session:
+        return session['user_id']
+    # 使用请求中的用户ID或默认ID
+    return params.get('user_id') or 1
+
+def register_upload(file_path, file_type, content_hash, is_new_file, filename, description, user_id,
+                    streamed_profile=None):
+    """为已保存的上传文件创建数据集记录
+
+    streamed_profile为分块上传时边接收边统计得到的(列信息, 行数, 分位数草图, 相关系数统计量)。
+    """
     try:
-        # 读取数据信息
-        preview_rows, total_rows, columns_info = preview_data(file_path, file_type)
+        # 相同内容的文件已经上传过时，直接复用已有的列信息，无需重新解析和统计
+        existing = None
+        if not is_new_file:
+            existing = Dataset.query.filter(Dataset.content_hash == content_hash,
+                                            Dataset.columns.isnot(None)).first()
+        
+        if existing is not None:
+            preview_rows = read_preview(file_path, file_type)
+            total_rows = existing.row_count
+            columns_info = json.loads(existing.columns)
+        elif streamed_profile is not None:
+            preview_rows = read_preview(file_path, file_type)
+            columns_info, total_rows, column_sketches, correlation_stats = streamed_profile
+            # 各数据块的草图和相关系数统计量在接收时已经累加，数据较大时直接保存
+            if total_rows >= sketches.SKETCH_MIN_ROWS:
+                sketches.save_sketches(file_path, column_sketches)
+                correlation.save_correlation_stats(file_path, correlation_stats)
+        else:
+            # 读取数据信息
+            preview_rows, total_rows, columns_info = preview_data(file_path, file_type)
         
         # 创建数据集记录
         dataset = Dataset(
@@ -79,6 +105,7 @@ def upload_data_route():
             description=description,
             file_path=file_path,
             file_type=file_type,
+            content_hash=content_hash,
             user_id=user_id, 
             row_count=total_rows,
             columns=json.dumps(columns_info)
@@ -95,12 +122,98 @@ def upload_data_route():
         })
         
     except Exception as e:
-        # 删除上传的文件
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        # 删除上传的文件及其列式缓存（复用的已有文件不删除）
+        if is_new_file:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            columnar_cache.remove_sidecar(file_path)
+            sketches.remove_sketches(file_path)
+            correlation.remove_correlation_stats(file_path)
         print(f"处理文件错误: {str(e)}")
         return jsonify({'error': f'处理文件时出错: {str(e)}'}), 500
 
+def upload_error_response(error):
+    """分块上传出错时的响应，附带服务器已接收的字节数便于客户端续传"""
+    body = {'success': False, 'error': str(error)}
+    if error.offset is not None:
+        body['offset'] = error.offset
+    return jsonify(body), error.status_code
+
+@data_bp.route('/upload/init', methods=['POST'])
+def init_chunked_upload():
+    """创建分块上传任务
+
+    请求体: filename, size(文件总字节数，可选), description
+    返回upload_id和建议的分块大小，之后用PUT /upload/<upload_id>?offset=N 依次上传数据块，
+    最后调用 POST /upload/<upload_id>/complete 完成上传。
+    """
+    data = request.get_json() or {}
+    filename = secure_filename(data.get('filename', ''))
+    
+    if not filename:
+        return jsonify({'success': False, 'error': '没有提供文件名'}), 400
+    if not allowed_file(filename):
+        return jsonify({'success': False, 'error': '不支持的文件类型'}), 400
+    
+    file_type, compression = split_file_extension(filename)
+    try:
+        status = init_upload(
+            current_app.config['CHUNKED_UPLOAD_FOLDER'],
+            filename,
+            file_type,
+            get_upload_user_id(data),
+            description=data.get('description', ''),
+            total_size=data.get('size'),
+            max_size=current_app.config['MAX_UPLOAD_SIZE'],
+            compression=compression,
+            expire_seconds=current_app.config['CHUNKED_UPLOAD_EXPIRE_SECONDS']
+        )
+    except UploadError as e:
+        return upload_error_response(e)
+    
+    status['success'] = True
+    status['chunk_size'] = current_app.config['UPLOAD_CHUNK_SIZE']
+    return jsonify(status)
+
+@data_bp.route('/upload/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+def chunked_upload(upload_id):
+    """GET: 查询已接收的字节数（断线续传）；PUT: 上传一个数据块；DELETE: 取消上传"""
+    upload_dir = current_app.config['CHUNKED_UPLOAD_FOLDER']
+    try:
+        if request.method == 'GET':
+            status = upload_status(upload_dir, upload_id)
+        elif request.method == 'DELETE':
+            abort_upload(upload_dir, upload_id)
+            return jsonify({'success': True, 'message': '上传已取消'})
+        else:
+            offset = request.args.get('offset', type=int)
+            if offset is None:
+                return jsonify({'success': False, 'error': '缺少参数: offset'}), 400
+            status = append_chunk(upload_dir, upload_id, offset, request.stream,
+                                  max_size=current_app.config['MAX_UPLOAD_SIZE'])
+    except UploadError as e:
+        return upload_error_response(e)
+    
+    status['success'] = True
+    return jsonify(status)
+
+@data_bp.route('/upload/<upload_id>/complete', methods=['POST'])
+def complete_chunked_upload(upload_id):
+    """完成分块上传：文件按内容哈希保存，并创建数据集记录"""
+    try:
+        part_path, meta, content_hash, streamed_profile = complete_upload(
+            current_app.config['CHUNKED_UPLOAD_FOLDER'], upload_id)
+    except UploadError as e:
+        return upload_error_response(e)
+    
+    file_type = meta['file_type']
+    file_path, content_hash, is_new_file = commit_blob(
+        part_path, current_app.config['BLOB_FOLDER'], content_hash, file_extension(meta['filename']))
+    
+    return register_upload(file_path, file_type, content_hash, is_new_file,
+                           meta['filename'], meta['description'], meta['user_id'],
+                           streamed_profile=streamed_profile)
+
 @data_bp.route('/preview', methods=['GET'])
 def preview_data_route():
     # 简化实现，不调用实际函数
@@ -141,6 +254,7 @@ def get_datasets():
 
 @data_bp.route('/datasets/<int:dataset_id>', methods=['GET'])
 @login_required
+@scheduled(INTERACTIVE)
 def get_dataset(dataset_id):
     dataset = Dataset.query.get_or_404(dataset_id)
     
@@ -148,16 +262,211 @@ def get_dataset(dataset_id):
     if dataset.user_id != current_user.id:
         return jsonify({'error': '无权访问该数据集'}), 403
     
-    # 读取数据预览
-    preview, _, _ = preview_data(dataset.file_path, dataset.file_type)
+    # 读取数据预览（只读取前几行，列信息使用上传时生成的统计信息）
+    preview = read_preview(dataset.file_path, dataset.file_type)
 
     return jsonify({
         'dataset': dataset.to_dict(),
         'preview': preview
     })
 
+def ensure_base_version(dataset):
+    """第一次清洗前，将数据集当前的文件登记为版本1"""
+    if dataset.version:
+        return
+    
+    base = DatasetVersion(
+        dataset_id=dataset.id,
+        version=1,
+        file_path=dataset.file_path,
+        file_type=dataset.file_type,
+        content_hash=dataset.content_hash,
+        operations=json.dumps([]),
+        columns=dataset.columns,
+        row_count=dataset.row_count,
+        cache_key=dataset.content_hash or snapshot_cache.file_key(dataset.file_path)
+    )
+    db.session.add(base)
+    dataset.version = 1
+    db.session.commit()
+
+def current_version(dataset):
+    return dataset.versions.filter(DatasetVersion.version == dataset.version).first()
+
+def version_key(version):
+    """版本数据的键（早期创建的版本没有保存键时按文件计算）"""
+    return version.cache_key or snapshot_cache.file_key(version.file_path)
+
+def version_output_path(dataset):
+    """新版本文件的路径（不带扩展名，由清洗结果决定保存格式）
+
+    每次清洗都写入新文件，原有版本文件不会被修改，正在读取旧版本的请求不受影响。
+    """
+    version_folder = os.path.join(current_app.config['VERSION_FOLDER'], str(dataset.id))
+    if not os.path.exists(version_folder):
+        os.makedirs(version_folder)
+    return os.path.join(version_folder, uuid.uuid4().hex)
+
+def use_version(dataset, version):
+    """数据集指向指定的版本，只修改数据库记录，不复制文件"""
+    dataset.version = version.version
+    dataset.file_path = version.file_path
+    dataset.file_type = version.file_type
+    dataset.content_hash = version.content_hash
+    dataset.columns = version.columns
+    dataset.row_count = version.row_count
+    dataset.cleaned = version.parent_version is not None
+    version.last_used = datetime.utcnow()
+
+def prune_versions(dataset):
+    """版本文件超过MAX_VERSION_FILES时，删除最久未使用的版本文件
+
+    版本记录保留在操作历史中；原始文件（版本1）和当前版本不会被删除。
+    """
+    candidates = dataset.versions.filter(
+        DatasetVersion.version != 1,
+        DatasetVersion.version != dataset.version,
+        DatasetVersion.file_path.isnot(None)
+    ).order_by(DatasetVersion.last_used.desc()).all()
+    
+    for version in candidates[current_app.config['MAX_VERSION_FILES']:]:
+        try:
+            if os.path.exists(version.file_path):
+                os.remove(version.file_path)
+            columnar_cache.remove_sidecar(version.file_path)
+            sketches.remove_sketches(version.file_path)
+            correlation.remove_correlation_stats(version.file_path)
+        except OSError as e:
+            print(f"删除版本文件失败: {version.file_path}, {str(e)}")
+            continue
+        version.file_path = None
+
+def save_clean_version(dataset, operations, result, cache_key, parent_version=None):
+    """将清洗结果登记为parent_version（默认为当前版本）的子版本，并将数据集指向新版本"""
+    latest = db.session.query(db.func.max(DatasetVersion.version)).filter(
+        DatasetVersion.dataset_id == dataset.id).scalar() or 0
+    
+    # 确保列信息是JSON格式，与preview_data保持一致
+    columns = result.get('columns')
+    version = DatasetVersion(
+        dataset_id=dataset.id,
+        version=latest + 1,
+        parent_version=parent_version or dataset.version,
+        file_path=result['file_path'],
+        file_type=result['file_type'],
+        operations=json.dumps(operations),
+        columns=json.dumps(columns) if isinstance(columns, list) else dataset.columns,
+        row_count=result['cleaned_count'],
+        cache_key=cache_key
+    )
+    db.session.add(version)
+    use_version(dataset, version)
+    prune_versions(dataset)
+    db.session.commit()
+
+def reuse_clean_version(dataset, result_key):
+    """相同的清洗已经做过且版本文件还在时，直接切换到该版本并返回清洗结果，否则返回None"""
+    cached = dataset.versions.filter(DatasetVersion.cache_key == result_key,
+                                     DatasetVersion.file_path.isnot(None)).first()
+    if cached is None or not os.path.exists(cached.file_path):
+        return None
+    
+    original_count = dataset.row_count
+    original_columns = json.loads(dataset.columns) if dataset.columns else []
+    use_version(dataset, cached)
+    db.session.commit()
+    
+    columns = json.loads(cached.columns) if cached.columns else []
+    return {
+        'success': True,
+        'preview': read_preview(cached.file_path, cached.file_type),
+        'original_count': original_count,
+        'cleaned_count': cached.row_count,
+        'removed_count': original_count - cached.row_count,
+        'column_count': len(columns),
+        'added_column_count': len(columns) - len(original_columns),
+        'columns': columns
+    }
+
+def run_clean(dataset, operations):
+    """在数据集当前版本上执行清洗操作
+
+    以(当前版本, 操作序列)的哈希为键：相同的清洗已经做过且版本文件还在时，
+    直接切换到该版本，无需重新计算；否则从内存缓存（或版本文件）读取当前版本的数据，
+    只执行这次新增的操作。返回值格式与clean_data相同。
+    """
+    ensure_base_version(dataset)
+    source = current_version(dataset)
+    source_key = version_key(source)
+    result_key = snapshot_cache.operations_key(source_key, operations)
+    
+    cached = reuse_clean_version(dataset, result_key)
+    if cached is not None:
+        return cached
+    
+    profile = json.loads(dataset.columns) if dataset.columns else []
+    result = clean_data(dataset.file_path, dataset.file_type, operations, profile,
+                        version_output_path(dataset), source_key=source_key, result_key=result_key,
+                        cache_bytes=current_app.config['SNAPSHOT_CACHE_BYTES'])
+    
+    if result['success']:
+        # 清洗结果保存为新版本，数据集指向新版本
+        save_clean_version(dataset, operations, result, result_key)
+    return result
+
+def clean_response(dataset, result):
+    """清洗接口的响应内容"""
+    return {
+        'success': True,
+        'message': '数据清洗成功',
+        'preview': result['preview'],
+        'original_count': result['original_count'],
+        'cleaned_count': result['cleaned_count'],
+        'removed_count': result['removed_count'],
+        'column_count': result['column_count'],
+        'added_column_count': result['added_column_count'],
+        'columns': result.get('columns', []),
+        'version': dataset.version
+    }
+
+def finish_clean_job(dataset_id, parent_version, operations, result_key, result):
+    """后台清洗任务完成后登记新版本，返回与同步清洗相同的响应内容"""
+    if not result['success']:
+        return result
+    dataset = Dataset.query.get(dataset_id)
+    save_clean_version(dataset, operations, result, result_key, parent_version)
+    return clean_response(dataset, result)
+
+def submit_clean_job(dataset, operations):
+    """将清洗提交为后台任务，返回任务记录
+
+    清洗在工作进程中执行（不使用服务进程的内存缓存），完成后在服务进程中登记为
+    提交时所在版本的子版本。相同的清洗已经做过时直接记录为已完成的任务。
+    """
+    ensure_base_version(dataset)
+    source = current_version(dataset)
+    result_key = snapshot_cache.operations_key(version_key(source), operations)
+    params = {'dataset_id': dataset.id, 'operations': operations}
+    
+    cached = reuse_clean_version(dataset, result_key)
+    if cached is not None:
+        return job_queue.record('clean', current_user.id, clean_response(dataset, cached), params)
+    
+    dataset_id, parent_version = dataset.id, dataset.version
+    task_args = {
+        'file_path': dataset.file_path,
+        'file_type': dataset.file_type,
+        'operations': operations,
+        'profile': json.loads(dataset.columns) if dataset.columns else [],
+        'output_path': version_output_path(dataset)
+    }
+    return job_queue.submit(
+        current_app._get_current_object(), 'clean', current_user.id, clean_data, task_args, params,
+        on_success=lambda result: finish_clean_job(dataset_id, parent_version, operations, result_key, result))
+
 @data_bp.route('/datasets/<int:dataset_id>/clean', methods=['POST'])
 @login_required
+@scheduled(BATCH, allows_async=True)
 def clean_dataset(dataset_id):
     dataset = Dataset.query.get_or_404(dataset_id)
     
@@ -168,36 +477,22 @@ def clean_dataset(dataset_id):
     data = request.get_json()
     operations = data.get('operations', [])
     
-    # 执行清洗操作
-    result = clean_data(dataset.file_path, dataset.file_type, operations)
+    # 请求中指定async时提交为后台任务，立即返回任务ID
+    if job_queue.wants_async(data):
+        job = submit_clean_job(dataset, operations)
+        return jsonify(job_queue.accepted_response(job)), 202
+    
+    # 执行清洗操作（结果写为新版本，不修改原文件）
+    result = run_clean(dataset, operations)
     
     if result['success']:
-        # 更新数据集状态
-        dataset.cleaned = True
-        dataset.row_count = result['cleaned_count']
-        
-        # 确保列信息是JSON格式，与preview_data保持一致
-        if 'columns' in result and isinstance(result['columns'], list):
-            dataset.columns = json.dumps(result['columns'])
-        
-        db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'message': '数据清洗成功',
-            'preview': result['preview'],
-            'original_count': result['original_count'],
-            'cleaned_count': result['cleaned_count'],
-            'removed_count': result['removed_count'],
-            'column_count': result['column_count'],
-            'added_column_count': result['added_column_count'],
-            'columns': result.get('columns', [])
-        })
+        return jsonify(clean_response(dataset, result))
     
     return jsonify({'error': result['error']}), 400
 
 @data_bp.route('/datasets/<int:dataset_id>/clean-suggestions', methods=['GET'])
 @login_required
+@scheduled(INTERACTIVE)
 def get_clean_suggestions(dataset_id):
     dataset = Dataset.query.get_or_404(dataset_id)
     
@@ -218,6 +513,7 @@ def get_clean_suggestions(dataset_id):
 
 @data_bp.route('/datasets/<int:dataset_id>/apply-suggestion', methods=['POST'])
 @login_required
+@scheduled(BATCH, allows_async=True)
 def apply_clean_suggestion(dataset_id):
     dataset = Dataset.query.get_or_404(dataset_id)
     
@@ -231,37 +527,167 @@ def apply_clean_suggestion(dataset_id):
     # 将建议转换为操作
     operations = [suggestion]
     
-    # 执行清洗操作
-    result = clean_data(dataset.file_path, dataset.file_type, operations)
+    # 请求中指定async时提交为后台任务，立即返回任务ID
+    if job_queue.wants_async(data):
+        job = submit_clean_job(dataset, operations)
+        return jsonify(job_queue.accepted_response(job)), 202
+    
+    # 执行清洗操作（结果写为新版本，不修改原文件）
+    result = run_clean(dataset, operations)
     
     if result['success']:
-        # 更新数据集状态
-        dataset.cleaned = True
-        dataset.row_count = result['cleaned_count']
-        
-        # 确保列信息是JSON格式，与preview_data保持一致
-        if 'columns' in result and isinstance(result['columns'], list):
-            dataset.columns = json.dumps(result['columns'])
+        return jsonify(clean_response(dataset, result))
+    
+    return jsonify({'success': False, 'error': result['error']}), 400
+
+@data_bp.route('/datasets/<int:dataset_id>/versions', methods=['GET'])
+@login_required
+def get_dataset_versions(dataset_id):
+    """数据集的版本列表"""
+    dataset = Dataset.query.get_or_404(dataset_id)
+    
+    # 检查权限
+    if dataset.user_id != current_user.id:
+        return jsonify({'success': False, 'error': '无权访问该数据集'}), 403
+    
+    versions = dataset.versions.order_by(DatasetVersion.version).all()
+    return jsonify({
+        'success': True,
+        'current_version': dataset.version or 0,
+        'versions': [v.to_dict() for v in versions]
+    })
+
+@data_bp.route('/datasets/<int:dataset_id>/versions/<int:version>/restore', methods=['POST'])
+@login_required
+def restore_dataset_version(dataset_id, version):
+    """回滚到指定版本：只切换数据集指向的版本文件，不需要重新读写数据"""
+    dataset = Dataset.query.get_or_404(dataset_id)
+    
+    # 检查权限
+    if dataset.user_id != current_user.id:
+        return jsonify({'success': False, 'error': '无权访问该数据集'}), 403
+    
+    target = dataset.versions.filter(DatasetVersion.version == version).first()
+    if target is None:
+        return jsonify({'success': False, 'error': f'版本不存在: {version}'}), 404
+    
+    return switch_version(dataset, target, f'已回滚到版本 {version}')
+
+@data_bp.route('/datasets/<int:dataset_id>/undo', methods=['POST'])
+@login_required
+def undo_clean(dataset_id):
+    """撤销最近一次清洗：切换回当前版本的上一个版本"""
+    dataset = Dataset.query.get_or_404(dataset_id)
+    
+    # 检查权限
+    if dataset.user_id != current_user.id:
+        return jsonify({'success': False, 'error': '无权访问该数据集'}), 403
+    
+    version = current_version(dataset) if dataset.version else None
+    if version is None or version.parent_version is None:
+        return jsonify({'success': False, 'error': '没有可以撤销的清洗操作'}), 400
+    
+    parent = dataset.versions.filter(DatasetVersion.version == version.parent_version).first()
+    return switch_version(dataset, parent, '已撤销最近一次清洗')
+
+@data_bp.route('/datasets/<int:dataset_id>/history', methods=['GET'])
+@login_required
+def get_clean_history(dataset_id):
+    """当前版本的清洗操作历史（从原始文件到当前版本依次执行的操作）"""
+    dataset = Dataset.query.get_or_404(dataset_id)
+    
+    # 检查权限
+    if dataset.user_id != current_user.id:
+        return jsonify({'success': False, 'error': '无权访问该数据集'}), 403
+    
+    versions = {v.version: v for v in dataset.versions.all()}
+    steps = []
+    number = dataset.version
+    while number in versions:
+        steps.append(versions[number].to_dict())
+        number = versions[number].parent_version
+    steps.reverse()
+    
+    return jsonify({
+        'success': True,
+        'current_version': dataset.version or 0,
+        'steps': steps,
+        'operations': [op for step in steps for op in step['operations']]
+    })
+
+def switch_version(dataset, target, message):
+    """切换到指定版本，返回新的数据集信息和预览"""
+    if not target.file_path or not os.path.exists(target.file_path):
+        return jsonify({'success': False, 'error': '版本文件已被清理，无法切换到该版本'}), 410
+    
+    use_version(dataset, target)
+    db.session.commit()
+    
+    return jsonify({
+        'success': True,
+        'message': message,
+        'dataset': dataset.to_dict(),
+        'preview': read_preview(dataset.file_path, dataset.file_type)
+    })
+
+@data_bp.route('/datasets/<int:dataset_id>/rows', methods=['GET', 'POST'])
+@login_required
+@scheduled(INTERACTIVE)
+def query_dataset_rows(dataset_id):
+    """分页查询数据行，支持列选择、过滤和排序
+
+    GET参数: offset, limit, columns(逗号分隔), sort, order(asc/desc), filters(JSON字符串)
+    POST请求体: 同名字段，columns和filters直接使用列表
+    """
+    dataset = Dataset.query.get_or_404(dataset_id)
+    
+    # 检查权限
+    if dataset.user_id != current_user.id:
+        return jsonify({'success': False, 'error': '无权访问该数据集'}), 403
+    
+    try:
+        if request.method == 'POST':
+            params = request.get_json() or {}
+            columns = params.get('columns')
+            filters = params.get('filters', [])
+        else:
+            params = request.args
+            columns = params.get('columns')
+            columns = columns.split(',') if columns else None
+            filters = json.loads(params.get('filters', '[]'))
         
-        db.session.commit()
+        all_columns = [col['name'] for col in json.loads(dataset.columns)] if dataset.columns else None
+        if not all_columns:
+            all_columns = list(read_head(dataset.file_path, dataset.file_type, 0).columns)
         
-        return jsonify({
-            'success': True,
-            'message': '数据清洗成功',
-            'preview': result['preview'],
-            'original_count': result['original_count'],
-            'cleaned_count': result['cleaned_count'],
-            'removed_count': result['removed_count'],
-            'column_count': result['column_count'],
-            'added_column_count': result['added_column_count'],
-            'columns': result.get('columns', [])
-        })
+        result = query_rows(
+            dataset.file_path,
+            dataset.file_type,
+            all_columns,
+            columns=columns,
+            filters=filters,
+            sort=params.get('sort'),
+            descending=params.get('order', 'asc') == 'desc',
+            offset=params.get('offset', 0),
+            limit=params.get('limit', 100)
+        )
+        result['success'] = True
+        return jsonify(result)
     
-    return jsonify({'success': False, 'error': result['error']}), 400
+    except (ValueError, TypeError) as e:
+        return jsonify({'success': False, 'error': f'查询参数错误: {str(e)}'}), 400
+    except Exception as e:
+        print(f"查询数据行时出错: {str(e)}")
+        return jsonify({'success': False, 'error': f'查询数据失败: {str(e)}'}), 500
 
 @data_bp.route('/datasets/<int:dataset_id>/full', methods=['GET'])
 @login_required
 def get_full_dataset(dataset_id):
+    """返回完整数据
+
+    默认返回JSON；请求头Accept（或format参数）为NDJSON、CSV或Arrow IPC时，
+    按块流式返回数据，服务器不会在内存中保存全部记录。
+    """
     try:
         # 从数据库中获取数据集信息
         dataset = Dataset.query.get_or_404(dataset_id)
@@ -277,15 +703,26 @@ def get_full_dataset(dataset_id):
         # 根据文件类型读取文件
         file_type = dataset.file_type.lower()
         
+        # 流式导出
+        export_format = request.args.get('format')
+        if export_format:
+            mimetype = EXPORT_FORMATS.get(export_format)
+            if mimetype is None:
+                return jsonify({'success': False, 'error': f'不支持的导出格式: {export_format}'}), 400
+        else:
+            mimetype = request.accept_mimetypes.best_match(['application/json'] + list(EXPORT_FORMATS.values()))
+        
+        if mimetype in EXPORT_FORMATS.values():
+            generator = stream_export(dataset.file_path, file_type, mimetype)
+            return Response(stream_with_context(generator), mimetype=mimetype,
+                            headers={'X-Total-Rows': str(dataset.row_count)})
+        
         print(f"准备读取文件: {dataset.file_path}, 类型: {file_type}")
         
-        # 读取整个文件
-        if file_type == 'csv':
-            df = pd.read_csv(dataset.file_path)
-        elif file_type in ['xlsx', 'xls']:
-            df = pd.read_excel(dataset.file_path)
-        else:
+        # 读取整个文件（优先使用列式缓存）
+        if file_type not in ['csv', 'xlsx', 'xls', 'parquet']:
             return jsonify({'success': False, 'error': f'不支持的文件类型: {file_type}'}), 400
+        df = read_file(dataset.file_path, file_type)
         
         # 将NaN值替换为None，这样在JSON序列化时会变成null
         df = df.replace({np.nan: None})
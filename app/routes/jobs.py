@@ -0,0 +1,62 @@
+from flask import jsonify, current_app
+from flask_login import login_required, current_user
+import json
+from app.models.job import Job
+from app.routes import jobs_bp
+from app.services import job_queue
+
+def get_user_job(job_id):
+    """查询当前用户的任务，不存在或无权访问时返回(None, 错误响应)"""
+    job = Job.query.get(job_id)
+    if job is None:
+        return None, (jsonify({'error': '任务不存在'}), 404)
+    if job.user_id != current_user.id:
+        return None, (jsonify({'error': '无权访问该任务'}), 403)
+    return job, None
+
+@jobs_bp.route('', methods=['GET'])
+@login_required
+def list_jobs():
+    """当前用户最近的后台任务"""
+    jobs = Job.query.filter_by(user_id=current_user.id).order_by(Job.created_at.desc()).limit(50).all()
+    return jsonify({'jobs': [job_queue.job_status(current_app, job) for job in jobs]})
+
+@jobs_bp.route('/<job_id>', methods=['GET'])
+@login_required
+def get_job(job_id):
+    """查询任务状态和进度"""
+    job, error = get_user_job(job_id)
+    if error:
+        return error
+    return jsonify({'job': job_queue.job_status(current_app, job)})
+
+@jobs_bp.route('/<job_id>/result', methods=['GET'])
+@login_required
+def get_job_result(job_id):
+    """获取任务结果：成功时返回与同步调用相同的响应，未结束时返回202"""
+    job, error = get_user_job(job_id)
+    if error:
+        return error
+    
+    if job.status == job_queue.SUCCEEDED:
+        return jsonify(json.loads(job.result))
+    if job.status == job_queue.FAILED:
+        return jsonify({'success': False, 'error': job.error}), 400
+    if job.status == job_queue.CANCELLED:
+        return jsonify({'success': False, 'error': '任务已取消'}), 410
+    return jsonify({'success': False, 'job': job_queue.job_status(current_app, job)}), 202
+
+@jobs_bp.route('/<job_id>/cancel', methods=['POST'])
+@login_required
+def cancel_job(job_id):
+    """取消排队中或正在执行的任务"""
+    job, error = get_user_job(job_id)
+    if error:
+        return error
+    
+    if not job_queue.cancel(current_app, job):
+        return jsonify({'error': '任务已结束，无法取消'}), 409
+    
+    # 取消排队中的任务时记录已在回调中更新，重新查询
+    job = Job.query.get(job_id)
+    return jsonify({'success': True, 'job': job_queue.job_status(current_app, job)})
@@ -0,0 +1,564 @@
+import os
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans, DBSCAN, AgglomerativeClustering
+from sklearn.decomposition import PCA
+from sklearn.preprocessing import StandardScaler
+from sklearn.manifold import TSNE
+from sklearn.linear_model import LogisticRegression
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.svm import SVC
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+from app.services.data_cleaner import read_file
+from app.services.predict_methods import load_data, preprocess_data, full_training_pipeline, evaluate_model
+from app.services.job_queue import report_progress
+from app.services import cluster_store
+
+# 分析任务: 参数只包含文件路径等可序列化的值，既可以在请求中直接调用，也可以提交到后台任务队列。
+# 返回值格式与对应接口的响应相同，参数有误时返回 {'success': False, 'error': ...}
+
+def split_features(df, feature_columns):
+    """取出特征列（删除缺失值），返回(数值特征, 被忽略的分类特征列表)"""
+    features_df = df[feature_columns].dropna()
+    
+    # 检查并处理分类特征
+    categorical_columns = []
+    numerical_columns = []
+    
+    for column in features_df.columns:
+        if features_df[column].dtype == 'object' or pd.api.types.is_categorical_dtype(features_df[column]):
+            categorical_columns.append(column)
+        else:
+            numerical_columns.append(column)
+    
+    return features_df[numerical_columns], categorical_columns
+
+def project_clusters(values, centers=None):
+    """绘制聚类结果用的二维坐标：两个特征时为特征本身，更多特征时为PCA前两个主成分
+
+    返回 (样本坐标, 聚类中心坐标, 两个主成分的解释方差比例)，没有降维时解释方差为None。
+    """
+    centers = None if centers is None else np.asarray(centers, dtype='float64')
+    if values.shape[1] == 2:
+        return values, centers, None
+    pca = PCA(n_components=2)
+    projection = pca.fit_transform(values)
+    projected_centers = None if centers is None else pca.transform(centers)
+    return projection, projected_centers, pca.explained_variance_ratio_
+
+def fit_clusters(file_path, file_type, feature_columns, algorithm_config, store_dir=None):
+    """取得聚类结果，返回(结果, 被忽略的分类特征列表)；所选特征中没有数值特征时结果为None
+
+    store_dir中已有相同数据版本、特征列和算法配置的结果时直接读取，否则执行聚类并保存。
+    结果中除聚类标签、中心和模型外还保存绘图用的二维坐标（见project_clusters），
+    绘制聚类图时不需要重新读取数据、拟合模型或降维。
+    algorithm_config中standardize为真时先对特征做标准化再聚类。
+    """
+    path = None
+    if store_dir:
+        key = cluster_store.fit_key(file_path, feature_columns, algorithm_config)
+        path = cluster_store.fit_path(store_dir, key)
+        result = cluster_store.load_fit(path)
+        if result is not None:
+            return result, result['ignored_columns']
+    
+    report_progress(0.1, '加载数据')
+    df = read_file(file_path, file_type)
+    features_df, categorical_columns = split_features(df, feature_columns)
+    if len(features_df.columns) == 0:
+        return None, categorical_columns
+    
+    values = features_df.to_numpy(dtype='float64')
+    if algorithm_config.get('standardize'):
+        values = StandardScaler().fit_transform(values)
+    
+    # 执行聚类
+    report_progress(0.3, '执行聚类')
+    result = perform_clustering(values, algorithm_config)
+    
+    # 计算绘图用的二维坐标，只有一个数值特征时无法绘制
+    projection = projected_centers = explained_variance = None
+    if values.shape[1] >= 2:
+        projection, projected_centers, explained_variance = project_clusters(values, result.get('centers'))
+    result.update({
+        'feature_columns': list(features_df.columns),
+        'ignored_columns': categorical_columns,
+        'projection': projection,
+        'projected_centers': projected_centers,
+        'explained_variance': explained_variance
+    })
+    
+    if path is not None:
+        report_progress(0.9, '保存结果')
+        cluster_store.save_fit(path, result)
+        cluster_store.prune(store_dir, keep=path)
+    return result, categorical_columns
+
+def run_clustering(file_path, file_type, feature_columns, algorithm_config, result_path, store_dir=None):
+    """执行聚类分析，结果保存到result_path，返回簇信息摘要
+
+    store_dir中已保存相同配置的聚类结果时直接使用，不重新聚类（见fit_clusters）。
+    """
+    result, categorical_columns = fit_clusters(file_path, file_type, feature_columns, algorithm_config, store_dir)
+    
+    # 如果所有选择的特征都是分类型，返回错误
+    if result is None:
+        return {'success': False, 'error': '请至少选择一个数值型特征进行聚类分析'}
+    
+    # 如果存在分类特征，发送警告信息（聚类分析只使用数值特征）
+    warning_message = None
+    if categorical_columns:
+        warning_message = f'已忽略以下分类特征: {", ".join(categorical_columns)}。聚类分析仅使用数值特征。'
+    
+    # 保存结果
+    joblib.dump(result, result_path)
+    
+    # 返回结果摘要
+    if isinstance(result.get('labels'), np.ndarray):
+        # 分析每个簇的大小
+        unique_labels = np.unique(result['labels'])
+        # 将numpy类型转换为Python原生类型
+        cluster_sizes = [int(np.sum(result['labels'] == label)) for label in unique_labels]
+        
+        return {
+            'success': True,
+            'cluster_count': int(len(unique_labels)),
+            'cluster_sizes': cluster_sizes,
+            'total_samples': int(len(result['labels'])),
+            'outliers_count': int(np.sum(result['labels'] == -1)) if -1 in unique_labels else 0,
+            'warning': warning_message
+        }
+    
+    return {
+        'success': True,
+        'message': '聚类完成，但无法解析簇信息',
+        'warning': warning_message
+    }
+
+def run_classification(file_path, file_type, feature_columns, target_column, test_size, algorithm_config,
+                       result_path):
+    """训练分类模型并在测试集上评估，结果保存到result_path，返回评估指标"""
+    report_progress(0.1, '加载数据')
+    df = read_file(file_path, file_type)
+    
+    # 提取特征和目标变量
+    features_df = df[feature_columns].copy()
+    
+    # 检查并进行特征预处理
+    categorical_columns = []
+    for column in features_df.columns:
+        if features_df[column].dtype == 'object' or pd.api.types.is_categorical_dtype(features_df[column]):
+            categorical_columns.append(column)
+    
+    # 通过pandas的get_dummies进行分类特征编码
+    if categorical_columns:
+        # 仅对分类特征进行独热编码，保留数值特征
+        features_df = pd.get_dummies(features_df, columns=categorical_columns, drop_first=True)
+    
+    # 处理完成后进行特征选择，删除掉有缺失值的行
+    features_df_clean = features_df.dropna()
+    y = df[target_column].loc[features_df_clean.index]
+    
+    # 检查数据是否足够
+    if len(features_df_clean) < 10:
+        return {'success': False, 'error': '清理缺失值后的有效数据不足，请选择其他特征'}
+    
+    # 划分训练集和测试集
+    X_train, X_test, y_train, y_test = train_test_split(
+        features_df_clean, y, test_size=test_size, random_state=42
+    )
+    
+    # 执行分类
+    report_progress(0.3, '训练模型')
+    result = perform_classification(X_train, y_train, X_test, algorithm_config)
+    result['y_test'] = y_test.values  # 添加真实标签用于评估
+    
+    # 保存结果
+    report_progress(0.9, '保存结果')
+    joblib.dump(result, result_path)
+    
+    # 计算基本指标
+    try:
+        metrics = {
+            'accuracy': float(accuracy_score(y_test, result['predictions'])),
+            'samples': int(len(y_test))
+        }
+        
+        # 对于二分类问题，计算更多指标
+        if len(np.unique(y)) == 2:
+            metrics.update({
+                'precision': float(precision_score(y_test, result['predictions'], average='binary')),
+                'recall': float(recall_score(y_test, result['predictions'], average='binary')),
+                'f1': float(f1_score(y_test, result['predictions'], average='binary'))
+            })
+            
+        # 如果有分类特征，添加一个提示信息
+        if categorical_columns:
+            metrics['categorical_features_processed'] = True
+            metrics['categorical_features'] = categorical_columns
+    except Exception as e:
+        metrics = {'error': str(e)}
+    
+    return {
+        'success': True,
+        'metrics': metrics
+    }
+
+def run_dimensionality_reduction(file_path, file_type, feature_columns, algorithm_config, result_path):
+    """执行降维分析，结果保存到result_path，返回前两个维度的数据用于可视化"""
+    report_progress(0.1, '加载数据')
+    df = read_file(file_path, file_type)
+    features_df, categorical_columns = split_features(df, feature_columns)
+    
+    # 如果所有选择的特征都是分类型，返回错误
+    if len(features_df.columns) == 0:
+        return {'success': False, 'error': '请至少选择一个数值型特征进行降维分析'}
+    
+    # 如果存在分类特征，发送警告信息（降维分析只使用数值特征）
+    warning_message = None
+    if categorical_columns:
+        warning_message = f'已忽略以下分类特征: {", ".join(categorical_columns)}。降维分析仅使用数值特征。'
+    
+    # 执行降维
+    report_progress(0.3, '执行降维')
+    result = perform_dimensionality_reduction(features_df, algorithm_config)
+    
+    # 保存结果
+    report_progress(0.9, '保存结果')
+    joblib.dump(result, result_path)
+    
+    # 为了前端可视化，返回降维后的前两个维度数据
+    if isinstance(result.get('transformed_data'), np.ndarray):
+        # 仅返回前1000个点以避免数据过大
+        data_sample = result['transformed_data'][:1000]
+        if data_sample.shape[1] >= 2:
+            data_2d = data_sample[:, :2].tolist()
+        else:
+            data_2d = data_sample.tolist()
+        
+        return {
+            'success': True,
+            'data_2d': data_2d,
+            'total_samples': int(len(result['transformed_data'])),
+            'returned_samples': int(len(data_2d)),
+            'explained_variance': result.get('explained_variance', None),
+            'warning': warning_message
+        }
+    
+    return {
+        'success': True,
+        'message': '降维完成，但无法提取可视化数据',
+        'warning': warning_message
+    }
+
+def run_price_training(file_path, file_type, model_path, preprocessor_path):
+    """训练房价预测模型并评估，模型和预处理器保存到指定路径，返回评估指标和特征列表"""
+    # 确保临时目录存在
+    os.makedirs(os.path.dirname(model_path), exist_ok=True)
+    
+    # 执行完整训练流程
+    report_progress(0.1, '训练模型')
+    model, preprocessor_objects = full_training_pipeline(
+        train_file_path=file_path,
+        model_save_path=model_path,
+        preprocessor_save_path=preprocessor_path,
+        file_type=file_type
+    )
+    
+    # 加载数据用于评估
+    report_progress(0.8, '评估模型')
+    df = load_data(file_path, file_type)
+    
+    # 提取特征和标签
+    features, target, _, _ = preprocess_data(df, training=True)
+    
+    # 划分训练集和测试集
+    X_train, X_test, y_train, y_test = train_test_split(
+        features, target, test_size=0.2, random_state=42
+    )
+    
+    # 评估模型
+    metrics = evaluate_model(model, X_test, y_test)
+    
+    return {
+        'success': True,
+        'metrics': metrics,
+        'feature_names': preprocessor_objects.get('feature_names', [])
+    }
+
+def perform_clustering(data, algorithm_config):
+    """
+    执行聚类分析
+    
+    参数:
+        data: pandas.DataFrame 或 numpy.ndarray
+        algorithm_config: 字典，包含算法类型和参数
+    
+    返回:
+        包含聚类结果的字典
+    """
+    algorithm = algorithm_config.get('algorithm', 'kmeans').lower()
+    # 未设置的参数取默认值，与保存聚类结果时的键一致（见cluster_store.normalize_algorithm_config）
+    params = cluster_store.clustering_params(algorithm, algorithm_config.get('params'))
+    
+    # 确保数据是numpy数组
+    if isinstance(data, pd.DataFrame):
+        features = data.values
+    else:
+        features = data
+    
+    result = {'algorithm': algorithm}
+    
+    if algorithm == 'kmeans':
+        n_clusters = params['n_clusters']
+        init = params['init']
+        n_init = params['n_init']
+        max_iter = params['max_iter']
+        random_state = params['random_state']
+        
+        # 执行K-means聚类
+        kmeans = KMeans(
+            n_clusters=n_clusters,
+            init=init,
+            n_init=n_init,
+            max_iter=max_iter,
+            random_state=random_state
+        )
+        
+        labels = kmeans.fit_predict(features)
+        
+        # 保存结果
+        result.update({
+            'labels': labels,
+            'model': kmeans,
+            'inertia': kmeans.inertia_,
+            'centers': kmeans.cluster_centers_
+        })
+    
+    elif algorithm == 'dbscan':
+        eps = params['eps']
+        min_samples = params['min_samples']
+        
+        # 执行DBSCAN聚类
+        dbscan = DBSCAN(
+            eps=eps,
+            min_samples=min_samples
+        )
+        
+        labels = dbscan.fit_predict(features)
+        
+        # 保存结果
+        result.update({
+            'labels': labels,
+            'model': dbscan,
+            'n_clusters': len(set(labels)) - (1 if -1 in labels else 0)  # 不包括噪声点
+        })
+    
+    elif algorithm == 'hierarchical':
+        n_clusters = params['n_clusters']
+        linkage = params['linkage']
+        
+        # 执行层次聚类
+        hc = AgglomerativeClustering(
+            n_clusters=n_clusters,
+            linkage=linkage
+        )
+        
+        labels = hc.fit_predict(features)
+        
+        # 保存结果
+        result.update({
+            'labels': labels,
+            'model': hc,
+            'n_clusters': n_clusters
+        })
+    
+    else:
+        raise ValueError(f"不支持的聚类算法: {algorithm}")
+    
+    return result
+
+def perform_classification(X_train, y_train, X_test, algorithm_config):
+    """
+    执行分类分析
+    
+    参数:
+        X_train: 训练集特征
+        y_train: 训练集标签
+        X_test: 测试集特征
+        algorithm_config: 字典，包含算法类型和参数
+    
+    返回:
+        包含分类结果的字典
+    """
+    algorithm = algorithm_config.get('algorithm', 'logistic_regression').lower()
+    params = algorithm_config.get('params', {})
+    
+    # 确保数据是numpy数组
+    if isinstance(X_train, pd.DataFrame):
+        X_train = X_train.values
+    if isinstance(y_train, pd.Series):
+        y_train = y_train.values
+    if isinstance(X_test, pd.DataFrame):
+        X_test = X_test.values
+    
+    result = {'algorithm': algorithm}
+    
+    if algorithm == 'logistic_regression':
+        # 设置默认参数
+        penalty = params.get('penalty', 'l2')
+        C = params.get('C', 1.0)
+        solver = params.get('solver', 'liblinear')
+        max_iter = params.get('max_iter', 100)
+        random_state = params.get('random_state', 42)
+        
+        # 执行逻辑回归
+        clf = LogisticRegression(
+            penalty=penalty,
+            C=C,
+            solver=solver,
+            max_iter=max_iter,
+            random_state=random_state
+        )
+        
+        clf.fit(X_train, y_train)
+        predictions = clf.predict(X_test)
+        
+        # 保存结果
+        result.update({
+            'model': clf,
+            'predictions': predictions,
+            'probabilities': clf.predict_proba(X_test) if hasattr(clf, 'predict_proba') else None
+        })
+    
+    elif algorithm == 'random_forest':
+        # 设置默认参数
+        n_estimators = params.get('n_estimators', 100)
+        max_depth = params.get('max_depth', None)
+        min_samples_split = params.get('min_samples_split', 2)
+        random_state = params.get('random_state', 42)
+        
+        # 执行随机森林分类
+        clf = RandomForestClassifier(
+            n_estimators=n_estimators,
+            max_depth=max_depth,
+            min_samples_split=min_samples_split,
+            random_state=random_state
+        )
+        
+        clf.fit(X_train, y_train)
+        predictions = clf.predict(X_test)
+        
+        # 保存结果
+        result.update({
+            'model': clf,
+            'predictions': predictions,
+            'feature_importances': clf.feature_importances_,
+            'probabilities': clf.predict_proba(X_test) if hasattr(clf, 'predict_proba') else None
+        })
+    
+    elif algorithm == 'svm':
+        # 设置默认参数
+        C = params.get('C', 1.0)
+        kernel = params.get('kernel', 'rbf')
+        gamma = params.get('gamma', 'scale')
+        
+        # 执行SVM分类
+        clf = SVC(
+            C=C,
+            kernel=kernel,
+            gamma=gamma,
+            probability=True
+        )
+        
+        clf.fit(X_train, y_train)
+        predictions = clf.predict(X_test)
+        
+        # 保存结果
+        result.update({
+            'model': clf,
+            'predictions': predictions,
+            'probabilities': clf.predict_proba(X_test) if hasattr(clf, 'predict_proba') else None
+        })
+    
+    else:
+        raise ValueError(f"不支持的分类算法: {algorithm}")
+    
+    return result
+
+def perform_dimensionality_reduction(data, algorithm_config):
+    """
+    执行降维分析
+    
+    参数:
+        data: pandas.DataFrame 或 numpy.ndarray
+        algorithm_config: 字典，包含算法类型和参数
+    
+    返回:
+        包含降维结果的字典
+    """
+    algorithm = algorithm_config.get('algorithm', 'pca').lower()
+    params = algorithm_config.get('params', {})
+    
+    # 确保数据是numpy数组
+    if isinstance(data, pd.DataFrame):
+        features = data.values
+    else:
+        features = data
+    
+    result = {'algorithm': algorithm}
+    
+    if algorithm == 'pca':
+        # 设置默认参数
+        n_components = params.get('n_components', 2)
+        svd_solver = params.get('svd_solver', 'auto')
+        random_state = params.get('random_state', 42)
+        
+        # 执行PCA降维
+        pca = PCA(
+            n_components=n_components,
+            svd_solver=svd_solver,
+            random_state=random_state
+        )
+        
+        transformed_data = pca.fit_transform(features)
+        
+        # 保存结果
+        result.update({
+            'model': pca,
+            'transformed_data': transformed_data,
+            'components': pca.components_,
+            'explained_variance': pca.explained_variance_ratio_.tolist() if hasattr(pca, 'explained_variance_ratio_') else None
+        })
+    
+    elif algorithm == 'tsne':
+        # 设置默认参数
+        n_components = params.get('n_components', 2)
+        perplexity = params.get('perplexity', 30.0)
+        learning_rate = params.get('learning_rate', 'auto')
+        n_iter = params.get('n_iter', 1000)
+        random_state = params.get('random_state', 42)
+        
+        # 执行t-SNE降维
+        tsne = TSNE(
+            n_components=n_components,
+            perplexity=perplexity,
+            learning_rate=learning_rate,
+            n_iter=n_iter,
+            random_state=random_state
+        )
+        
+        transformed_data = tsne.fit_transform(features)
+        
+        # 保存结果
+        result.update({
+            'model': tsne,
+            'transformed_data': transformed_data
+        })
+    
+    else:
+        raise ValueError(f"不支持的降维算法: {algorithm}")
+    
+    return result 
@@ -0,0 +1,52 @@
+import os
+import uuid
+import hashlib
+
+# 从上传流中每次读取的字节数
+READ_BLOCK_SIZE = 1024 * 1024
+
+
+def blob_path(blob_dir, digest, extension):
+    """内容哈希对应的文件路径，相同内容的文件只保存一份"""
+    return os.path.join(blob_dir, f"{digest}.{extension}")
+
+
+def save_blob(stream, blob_dir, extension):
+    """边写入磁盘边计算SHA-256，按内容哈希保存上传的文件
+
+    先写入临时文件，计算出哈希后再移动到最终位置；
+    如果相同内容的文件已经存在，则删除临时文件直接复用。
+
+    返回:
+        (文件路径, 内容哈希, 是否为新文件)
+    """
+    os.makedirs(blob_dir, exist_ok=True)
+    tmp_path = os.path.join(blob_dir, f".upload_{uuid.uuid4().hex}.tmp")
+    hasher = hashlib.sha256()
+
+    try:
+        with open(tmp_path, 'wb') as f:
+            while True:
+                block = stream.read(READ_BLOCK_SIZE)
+                if not block:
+                    break
+                hasher.update(block)
+                f.write(block)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    digest = hasher.hexdigest()
+    return commit_blob(tmp_path, blob_dir, digest, extension)
+
+
+def commit_blob(tmp_path, blob_dir, digest, extension):
+    """将已写完并计算好哈希的临时文件放入内容寻址存储"""
+    path = blob_path(blob_dir, digest, extension)
+    if os.path.exists(path):
+        os.remove(tmp_path)
+        return path, digest, False
+
+    os.replace(tmp_path, path)
+    return path, digest, True
@@ -0,0 +1,503 @@
+import numpy as np
+import pandas as pd
+from app.services.data_cleaner import read_file, get_sketches
+from app.services.correlation import load_correlation_stats
+from app.services.sketches import SKETCH_MIN_ROWS
+
+# 散点图、折线图和聚类图的点数超过该值时按密度分格，图表配置中的density_threshold可以覆盖
+DENSITY_POINTS = 100000
+# 密度网格的大小（x方向, y方向），与10x6英寸、100dpi的图片分辨率相当
+DENSITY_BINS = (400, 240)
+# 按类别着色时最多区分的类别数，其余类别合并为“其他”
+DENSITY_MAX_CATEGORIES = 10
+# 箱线图数据中最多返回的离群点个数（均匀抽样），离群点总数另外给出
+MAX_FLIERS = 1000
+
+
+def numeric_values(series):
+    """把列转换为float数组，列不是数值类型时返回None"""
+    try:
+        values = pd.to_numeric(series)
+    except (ValueError, TypeError):
+        return None
+    if not pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+        return None
+    return values.to_numpy(dtype='float64', na_value=np.nan)
+
+
+def bin_edges(values, bins, low=None, high=None):
+    """等宽分格的边界，low/high未指定时取数据的最小值和最大值"""
+    low = float(np.min(values)) if low is None else float(low)
+    high = float(np.max(values)) if high is None else float(high)
+    if low == high:
+        low, high = low - 0.5, high + 0.5
+    return np.linspace(low, high, bins + 1)
+
+
+def bin_index(values, edges):
+    """每个值所在的格子编号（最大值归入最后一格）"""
+    bins = len(edges) - 1
+    index = ((values - edges[0]) / (edges[-1] - edges[0]) * bins).astype('int64')
+    return np.clip(index, 0, bins - 1)
+
+
+def bin_points(x, y, bins=DENSITY_BINS):
+    """把点分到二维网格中
+
+    返回每个点所在格子的编号（按x方向优先展开）以及x、y方向的格子边界，
+    之后的计数、均值、主要类别都只需对格子编号做一次bincount。
+    """
+    xedges = bin_edges(x, bins[0])
+    yedges = bin_edges(y, bins[1])
+    return bin_index(x, xedges) * bins[1] + bin_index(y, yedges), xedges, yedges
+
+
+def density_grid(x, y, values=None, codes=None, bins=DENSITY_BINS):
+    """计算二维网格上每个格子的点数，以及values的均值或codes中出现最多的类别
+
+    返回(counts, grid, xedges, yedges)，grid为均值或类别编号的网格（没有点的格子为nan），
+    两者都不指定时grid为点数。网格形状为(x方向格子数, y方向格子数)。
+    """
+    cells, xedges, yedges = bin_points(x, y, bins)
+    size = bins[0] * bins[1]
+    counts = np.bincount(cells, minlength=size)
+    empty = counts == 0
+
+    if values is not None:
+        sums = np.bincount(cells, weights=values, minlength=size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            grid = sums / counts
+    elif codes is not None:
+        n_codes = int(codes.max()) + 1
+        table = np.bincount(cells * n_codes + codes, minlength=size * n_codes).reshape(size, n_codes)
+        grid = table.argmax(axis=1).astype('float64')
+    else:
+        grid = counts.astype('float64')
+    grid[empty] = np.nan
+    return counts.reshape(bins), grid.reshape(bins), xedges, yedges
+
+
+def category_codes(series, max_categories=DENSITY_MAX_CATEGORIES):
+    """把类别列编码为整数，类别过多时只保留最常见的几个，其余合并为“其他”
+
+    返回(编码数组, 类别名称列表)。
+    """
+    labels = series.astype(str)
+    if labels.nunique() > max_categories:
+        top = labels.value_counts().index[:max_categories - 1]
+        labels = labels.where(labels.isin(top), '其他')
+    codes, categories = pd.factorize(labels, sort=True)
+    return codes, [str(category) for category in categories]
+
+
+def density_scatter(data, x, y, hue=None, bins=DENSITY_BINS):
+    """散点图的密度网格：每个格子为点数、hue的均值或hue中最多的类别
+
+    返回字典 {kind: count/mean/category, counts, grid, x_edges, y_edges, categories}，
+    x或y不是数值列时无法分格，返回None。
+    """
+    xs = numeric_values(data[x])
+    ys = numeric_values(data[y])
+    if xs is None or ys is None:
+        return None
+
+    kind, categories = 'count', None
+    if hue is None:
+        counts, grid, xedges, yedges = density_grid(xs, ys, bins=bins)
+    else:
+        hue_values = numeric_values(data[hue])
+        if hue_values is not None and data[hue].nunique() > DENSITY_MAX_CATEGORIES:
+            kind = 'mean'
+            counts, grid, xedges, yedges = density_grid(xs, ys, values=hue_values, bins=bins)
+        else:
+            kind = 'category'
+            codes, categories = category_codes(data[hue])
+            counts, grid, xedges, yedges = density_grid(xs, ys, codes=codes, bins=bins)
+    return {
+        'kind': kind,
+        'counts': counts,
+        'grid': grid,
+        'x_edges': xedges,
+        'y_edges': yedges,
+        'categories': categories
+    }
+
+
+def binned_lines(data, x, y, hue=None, bins=DENSITY_BINS[0]):
+    """按x分段聚合折线：每段y的均值、最小值和最大值，hue指定时每个取值一条折线
+
+    返回 [{hue, x, mean, min, max}] 列表（x为有数据的分段中点），x或y不是数值列时返回None。
+    """
+    xs = numeric_values(data[x])
+    ys = numeric_values(data[y])
+    if xs is None or ys is None:
+        return None
+
+    edges = bin_edges(xs, bins)
+    centers = (edges[:-1] + edges[1:]) / 2
+    index = bin_index(xs, edges)
+    groups = [(None, np.ones(len(xs), dtype=bool))]
+    if hue is not None:
+        levels = sorted(data[hue].dropna().unique().tolist(), key=str)
+        groups = [(level, (data[hue] == level).to_numpy()) for level in levels]
+
+    lines = []
+    for level, mask in groups:
+        stats = pd.DataFrame({'bin': index[mask], 'y': ys[mask]}).groupby('bin')['y'].agg(['mean', 'min', 'max'])
+        lines.append({
+            'hue': level,
+            'x': centers[stats.index.to_numpy()],
+            'mean': stats['mean'].to_numpy(),
+            'min': stats['min'].to_numpy(),
+            'max': stats['max'].to_numpy()
+        })
+    return lines
+
+
+def aggregate_bars(df, x, y, hue=None):
+    """按(x, hue)分组计算y的均值、个数和标准误，只需一次向量化的groupby
+
+    返回的DataFrame包含x、hue（指定时）以及mean、count、sem列，按分组键排序。
+    """
+    keys = [x, hue] if hue else [x]
+    values = pd.to_numeric(df[y], errors='coerce')
+    grouped = values.groupby([df[key] for key in keys], sort=True)
+    agg = grouped.agg(['mean', 'count', 'std']).reset_index()
+    agg = agg[agg['count'] > 0]
+    agg['sem'] = (agg['std'] / np.sqrt(agg['count'])).fillna(0.0)
+    return agg.drop(columns='std').reset_index(drop=True)
+
+
+def sketch_box_statistics(file_path, file_type, column, values, whis=1.5):
+    """用分位数草图计算箱线图的统计量，不对整列排序
+
+    四分位数和中位数取自数据文件的草图，须线端点和离群点只需按边界遍历一次数据。
+    数据较小或该列没有草图时返回None，由调用方精确计算。
+    """
+    if len(values) < SKETCH_MIN_ROWS:
+        return None
+    sketch = get_sketches(file_path, file_type).get(column)
+    if sketch is None:
+        return None
+
+    q1, median, q3 = sketch.quantile([0.25, 0.5, 0.75])
+    return _box_from_quartiles(values.to_numpy(dtype='float64', na_value=np.nan), q1, median, q3, whis)
+
+
+def box_statistics(values, whis=1.5):
+    """精确计算箱线图的统计量（与matplotlib的boxplot一致）"""
+    data = values.to_numpy(dtype='float64', na_value=np.nan)
+    data = data[~np.isnan(data)]
+    if len(data) == 0:
+        return None
+    q1, median, q3 = np.quantile(data, [0.25, 0.5, 0.75])
+    return _box_from_quartiles(data, q1, median, q3, whis)
+
+
+def _box_from_quartiles(data, q1, median, q3, whis):
+    lower = q1 - whis * (q3 - q1)
+    upper = q3 + whis * (q3 - q1)
+    inside = data[(data >= lower) & (data <= upper)]
+    return {
+        'med': median,
+        'q1': q1,
+        'q3': q3,
+        'whislo': inside.min() if len(inside) else q1,
+        'whishi': inside.max() if len(inside) else q3,
+        'fliers': data[(data < lower) | (data > upper)]
+    }
+
+
+def saved_correlation(file_path, chart_type, config):
+    """热图所选的列都包含在保存的相关系数统计量中时，由统计量组装相关系数矩阵，不读取数据
+
+    统计量与分位数草图一样在上传或清洗较大的数据时生成，请求中不会为此遍历数据。
+    不是热图、配置中指定exact、没有保存的统计量或所选列不都是数值列时返回None，此时由所选列的数据计算。
+    每个请求只调用一次，得到的矩阵传给_heatmap_data/render_chart。
+    """
+    columns = config.get('columns') or []
+    if chart_type != 'heatmap' or config.get('exact') or not file_path or len(columns) < 2:
+        return None
+    stats = load_correlation_stats(file_path)
+    if stats is None or not stats.covers(columns):
+        return None
+    return stats.correlation(columns)
+
+
+def _json_list(values):
+    """把数组转换为JSON列表，nan和无穷值转换为None"""
+    values = np.asarray(values, dtype='float64')
+    return [float(v) if np.isfinite(v) else None for v in values]
+
+
+def _json_scalar(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    return value
+
+
+def _profile_range(profile, column):
+    """从数据集保存的列信息中取列的最小值和最大值，没有时返回None"""
+    for info in profile or []:
+        if info.get('name') == column and info.get('min') is not None and info.get('max') is not None:
+            return info['min'], info['max']
+    return None
+
+
+def _box_json(stats, count, approximate):
+    fliers = stats['fliers']
+    if len(fliers) > MAX_FLIERS:
+        fliers = fliers[np.linspace(0, len(fliers) - 1, MAX_FLIERS).astype('int64')]
+    return {
+        'count': int(count),
+        'q1': _json_scalar(float(stats['q1'])),
+        'median': _json_scalar(float(stats['med'])),
+        'q3': _json_scalar(float(stats['q3'])),
+        'whislo': _json_scalar(float(stats['whislo'])),
+        'whishi': _json_scalar(float(stats['whishi'])),
+        'fliers': _json_list(fliers),
+        'flier_count': int(len(stats['fliers'])),
+        'approximate': approximate
+    }
+
+
+def _histogram_data(df, config, profile):
+    x = config.get('x')
+    bins = int(config.get('bins', 10))
+    if not x:
+        return {'success': False, 'error': '缺少必要的参数: x'}
+    if bins < 1:
+        return {'success': False, 'error': 'bins必须为正整数'}
+
+    values = numeric_values(df[x])
+    if values is None:
+        return {'success': False, 'error': f'列 {x} 不是数值列'}
+    values = values[np.isfinite(values)]
+    if len(values) == 0:
+        return {'success': True, 'column': x, 'edges': [], 'counts': [], 'count': 0}
+
+    # 边界取自保存的列信息（最小值、最大值），不需要先扫描一遍数据
+    value_range = _profile_range(profile, x)
+    if value_range is not None and all(np.isfinite(value_range)):
+        edges = bin_edges(values, bins, *value_range)
+    else:
+        edges = bin_edges(values, bins)
+    counts = np.bincount(bin_index(values, edges), minlength=bins)
+    return {
+        'success': True,
+        'column': x,
+        'edges': _json_list(edges),
+        'counts': counts.tolist(),
+        'count': int(len(values))
+    }
+
+
+def _box_data(df, config, file_path, file_type):
+    x = config.get('x')
+    y = config.get('y')
+    if not y:
+        return {'success': False, 'error': '缺少必要的参数: y'}
+
+    if x and x in df.columns:
+        box_df = df[[x, y]].dropna()
+        groups = []
+        for key, part in box_df.groupby(x, sort=True):
+            stats = box_statistics(part[y])
+            if stats is not None:
+                groups.append(dict(_box_json(stats, len(part), False), group=_json_scalar(key)))
+        return {'success': True, 'column': y, 'group_by': x, 'boxes': groups}
+
+    values = df[y].dropna()
+    stats = None
+    if not config.get('exact'):
+        stats = sketch_box_statistics(file_path, file_type, y, values)
+    approximate = stats is not None
+    if stats is None:
+        stats = box_statistics(values)
+    boxes = [_box_json(stats, len(values), approximate)] if stats is not None else []
+    return {'success': True, 'column': y, 'boxes': boxes}
+
+
+def _heatmap_data(df, config, corr=None):
+    columns = config.get('columns', [])
+    if not columns or len(columns) < 2:
+        return {'success': False, 'error': '需要至少两列进行热图分析'}
+
+    if corr is None:
+        valid_columns = [col for col in columns if col in df.columns]
+        if len(valid_columns) < 2:
+            return {'success': False, 'error': '选择的列不存在于数据集中'}
+        corr = df[valid_columns].corr()
+
+    return {
+        'success': True,
+        'columns': list(corr.columns),
+        'matrix': [_json_list(row) for row in corr.to_numpy()]
+    }
+
+
+def _bar_data(df, config):
+    x = config.get('x')
+    y = config.get('y')
+    hue = config.get('hue')
+    if not x or not y:
+        return {'success': False, 'error': '缺少必要的参数: x和y'}
+    hue = hue if hue and hue in df.columns else None
+
+    agg = aggregate_bars(df, x, y, hue)
+    bars = [{
+        'x': _json_scalar(row[x]),
+        'hue': _json_scalar(row[hue]) if hue else None,
+        'mean': _json_scalar(float(row['mean'])),
+        'count': int(row['count']),
+        'sem': _json_scalar(float(row['sem']))
+    } for row in agg.to_dict('records')]
+    return {'success': True, 'x': x, 'y': y, 'hue': hue, 'bars': bars}
+
+
+def _scatter_data(df, config):
+    x = config.get('x')
+    y = config.get('y')
+    hue = config.get('hue')
+    if not x or not y:
+        return {'success': False, 'error': '缺少必要的参数: x和y'}
+    hue = hue if hue and hue in df.columns else None
+    data = df[[x, y, hue]].dropna() if hue else df[[x, y]].dropna()
+
+    if len(data) > config.get('density_threshold', DENSITY_POINTS):
+        density = density_scatter(data, x, y, hue)
+        if density is not None:
+            # 只返回有点的格子: [x方向编号, y方向编号, 点数, 值]
+            ix, iy = np.nonzero(density['counts'])
+            values = density['grid'][ix, iy]
+            cells = [[int(i), int(j), int(n), _json_scalar(float(v))]
+                     for i, j, n, v in zip(ix, iy, density['counts'][ix, iy], values)]
+            return {
+                'success': True,
+                'mode': 'density',
+                'x': x, 'y': y, 'hue': hue,
+                'kind': density['kind'],
+                'categories': density['categories'],
+                'x_edges': _json_list(density['x_edges']),
+                'y_edges': _json_list(density['y_edges']),
+                'cells': cells,
+                'count': int(len(data))
+            }
+
+    return {
+        'success': True,
+        'mode': 'points',
+        'x': x, 'y': y, 'hue': hue,
+        'points': {
+            'x': [_json_scalar(v) for v in data[x].tolist()],
+            'y': [_json_scalar(v) for v in data[y].tolist()],
+            'hue': [_json_scalar(v) for v in data[hue].tolist()] if hue else None
+        },
+        'count': int(len(data))
+    }
+
+
+def _line_data(df, config):
+    x = config.get('x')
+    y = config.get('y')
+    hue = config.get('hue')
+    if not x or not y:
+        return {'success': False, 'error': '缺少必要的参数: x和y'}
+    hue = hue if hue and hue in df.columns else None
+    data = df[[x, y, hue]].dropna() if hue else df[[x, y]].dropna()
+
+    lines = None
+    mode = 'binned'
+    if len(data) > config.get('density_threshold', DENSITY_POINTS):
+        lines = binned_lines(data, x, y, hue)
+    if lines is None:
+        # 点数较少时与折线图相同，按x的每个取值取y的均值
+        mode = 'points'
+        keys = [hue, x] if hue else [x]
+        means = pd.to_numeric(data[y], errors='coerce').groupby([data[key] for key in keys], sort=True).mean()
+        lines = []
+        for level, part in (means.groupby(level=0) if hue else [(None, means)]):
+            xs = part.index.get_level_values(-1)
+            lines.append({'hue': level, 'x': xs.tolist(), 'mean': part.to_numpy()})
+
+    series = []
+    for line in lines:
+        item = {
+            'hue': _json_scalar(line['hue']),
+            'x': [_json_scalar(v) for v in np.asarray(line['x']).tolist()],
+            'mean': _json_list(line['mean'])
+        }
+        if 'min' in line:
+            item['min'] = _json_list(line['min'])
+            item['max'] = _json_list(line['max'])
+        series.append(item)
+    return {'success': True, 'mode': mode, 'x': x, 'y': y, 'hue': hue, 'series': series}
+
+
+def required_columns(chart_type, config):
+    """图表需要读取的列，只读取这些列（有列式缓存时只解码这些列）"""
+    if chart_type == 'heatmap':
+        names = config.get('columns') or []
+    else:
+        names = [config.get('x'), config.get('y'), config.get('hue')]
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def load_chart_frame(file_path, file_type, columns=None):
+    """读取绘图用的数据（只读取columns中的列），并把无穷值替换为缺失值
+
+    columns中包含不存在的列时读取全部列，由各图表类型给出错误信息。
+    """
+    try:
+        df = read_file(file_path, file_type, columns=columns or None)
+    except (ValueError, KeyError):
+        df = read_file(file_path, file_type)
+    # 替换掉可能的inf值，这比使用已弃用的mode.use_inf_as_null更好
+    return df.replace([float('inf'), -float('inf')], pd.NA)
+
+
+def create_chart_data(file_path, file_type, chart_type, config, profile=None):
+    """计算图表所需的聚合数据，返回可以直接由前端绘制的JSON
+
+    与create_visualization支持相同的图表类型和配置，但不经过matplotlib：
+    直方图返回分格计数（边界取自保存的列信息），箱线图返回五数概括（数据较大时来自分位数草图），
+    热图返回相关系数矩阵，柱状图返回分组均值和标准误，散点图和折线图在点数较多时返回分格聚合结果。
+    profile为数据集保存的列信息。
+    """
+    try:
+        # 热图可以由保存的统计量得到时不需要读取数据
+        corr = saved_correlation(file_path, chart_type, config)
+        df = None
+        if corr is None:
+            df = load_chart_frame(file_path, file_type, required_columns(chart_type, config))
+
+        for name in [config.get('x'), config.get('y')]:
+            if name and df is not None and name not in df.columns:
+                return {'success': False, 'error': f'列 {name} 不存在'}
+
+        if chart_type == 'histogram':
+            result = _histogram_data(df, config, profile)
+        elif chart_type == 'box':
+            result = _box_data(df, config, file_path, file_type)
+        elif chart_type == 'heatmap':
+            result = _heatmap_data(df, config, corr)
+        elif chart_type == 'bar':
+            result = _bar_data(df, config)
+        elif chart_type == 'scatter':
+            result = _scatter_data(df, config)
+        elif chart_type == 'line':
+            result = _line_data(df, config)
+        else:
+            return {'success': False, 'error': f'不支持的图表类型: {chart_type}'}
+
+        if result.get('success'):
+            result['chart_type'] = chart_type
+        return result
+
+    except Exception as e:
+        import traceback
+        print(f"计算图表数据时出错: {str(e)}")
+        print(traceback.format_exc())
+        return {'success': False, 'error': str(e)}
@@ -0,0 +1,503 @@
+import os
+import pickle
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from app.services import columnar_cache
+from app.services.chunked_upload import Decompressor
+from app.services.data_cleaner import iter_chunks, read_head
+from app.services.profiler import ColumnProfiler
+from app.services.sketches import QuantileSketch, save_sketches
+from app.services.correlation import CorrelationStats, save_correlation_stats
+from app.services.job_queue import report_progress
+
+# 数据解压后超过该大小时按块清洗，内存占用与文件大小无关
+OUT_OF_CORE_BYTES = 1024 * 1024 * 1024
+# 压缩的CSV文件的后缀，判断是否按块清洗时按解压后的大小计算
+COMPRESSED_SUFFIXES = ('gz', 'bz2', 'zst')
+# 统计解压后大小时每次读取的压缩数据字节数
+DECOMPRESS_BLOCK_SIZE = 64 * 1024
+# 按块清洗时每块的行数
+CLEAN_CHUNK_ROWS = 200000
+# 去重时按哈希值把行分到这么多个临时分区，每个分区单独去重
+DEDUP_PARTITIONS = 64
+# 支持按块读取的文件类型（Excel文件无法分块解析）
+CHUNKED_FILE_TYPES = {'csv', 'parquet'}
+
+
+def _expanded_size_exceeds(file_path, limit):
+    """文件解压后的大小是否超过limit：未压缩的文件取文件大小，压缩文件流式解压计数，超过limit即停止"""
+    compression = os.path.splitext(file_path)[1].lstrip('.').lower()
+    if compression not in COMPRESSED_SUFFIXES:
+        return os.path.getsize(file_path) > limit
+
+    decompressor = Decompressor(compression)
+    total = 0
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(DECOMPRESS_BLOCK_SIZE), b''):
+            total += len(decompressor.decompress(block))
+            if total > limit:
+                return True
+    return False
+
+
+def should_use_chunks(file_path, file_type):
+    """数据读入内存后是否会超过OUT_OF_CORE_BYTES，超过时按块清洗
+
+    按数据展开后的大小判断，而不是磁盘上的文件大小：有列式缓存（或本身是parquet）时
+    取parquet元数据中未压缩的大小，压缩的CSV按解压后的大小计算。
+    """
+    if file_type not in CHUNKED_FILE_TYPES:
+        return False
+    if columnar_cache.is_fresh(file_path):
+        return columnar_cache.uncompressed_bytes(file_path) > OUT_OF_CORE_BYTES
+    return _expanded_size_exceeds(file_path, OUT_OF_CORE_BYTES)
+
+
+def _stat_kind(op):
+    """操作在执行前需要对当前所有行统计的量，只依赖单行的操作返回None"""
+    op_type = op.get('type')
+    method = op.get('method')
+    if op_type == 'fill_na':
+        method = method or 'mean'
+        if method in ('mean', 'median', 'mode'):
+            return method
+    elif op_type in ('handle_outliers', 'remove_outliers'):
+        return 'iqr'
+    elif op_type == 'categorical_encoding':
+        method = method or 'one_hot'
+        if method == 'label':
+            return 'vocab'
+        if method == 'one_hot':
+            return 'categories'
+    return None
+
+
+def _filters_rows(op):
+    op_type = op.get('type')
+    method = op.get('method')
+    if op_type in ('drop_na', 'drop_duplicates', 'remove_outliers'):
+        return True
+    if op_type == 'fill_na' and method == 'drop':
+        return True
+    return op_type == 'handle_outliers' and (method or 'drop') == 'drop'
+
+
+def compile_stages(operations):
+    """把操作分为若干阶段，每个阶段需要的统计量可以在同一次遍历中收集
+
+    与clean_planner.compile_plan的规则相同：删除行的操作只出现在阶段末尾，
+    阶段内统计量依赖的列在使用前没有被修改；去重操作单独作为一个阶段。
+    """
+    stages = []
+    stage = None
+    modified = set()
+
+    for op in operations:
+        column = op.get('column')
+        kind = _stat_kind(op)
+
+        if op.get('type') == 'drop_duplicates':
+            stages.append({'ops': [op], 'stats': {}, 'dedup': True})
+            stage = None
+            continue
+
+        if stage is None or (kind and column in modified):
+            stage = {'ops': [], 'stats': {}, 'dedup': False}
+            stages.append(stage)
+            modified = set()
+
+        stage['ops'].append(op)
+        if kind and column:
+            stage['stats'].setdefault(column, set()).add(kind)
+            if op.get('exact'):
+                stage['stats'][column].add('exact')
+        if column and not _filters_rows(op):
+            modified.add(column)
+        if _filters_rows(op):
+            stage = None
+
+    return stages
+
+
+class _StatsCollector:
+    """在一次遍历中累积一个阶段需要的统计量
+
+    均值按和与个数累积；中位数和四分位数由每块的分位数草图合并得到，
+    操作要求精确结果（统计量集合中有'exact'）时才保存相关列的全部非空数值；
+    众数累积每个值的出现次数；编码所需的取值集合累积每块的唯一值。
+    """
+
+    def __init__(self, requests):
+        self.requests = requests
+        self.numeric = {col: True for col in requests}
+        self.seen = set()
+        self.sums = {}
+        self.counts = {}
+        self.values = {}
+        self.sketches = {}
+        self.value_counts = {}
+        self.uniques = {}
+
+    def update(self, chunk):
+        for col, kinds in self.requests.items():
+            if col not in chunk.columns:
+                continue
+            self.seen.add(col)
+            series = chunk[col]
+            # 各数据块推断出的类型可能不同，所有块都是数值类型时才按数值列处理
+            self.numeric[col] = self.numeric[col] and pd.api.types.is_numeric_dtype(series)
+
+            if 'mean' in kinds and pd.api.types.is_numeric_dtype(series):
+                self.sums[col] = self.sums.get(col, 0.0) + float(series.sum())
+                self.counts[col] = self.counts.get(col, 0) + int(series.count())
+            if kinds & {'median', 'iqr'} and pd.api.types.is_numeric_dtype(series):
+                values = series.dropna().to_numpy(dtype='float64')
+                if 'exact' in kinds:
+                    self.values.setdefault(col, []).append(values)
+                else:
+                    chunk_sketch = QuantileSketch()
+                    chunk_sketch.update(values)
+                    self.sketches.setdefault(col, QuantileSketch()).merge(chunk_sketch)
+            if 'mode' in kinds:
+                counts = series.value_counts(sort=False)
+                previous = self.value_counts.get(col)
+                self.value_counts[col] = counts if previous is None else previous.add(counts, fill_value=0)
+            if kinds & {'vocab', 'categories'}:
+                self.uniques.setdefault(col, []).append(pd.unique(series))
+
+    def result(self):
+        """返回 {(列名, 统计量): 值}，以及每列是否为数值列"""
+        stats = {}
+        for col, kinds in self.requests.items():
+            if col not in self.seen:
+                continue
+            if 'mean' in kinds and self.numeric[col]:
+                count = self.counts.get(col, 0)
+                stats[(col, 'mean')] = self.sums[col] / count if count else np.nan
+            if kinds & {'median', 'iqr'} and self.numeric[col]:
+                if 'exact' in kinds:
+                    values = np.concatenate(self.values.get(col) or [np.empty(0)])
+                    quantiles = np.quantile(values, [0.25, 0.5, 0.75]) if len(values) else [np.nan] * 3
+                else:
+                    quantiles = self.sketches.get(col, QuantileSketch()).quantile([0.25, 0.5, 0.75])
+                q1, median, q3 = quantiles
+                stats[(col, 'median')] = median
+                stats[(col, 'iqr')] = (q1, q3)
+            if 'mode' in kinds:
+                counts = self.value_counts.get(col)
+                if counts is None or len(counts) == 0:
+                    stats[(col, 'mode')] = None
+                else:
+                    # 与Series.mode()[0]一致：出现次数最多的值中取最小的
+                    stats[(col, 'mode')] = sorted(counts[counts == counts.max()].index)[0]
+            if kinds & {'vocab', 'categories'}:
+                uniques = pd.Series(np.concatenate(self.uniques[col])).drop_duplicates()
+                stats[(col, 'uniques')] = uniques.reset_index(drop=True)
+        numeric = {col: self.numeric[col] and col in self.seen for col in self.requests}
+        return stats, numeric
+
+
+def _resolve(op, stats, numeric):
+    """把需要统计量的操作转换为只依赖单行的变换"""
+    op_type = op.get('type')
+    column = op.get('column')
+
+    if op_type == 'drop_column':
+        return ('drop_column', column)
+
+    if op_type == 'fill_na':
+        method = op.get('method', 'mean')
+        value = op.get('value')
+        if method == 'drop':
+            return ('notna', column)
+        elif method in ('mean', 'median') and numeric.get(column, False):
+            return ('fillna', column, stats[(column, method)])
+        elif method == 'mode' and (column, 'mode') in stats:
+            if stats[(column, 'mode')] is None:
+                raise IndexError('index 0 is out of bounds for axis 0 with size 0')
+            return ('fillna', column, stats[(column, 'mode')])
+        elif method == 'value' and value is not None:
+            return ('fillna', column, value)
+        return ('require', column)
+
+    if op_type == 'drop_na':
+        return ('notna', column)
+
+    if op_type in ('handle_outliers', 'remove_outliers'):
+        if not numeric.get(column, False):
+            return ('require', column)
+        if op_type == 'handle_outliers':
+            method = op.get('method', 'drop')
+            threshold = op.get('threshold', 1.5)
+        else:
+            method, threshold = 'drop', 1.5
+        Q1, Q3 = stats[(column, 'iqr')]
+        IQR = Q3 - Q1
+        lower_bound, upper_bound = Q1 - threshold * IQR, Q3 + threshold * IQR
+        if method == 'drop':
+            return ('between', column, lower_bound, upper_bound)
+        elif method == 'cap':
+            return ('clip', column, lower_bound, upper_bound)
+        return ('require', column)
+
+    if op_type == 'categorical_encoding':
+        method = op.get('method', 'one_hot')
+        if (column, 'uniques') not in stats:
+            return ('require', column)
+        if method == 'one_hot':
+            uniques = stats[(column, 'uniques')]
+            encoded = pd.get_dummies(uniques, prefix=column)
+            dummies = []
+            for name in encoded.columns:
+                hits = uniques[encoded[name].to_numpy(dtype=bool)]
+                dummies.append((name, hits.iloc[0] if len(hits) else None))
+            return ('one_hot', column, dummies)
+        elif method == 'label':
+            # 与LabelEncoder一致，类别按排序后的顺序编号
+            return ('label', column, np.unique(stats[(column, 'uniques')].to_numpy()))
+        return ('require', column)
+
+    return ('noop',)
+
+
+def _apply_transforms(chunk, row_ids, transforms):
+    """对一个数据块依次执行只依赖单行的变换，返回(数据块, 行号)"""
+    for transform in transforms:
+        kind = transform[0]
+        if kind == 'noop':
+            continue
+        if kind == 'row_mask':
+            keep = transform[1][row_ids]
+            chunk, row_ids = chunk[keep], row_ids[keep]
+            continue
+
+        column = transform[1]
+        if kind == 'drop_column':
+            chunk = chunk.drop(columns=[column])
+        elif kind == 'require':
+            # 不需要修改的操作也要检查列是否存在，与直接执行时的报错一致
+            if column not in chunk.columns:
+                raise KeyError(column)
+        elif kind == 'notna':
+            keep = chunk[column].notna().to_numpy()
+            chunk, row_ids = chunk[keep], row_ids[keep]
+        elif kind == 'fillna':
+            chunk = chunk.copy()
+            chunk[column] = chunk[column].fillna(transform[2])
+        elif kind == 'between':
+            values = chunk[column]
+            keep = ((values >= transform[2]) & (values <= transform[3])).to_numpy()
+            chunk, row_ids = chunk[keep], row_ids[keep]
+        elif kind == 'clip':
+            chunk = chunk.copy()
+            chunk[column] = chunk[column].clip(lower=transform[2], upper=transform[3])
+        elif kind == 'label':
+            chunk = chunk.copy()
+            chunk[column] = np.searchsorted(transform[2], chunk[column].to_numpy()).astype(np.int64)
+        elif kind == 'one_hot':
+            source = chunk[column]
+            dummies = pd.DataFrame({
+                name: (source == category) if category is not None else pd.Series(False, index=source.index)
+                for name, category in transform[2]
+            }, index=source.index)
+            chunk = pd.concat([chunk.drop(columns=[column]), dummies], axis=1)
+    return chunk, row_ids
+
+
+def _stream(file_path, file_type, transforms, chunksize):
+    """逐块读取输入文件并执行已确定的变换，同时返回每行在原始文件中的行号"""
+    offset = 0
+    for chunk in iter_chunks(file_path, file_type, chunksize):
+        row_ids = np.arange(offset, offset + len(chunk))
+        offset += len(chunk)
+        yield _apply_transforms(chunk, row_ids, transforms)
+
+
+def _hash_rows(keys):
+    """计算每行的哈希值，用于把相同的行分到同一个分区
+
+    分块解析CSV时同一列在不同块中的类型可能不同（例如整块为空时推断为float），
+    哈希前统一为浮点数或Python对象，缺失值统一为None，保证相同的值得到相同的哈希。
+    """
+    normalized = {}
+    for i, col in enumerate(keys.columns):
+        series = keys.iloc[:, i]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            series = series.astype('float64')
+        normalized[i] = series.astype(object).where(series.notna(), None)
+    return pd.util.hash_pandas_object(pd.DataFrame(normalized), index=False).to_numpy()
+
+
+def _dedup_mask(file_path, file_type, transforms, op, total_rows, work_dir, chunksize):
+    """按哈希分区溢写到磁盘后逐个分区去重，返回原始文件中保留的行的掩码
+
+    相同的行一定落在同一个分区中，分区内按原始行号排序后去重，
+    因此keep='first'/'last'/False的语义与对整个数据集去重相同。
+    """
+    keep_option = op.get('keep', 'first')
+    subset = op.get('columns', [])
+    partition_paths = [os.path.join(work_dir, f'part_{i}.pkl') for i in range(DEDUP_PARTITIONS)]
+    files = [open(path, 'wb') for path in partition_paths]
+    try:
+        for chunk, row_ids in _stream(file_path, file_type, transforms, chunksize):
+            keys = chunk[subset] if subset else chunk
+            hashes = _hash_rows(keys)
+            partitions = hashes % DEDUP_PARTITIONS
+            keys = keys.reset_index(drop=True)
+            for i in np.unique(partitions):
+                selected = partitions == i
+                part = keys[selected].copy()
+                part['__row_id__'] = row_ids[selected]
+                pickle.dump(part, files[i], protocol=pickle.HIGHEST_PROTOCOL)
+    finally:
+        for f in files:
+            f.close()
+
+    keep = np.ones(total_rows, dtype=bool)
+    for path in partition_paths:
+        parts = []
+        with open(path, 'rb') as f:
+            while True:
+                try:
+                    parts.append(pickle.load(f))
+                except EOFError:
+                    break
+        os.remove(path)
+        if not parts:
+            continue
+        part = pd.concat(parts, ignore_index=True).sort_values('__row_id__', kind='mergesort')
+        key_columns = [col for col in part.columns if col != '__row_id__']
+        duplicated = part.duplicated(subset=key_columns, keep=keep_option).to_numpy()
+        keep[part['__row_id__'].to_numpy()[duplicated]] = False
+    return keep
+
+
+def _write_pass(file_path, file_type, transforms, chunksize, write):
+    """执行全部变换，逐块交给write写出并统计列信息，返回(列统计, 相关系数统计量, 预览, 原始行数, 清洗后行数)
+
+    没有数据行时写出只有表头的空块。
+    """
+    profiler = ColumnProfiler()
+    correlation = CorrelationStats()
+    preview = None
+    total_rows = 0
+    cleaned_count = 0
+    for chunk in iter_chunks(file_path, file_type, chunksize):
+        row_ids = np.arange(total_rows, total_rows + len(chunk))
+        total_rows += len(chunk)
+        chunk, _ = _apply_transforms(chunk, row_ids, transforms)
+        if preview is None or len(preview) < 10:
+            head = chunk.head(10)
+            preview = head if preview is None else pd.concat([preview, head]).head(10)
+        cleaned_count += len(chunk)
+        profiler.update(chunk)
+        correlation.update(chunk)
+        write(chunk)
+
+    if total_rows == 0:
+        empty, _ = _apply_transforms(read_head(file_path, file_type, 0), np.arange(0), transforms)
+        profiler.update(empty)
+        write(empty)
+    return profiler, correlation, preview, total_rows, cleaned_count
+
+
+def _write_parquet_version(file_path, file_type, transforms, output_path, work_dir, chunksize):
+    """把清洗结果逐块写为parquet版本文件，返回(路径, 文件类型, _write_pass的结果)，失败时返回None"""
+    version_path = output_path + '.parquet'
+    writer = columnar_cache.ChunkedParquetWriter(version_path, work_dir)
+    try:
+        written = _write_pass(file_path, file_type, transforms, chunksize, writer.write)
+    except Exception as e:
+        # 例如列中混合了无法转换为Arrow的类型，与write_version一样退回CSV
+        print(f"写入parquet版本失败，改为写入CSV: {str(e)}")
+        writer.abort()
+        return None
+    if not writer.close():
+        return None
+    return version_path, 'parquet', written
+
+
+def _write_csv_version(file_path, file_type, transforms, output_path, chunksize):
+    """把清洗结果逐块写为CSV版本文件，返回(路径, 文件类型, _write_pass的结果)"""
+    version_path = output_path + '.csv'
+    tmp_path = version_path + '.tmp'
+    header = True
+    with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+        def write(chunk):
+            nonlocal header
+            chunk.to_csv(f, index=False, header=header)
+            header = False
+        
+        written = _write_pass(file_path, file_type, transforms, chunksize, write)
+    os.replace(tmp_path, version_path)
+    return version_path, 'csv', written
+
+
+def clean_data_chunked(file_path, file_type, operations, output_path, chunksize=CLEAN_CHUNK_ROWS):
+    """按块清洗数据，内存中只保留一个数据块以及统计量
+
+    每个需要全局统计量的阶段先遍历一次数据收集统计量（均值、中位数、IQR边界、众数、
+    编码的取值集合），把操作转换为只依赖单行的变换；去重操作按哈希分区溢写到磁盘。
+    最后一次遍历执行全部变换，逐块写入新的版本文件（parquet，每块为一个行组；
+    未安装pyarrow或无法转换为parquet时为CSV）并统计列信息。
+    返回值格式与clean_data相同。
+    """
+    work_dir = tempfile.mkdtemp(prefix='clean_', dir=os.path.dirname(output_path))
+    try:
+        transforms = []
+        original_count = None
+
+        stages = compile_stages(operations)
+        for index, stage in enumerate(stages):
+            # 作为后台任务执行时报告进度（每个阶段一次遍历，最后再遍历一次写出结果）
+            report_progress(index / (len(stages) + 1), f'执行第{index + 1}/{len(stages)}个阶段')
+            if stage['dedup']:
+                if original_count is None:
+                    original_count = sum(len(chunk) for chunk in iter_chunks(file_path, file_type, chunksize))
+                mask = _dedup_mask(file_path, file_type, transforms, stage['ops'][0],
+                                   original_count, work_dir, chunksize)
+                transforms.append(('row_mask', mask))
+                continue
+
+            stats, numeric = {}, {}
+            if stage['stats']:
+                collector = _StatsCollector(stage['stats'])
+                for chunk, _ in _stream(file_path, file_type, transforms, chunksize):
+                    collector.update(chunk)
+                stats, numeric = collector.result()
+            transforms.extend(_resolve(op, stats, numeric) for op in stage['ops'])
+
+        # 最后一次遍历：执行全部变换并写入新版本（优先写为parquet，读取时无需再解析）
+        report_progress(len(stages) / (len(stages) + 1), '写入清洗结果')
+        written = None
+        if columnar_cache.is_available():
+            written = _write_parquet_version(file_path, file_type, transforms, output_path, work_dir, chunksize)
+        if written is None:
+            written = _write_csv_version(file_path, file_type, transforms, output_path, chunksize)
+        version_path, version_type, (profiler, correlation, preview, total_rows, cleaned_count) = written
+        save_sketches(version_path, profiler.sketches())
+        save_correlation_stats(version_path, correlation)
+
+        original_columns = list(read_head(file_path, file_type, 0).columns)
+        columns_info = profiler.result()
+        return {
+            'success': True,
+            'preview': preview.replace({np.nan: None}).to_dict(orient='records') if preview is not None else [],
+            'original_count': total_rows,
+            'cleaned_count': cleaned_count,
+            'removed_count': total_rows - cleaned_count,
+            'column_count': len(columns_info),
+            'added_column_count': len(columns_info) - len(original_columns),
+            'columns': columns_info,
+            'file_path': version_path,
+            'file_type': version_type
+        }
+    except Exception as e:
+        return {
+            'success': False,
+            'error': str(e)
+        }
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,323 @@
+import io
+import os
+import json
+import time
+import uuid
+import bz2
+import zlib
+import hashlib
+import threading
+import pandas as pd
+from app.services.profiler import ColumnProfiler
+from app.services.correlation import CorrelationStats
+
+# 从请求流中每次读取的字节数
+READ_BLOCK_SIZE = 1024 * 1024
+# 累积到这么多完整行后解析一次并更新列统计
+PROFILE_BLOCK_SIZE = 4 * 1024 * 1024
+
+# 进程内的上传会话（增量哈希和列统计状态），服务重启后会在完成上传时重新计算
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class UploadError(Exception):
+    """分块上传出错，status_code为返回给客户端的HTTP状态码"""
+
+    def __init__(self, message, status_code=400, offset=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.offset = offset
+
+
+class _StreamingProfile:
+    """对到达的CSV数据按完整行解析并累积列统计
+
+    无法按行切分（例如引号内的换行导致解析失败）时停止统计，
+    完成上传时再对整个文件做一次统计。
+    """
+
+    def __init__(self):
+        self.profiler = ColumnProfiler()
+        self.correlation = CorrelationStats()
+        self.header = None
+        self.pending = b''
+        self.failed = False
+
+    def feed(self, block, final=False):
+        if self.failed:
+            return
+        self.pending += block
+
+        # 只解析到最后一个完整行；引号个数为奇数说明最后一行被切在了引号内，继续等待
+        cut = len(self.pending) if final else self.pending.rfind(b'\n') + 1
+        complete = self.pending[:cut]
+        if not final and (len(complete) < PROFILE_BLOCK_SIZE or complete.count(b'"') % 2 == 1):
+            return
+        self.pending = self.pending[cut:]
+
+        if self.header is None:
+            line_end = complete.find(b'\n') + 1
+            if line_end == 0:
+                # 只有表头没有数据行
+                self.header, complete = complete, b''
+            else:
+                self.header, complete = complete[:line_end], complete[line_end:]
+            if not self.header.endswith(b'\n'):
+                self.header += b'\n'
+
+        try:
+            if complete.strip():
+                chunk = pd.read_csv(io.BytesIO(self.header + complete))
+                self.profiler.update(chunk)
+                self.correlation.update(chunk)
+            elif final and self.profiler.row_count == 0:
+                # 没有数据行时只记录列名
+                self.profiler.update(pd.read_csv(io.BytesIO(self.header)))
+        except Exception as e:
+            print(f"分块解析失败，将在上传完成后重新统计: {str(e)}")
+            self.failed = True
+
+    def result(self):
+        """返回(列信息, 总行数, 数值列的分位数草图, 相关系数统计量)，统计失败时返回None"""
+        self.feed(b'', final=True)
+        if self.failed:
+            return None
+        return self.profiler.result(), self.profiler.row_count, self.profiler.sketches(), self.correlation
+
+
+class Decompressor:
+    """流式解压gzip/bz2/zstd数据，用于边接收边统计压缩的CSV文件"""
+
+    def __init__(self, compression):
+        self.compression = compression
+        self._obj = self._new_object()
+
+    def _new_object(self):
+        if self.compression == 'gz':
+            return zlib.decompressobj(16 + zlib.MAX_WBITS)
+        elif self.compression == 'bz2':
+            return bz2.BZ2Decompressor()
+        elif self.compression == 'zst':
+            import zstandard
+            return zstandard.ZstdDecompressor().decompressobj()
+        raise ValueError(f"不支持的压缩格式: {self.compression}")
+
+    def decompress(self, data):
+        output = []
+        while data:
+            output.append(self._obj.decompress(data))
+            # 多个压缩数据流首尾相接时（如多段gzip），继续解压剩余的数据
+            data = getattr(self._obj, 'unused_data', b'') if getattr(self._obj, 'eof', False) else b''
+            if data:
+                self._obj = self._new_object()
+        return b''.join(output)
+
+
+class _UploadSession:
+    def __init__(self, streaming_profile, compression=None):
+        self.lock = threading.Lock()
+        self.hasher = hashlib.sha256()
+        self.hashed_bytes = 0
+        self.profile = _StreamingProfile() if streaming_profile else None
+        self.decompressor = Decompressor(compression) if streaming_profile and compression else None
+
+    def feed_profile(self, block):
+        """将原始数据块（压缩文件先解压）交给列统计"""
+        if self.profile is None or self.profile.failed:
+            return
+        try:
+            if self.decompressor is not None:
+                block = self.decompressor.decompress(block)
+        except Exception as e:
+            print(f"解压失败，将在上传完成后重新统计: {str(e)}")
+            self.profile.failed = True
+            return
+        self.profile.feed(block)
+
+
+def _meta_path(upload_dir, upload_id):
+    return os.path.join(upload_dir, f"{upload_id}.json")
+
+
+def _part_path(upload_dir, upload_id):
+    return os.path.join(upload_dir, f"{upload_id}.part")
+
+
+def _load_meta(upload_dir, upload_id):
+    # upload_id只能是init_upload生成的十六进制字符串，防止路径穿越
+    if not upload_id.isalnum():
+        raise UploadError('无效的上传ID', 404)
+    path = _meta_path(upload_dir, upload_id)
+    if not os.path.exists(path):
+        raise UploadError('上传任务不存在或已完成', 404)
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def expire_uploads(upload_dir, max_age):
+    """删除超过max_age秒没有收到数据的上传任务（任务信息和已接收的数据），返回删除的任务数
+
+    最近活动时间取任务信息文件（创建时写入）和数据文件（每次追加数据时更新）中较晚的修改时间；
+    完成上传后留下的、未被移走的数据文件同样按修改时间清理。
+    """
+    last_active = {}
+    try:
+        with os.scandir(upload_dir) as it:
+            for entry in it:
+                upload_id, ext = os.path.splitext(entry.name)
+                if ext not in ('.json', '.part') or not upload_id.isalnum() or not entry.is_file():
+                    continue
+                mtime = entry.stat().st_mtime
+                last_active[upload_id] = max(mtime, last_active.get(upload_id, mtime))
+    except OSError:
+        return 0
+
+    cutoff = time.time() - max_age
+    removed = 0
+    for upload_id, mtime in last_active.items():
+        if mtime >= cutoff:
+            continue
+        with _sessions_lock:
+            _sessions.pop(upload_id, None)
+        for path in (_meta_path(upload_dir, upload_id), _part_path(upload_dir, upload_id)):
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+        removed += 1
+    if removed:
+        print(f"已删除{removed}个过期的分块上传任务")
+    return removed
+
+
+def _get_session(upload_id, meta):
+    with _sessions_lock:
+        session = _sessions.get(upload_id)
+        if session is None:
+            session = _sessions[upload_id] = _UploadSession(meta['file_type'] == 'csv', meta.get('compression'))
+        return session
+
+
+def init_upload(upload_dir, filename, file_type, user_id, description='', total_size=None, max_size=None,
+                compression=None, expire_seconds=None):
+    """创建分块上传任务，返回上传状态
+
+    compression为CSV文件的压缩格式（gz/bz2/zst），接收数据时流式解压后再统计。
+    指定expire_seconds时，先删除超过该时间没有收到数据的上传任务（见expire_uploads）。
+    """
+    if total_size is not None and max_size is not None and int(total_size) > max_size:
+        raise UploadError('文件超过允许的最大大小', 413)
+
+    os.makedirs(upload_dir, exist_ok=True)
+    if expire_seconds:
+        expire_uploads(upload_dir, expire_seconds)
+    upload_id = uuid.uuid4().hex
+    meta = {
+        'upload_id': upload_id,
+        'filename': filename,
+        'file_type': file_type,
+        'compression': compression,
+        'user_id': user_id,
+        'description': description,
+        'size': int(total_size) if total_size is not None else None,
+        'created_at': time.time()
+    }
+    with open(_meta_path(upload_dir, upload_id), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    open(_part_path(upload_dir, upload_id), 'wb').close()
+
+    _get_session(upload_id, meta)
+    return upload_status(upload_dir, upload_id)
+
+
+def upload_status(upload_dir, upload_id):
+    """返回已接收的字节数，客户端断线后从该位置继续上传"""
+    meta = _load_meta(upload_dir, upload_id)
+    return {
+        'upload_id': upload_id,
+        'filename': meta['filename'],
+        'size': meta['size'],
+        'offset': os.path.getsize(_part_path(upload_dir, upload_id))
+    }
+
+
+def append_chunk(upload_dir, upload_id, offset, stream, max_size=None):
+    """在指定位置追加一个数据块
+
+    offset必须等于已接收的字节数；offset更小说明是重传的数据块，直接忽略。
+    写入磁盘的同时更新内容哈希，CSV文件还会解析完整的行并更新列统计。
+    """
+    meta = _load_meta(upload_dir, upload_id)
+    session = _get_session(upload_id, meta)
+    part_path = _part_path(upload_dir, upload_id)
+
+    with session.lock:
+        current = os.path.getsize(part_path)
+        if offset < current:
+            return upload_status(upload_dir, upload_id)
+        if offset > current:
+            raise UploadError('数据块位置不连续', 409, offset=current)
+
+        # 进程重启后内存中的哈希状态丢失，后续块不再增量统计，完成时重新计算
+        incremental = session.hashed_bytes == current
+        written = current
+        with open(part_path, 'ab') as f:
+            while True:
+                block = stream.read(READ_BLOCK_SIZE)
+                if not block:
+                    break
+                written += len(block)
+                if max_size is not None and written > max_size:
+                    f.truncate(current)
+                    raise UploadError('文件超过允许的最大大小', 413, offset=current)
+                f.write(block)
+                if incremental:
+                    session.hasher.update(block)
+                    session.hashed_bytes += len(block)
+                    session.feed_profile(block)
+        if not incremental and session.profile is not None:
+            session.profile.failed = True
+
+    return upload_status(upload_dir, upload_id)
+
+
+def complete_upload(upload_dir, upload_id):
+    """完成上传
+
+    返回:
+        (临时文件路径, 上传任务信息, 内容哈希, 分块统计得到的(列信息, 行数, 分位数草图)或None)
+    """
+    meta = _load_meta(upload_dir, upload_id)
+    part_path = _part_path(upload_dir, upload_id)
+    size = os.path.getsize(part_path)
+    if meta['size'] is not None and size != meta['size']:
+        raise UploadError(f'文件未上传完整: {size}/{meta["size"]}', 400, offset=size)
+
+    with _sessions_lock:
+        session = _sessions.pop(upload_id, None)
+
+    profile = None
+    if session is not None and session.hashed_bytes == size:
+        digest = session.hasher.hexdigest()
+        if session.profile is not None:
+            profile = session.profile.result()
+    else:
+        hasher = hashlib.sha256()
+        with open(part_path, 'rb') as f:
+            for block in iter(lambda: f.read(READ_BLOCK_SIZE), b''):
+                hasher.update(block)
+        digest = hasher.hexdigest()
+
+    os.remove(_meta_path(upload_dir, upload_id))
+    return part_path, meta, digest, profile
+
+
+def abort_upload(upload_dir, upload_id):
+    """取消上传并删除已接收的数据"""
+    _load_meta(upload_dir, upload_id)
+    with _sessions_lock:
+        _sessions.pop(upload_id, None)
+    for path in (_meta_path(upload_dir, upload_id), _part_path(upload_dir, upload_id)):
+        if os.path.exists(path):
+            os.remove(path)
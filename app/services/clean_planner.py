@@ -0,0 +1,287 @@
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder
+
+# 会删除行的操作
+ROW_FILTER_OPS = {'drop_na', 'drop_duplicates', 'remove_outliers'}
+# 可以从分位数草图得到的统计量
+SKETCH_KINDS = {'median', 'iqr'}
+
+
+def _stat_kind(op):
+    """操作需要的列统计量：mean/median/iqr，不需要时返回None"""
+    op_type = op.get('type')
+    if op_type == 'fill_na' and op.get('method', 'mean') in ('mean', 'median'):
+        return op.get('method', 'mean')
+    if op_type in ('handle_outliers', 'remove_outliers'):
+        return 'iqr'
+    return None
+
+
+def _filters_rows(op):
+    op_type = op.get('type')
+    if op_type in ROW_FILTER_OPS:
+        return True
+    if op_type == 'fill_na' and op.get('method', 'mean') == 'drop':
+        return True
+    return op_type == 'handle_outliers' and op.get('method', 'drop') == 'drop'
+
+
+def _modifies_column(op):
+    """操作是否会修改（或删除）其所在列的值"""
+    return bool(op.get('column')) and not _filters_rows(op)
+
+
+def compile_plan(operations):
+    """将清洗操作列表编译为若干阶段
+
+    同一阶段内的行集合不变（删除行的操作只会出现在阶段末尾），
+    且阶段内需要统计量的列在使用前没有被修改，因此一个阶段的统计量可以一次算完。
+
+    操作中指定 'exact': True 时，该列的统计量在统计量集合中额外标记'exact'，
+    不使用分位数草图而是精确计算。
+
+    返回:
+        阶段列表，每个阶段为 {'ops': [...], 'stats': {列名: {统计量}}}
+    """
+    stages = []
+    stage = None
+    modified = set()
+
+    for op in operations:
+        column = op.get('column')
+        kind = _stat_kind(op)
+
+        # 统计量依赖本阶段中被修改过的列时，需要开始新阶段
+        if stage is None or (kind and column in modified):
+            stage = {'ops': [], 'stats': {}}
+            stages.append(stage)
+            modified = set()
+
+        stage['ops'].append(op)
+        if kind and column:
+            stage['stats'].setdefault(column, set()).add(kind)
+            if op.get('exact'):
+                stage['stats'][column].add('exact')
+        if _modifies_column(op):
+            modified.add(column)
+        if _filters_rows(op):
+            stage = None
+
+    return stages
+
+
+class CleanPlan:
+    """延迟执行的清洗计划
+
+    不在每一步复制DataFrame，而是记录:
+      - mask: 原始数据中保留的行（所有删除行的操作合并为一个布尔数组）
+      - 被修改的列: 修改时保留的行上的新值，以及这些行在原始数据中的位置
+      - 当前的列顺序（删除列只是从列顺序中移除）
+      - 独热编码生成的列（只记录类别，最后只生成仍然保留的列）
+    每一步都只在当前保留的行上计算，所有操作执行完之后再一次性生成结果。
+
+    sketches为原始数据的分位数草图，列尚未被修改且没有删除过行时，
+    中位数和IQR边界直接从草图取得（近似值），不再排序整列。
+    """
+
+    def __init__(self, df, sketches=None):
+        self.df = df
+        self.mask = np.ones(len(df), dtype=bool)
+        self.order = list(df.columns)
+        self.overrides = {}
+        self.dummies = {}
+        self.stats = {}
+        self.sketches = sketches or {}
+        self.exact = set()
+
+    def _subset(self, values, positions):
+        """values为positions这些行上的值，返回其中仍然保留的行"""
+        keep = self.mask[positions]
+        return values if keep.all() else values[keep]
+
+    def current(self, column):
+        """某列在当前保留的行上的值"""
+        if column not in self.order:
+            raise KeyError(column)
+        if column in self.overrides:
+            return self._subset(*self.overrides[column])
+        if column in self.dummies:
+            source, positions, category = self.dummies[column]
+            source = self._subset(source, positions)
+            if category is None:
+                return pd.Series(False, index=source.index)
+            return source == category
+        values = self.df[column]
+        return values if self.mask.all() else values[self.mask]
+
+    def set_column(self, column, values):
+        """用当前保留的行上的新值替换某列"""
+        self.dummies.pop(column, None)
+        self.overrides[column] = (values, np.flatnonzero(self.mask))
+
+    def filter_rows(self, keep):
+        """按当前保留的行上的布尔条件删除行，条件与已有的mask合并"""
+        keep = np.asarray(keep, dtype=bool)
+        self.mask[np.flatnonzero(self.mask)[~keep]] = False
+
+    def _sketch(self, column):
+        """列的值仍与原始数据相同时返回其草图，否则返回None"""
+        if column in self.exact or column in self.overrides or column in self.dummies:
+            return None
+        if column not in self.order or not self.mask.all():
+            return None
+        return self.sketches.get(column)
+
+    def prefetch_stats(self, requests):
+        """一次计算一个阶段需要的全部统计量
+
+        requests为 {列名: {统计量}}，非数值列和不存在的列跳过（由对应操作自行处理）。
+        可以从草图取得的统计量不在这里计算。
+        """
+        self.stats = {}
+        self.exact = {col for col, kinds in requests.items() if 'exact' in kinds}
+        columns = [col for col in requests if col in self.order and
+                   not (self._sketch(col) is not None and requests[col] - {'exact'} <= SKETCH_KINDS)]
+        frame = pd.DataFrame({col: self.current(col) for col in columns})
+        frame = frame.select_dtypes(include='number')
+        if len(frame.columns) == 0:
+            return
+
+        kinds = set().union(*(requests[col] for col in frame.columns))
+        if 'mean' in kinds:
+            for col, value in frame.mean().items():
+                self.stats[(col, 'mean')] = value
+        if 'median' in kinds:
+            for col, value in frame.median().items():
+                self.stats[(col, 'median')] = value
+        if 'iqr' in kinds:
+            quantiles = frame.quantile([0.25, 0.75])
+            for col in frame.columns:
+                self.stats[(col, 'iqr')] = (quantiles[col].iloc[0], quantiles[col].iloc[1])
+
+    def stat(self, column, kind):
+        key = (column, kind)
+        sketch = self._sketch(column) if kind in SKETCH_KINDS else None
+        if key not in self.stats and sketch is not None:
+            if kind == 'median':
+                return sketch.quantile(0.5)
+            Q1, Q3 = sketch.quantile([0.25, 0.75])
+            return Q1, Q3
+        if key not in self.stats:
+            values = self.current(column)
+            if kind == 'mean':
+                self.stats[key] = values.mean()
+            elif kind == 'median':
+                self.stats[key] = values.median()
+            else:
+                self.stats[key] = (values.quantile(0.25), values.quantile(0.75))
+        return self.stats[key]
+
+    def outlier_bounds(self, column, threshold):
+        Q1, Q3 = self.stat(column, 'iqr')
+        IQR = Q3 - Q1
+        return Q1 - threshold * IQR, Q3 + threshold * IQR
+
+    def apply(self, op):
+        """执行一个清洗操作（语义与逐步执行pandas操作一致）"""
+        op_type = op.get('type')
+        column = op.get('column')
+
+        if op_type == 'drop_column':
+            # 删除列
+            if column not in self.order:
+                raise KeyError(f"['{column}'] not found in axis")
+            self.order.remove(column)
+            self.overrides.pop(column, None)
+            self.dummies.pop(column, None)
+
+        elif op_type == 'fill_na':
+            # 填充缺失值
+            method = op.get('method', 'mean')
+            value = op.get('value')
+            values = self.current(column)
+
+            if method == 'drop':
+                self.filter_rows(values.notna())
+            elif method in ('mean', 'median') and pd.api.types.is_numeric_dtype(values):
+                self.set_column(column, values.fillna(self.stat(column, method)))
+            elif method == 'mode':
+                self.set_column(column, values.fillna(values.mode()[0]))
+            elif method == 'value' and value is not None:
+                self.set_column(column, values.fillna(value))
+
+        elif op_type == 'drop_na':
+            # 删除包含缺失值的行
+            self.filter_rows(self.current(column).notna())
+
+        elif op_type == 'drop_duplicates':
+            # 删除重复行，重复的判断只针对当前保留的行
+            columns = op.get('columns', []) or list(self.order)
+            keep = op.get('keep', 'first')
+            frame = pd.DataFrame({col: self.current(col) for col in columns})
+            self.filter_rows(~frame.duplicated(keep=keep).to_numpy())
+
+        elif op_type in ('handle_outliers', 'remove_outliers'):
+            # 处理异常值
+            values = self.current(column)
+            if pd.api.types.is_numeric_dtype(values):
+                if op_type == 'handle_outliers':
+                    method = op.get('method', 'drop')
+                    threshold = op.get('threshold', 1.5)
+                else:
+                    method, threshold = 'drop', 1.5
+                lower_bound, upper_bound = self.outlier_bounds(column, threshold)
+
+                if method == 'drop':
+                    self.filter_rows((values >= lower_bound) & (values <= upper_bound))
+                elif method == 'cap':
+                    self.set_column(column, values.clip(lower=lower_bound, upper=upper_bound))
+
+        elif op_type == 'categorical_encoding':
+            # 分类变量编码
+            method = op.get('method', 'one_hot')
+            if method == 'one_hot':
+                self.one_hot(column)
+            elif method == 'label':
+                values = self.current(column)
+                codes = LabelEncoder().fit_transform(values)
+                self.set_column(column, pd.Series(codes, index=values.index))
+
+    def one_hot(self, column):
+        """记录独热编码的类别，列值在最后生成结果时才计算
+
+        类别由当前保留的行决定。只对去重后的少量值调用get_dummies，
+        保证列名、顺序与直接对整列做独热编码一致。
+        """
+        source = self.current(column)
+        positions = np.flatnonzero(self.mask)
+        uniques = source.drop_duplicates().reset_index(drop=True)
+        encoded = pd.get_dummies(uniques, prefix=column)
+
+        self.order.remove(column)
+        self.overrides.pop(column, None)
+        for name in encoded.columns:
+            hits = uniques[encoded[name].to_numpy(dtype=bool)]
+            # 分类类型中未出现的类别对应全为False的列
+            self.dummies[name] = (source, positions, hits.iloc[0] if len(hits) else None)
+            self.overrides.pop(name, None)
+            if name in self.order:
+                self.order.remove(name)
+            self.order.append(name)
+
+    def materialize(self):
+        """一次性生成清洗结果，只复制保留的行和列"""
+        index = self.df.index if self.mask.all() else self.df.index[self.mask]
+        return pd.DataFrame({col: self.current(col) for col in self.order}, index=index,
+                            columns=self.order)
+
+
+def run_plan(df, operations, sketches=None):
+    """编译并执行清洗操作，返回清洗后的DataFrame"""
+    plan = CleanPlan(df, sketches)
+    for stage in compile_plan(operations):
+        plan.prefetch_stats(stage['stats'])
+        for op in stage['ops']:
+            plan.apply(op)
+    return plan.materialize()
@@ -0,0 +1,110 @@
+import os
+import json
+import uuid
+import hashlib
+import joblib
+from app.services.render_cache import normalize_config
+from app.services.snapshot_cache import file_key
+
+# 聚类结果文件的后缀，文件名为 {结果键}.joblib
+CLUSTER_FIT_SUFFIX = '.joblib'
+# 文件格式版本，格式变化时递增，旧文件会被视为不存在
+CLUSTER_FIT_FORMAT = 1
+# 最多保存的聚类结果个数，超出时删除最久未使用的结果
+CLUSTER_STORE_MAX_FITS = 64
+# 各聚类算法的默认参数（perform_clustering使用），未设置的参数取默认值
+CLUSTERING_DEFAULTS = {
+    'kmeans': {'n_clusters': 3, 'init': 'k-means++', 'n_init': 10, 'max_iter': 300, 'random_state': 42},
+    'dbscan': {'eps': 0.5, 'min_samples': 5},
+    'hierarchical': {'n_clusters': 3, 'linkage': 'ward'}
+}
+
+
+def clustering_params(algorithm, params):
+    """聚类算法的完整参数：去掉未设置的参数后用默认参数补全"""
+    return {**CLUSTERING_DEFAULTS.get(algorithm, {}), **normalize_config(params)}
+
+
+def normalize_algorithm_config(algorithm_config):
+    """规范化聚类算法配置：算法名小写，去掉未设置的参数并补全默认参数
+
+    {"algorithm": "KMeans", "params": {"eps": null}}、{"algorithm": "kmeans"} 与
+    {"algorithm": "kmeans", "params": {"n_clusters": 3}} 得到相同的聚类结果。
+    """
+    algorithm_config = algorithm_config or {}
+    algorithm = str(algorithm_config.get('algorithm', 'kmeans')).lower()
+    normalized = {
+        'algorithm': algorithm,
+        'params': clustering_params(algorithm, algorithm_config.get('params'))
+    }
+    if algorithm_config.get('standardize'):
+        normalized['standardize'] = True
+    return normalized
+
+
+def fit_key(file_path, feature_columns, algorithm_config):
+    """聚类结果的键：数据版本、特征列和规范化后的算法配置共同决定聚类结果"""
+    text = '\n'.join([
+        file_key(file_path),
+        json.dumps(list(feature_columns), ensure_ascii=False),
+        json.dumps(normalize_algorithm_config(algorithm_config), sort_keys=True, ensure_ascii=False, default=str)
+    ])
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def fit_path(store_dir, key):
+    return os.path.join(store_dir, f"{key}{CLUSTER_FIT_SUFFIX}")
+
+
+def load_fit(path):
+    """读取保存的聚类结果，不存在或格式已过期时返回None；命中时更新修改时间（作为最近使用时间）"""
+    if not os.path.exists(path):
+        return None
+    try:
+        fit = joblib.load(path)
+        if fit.get('format') != CLUSTER_FIT_FORMAT:
+            return None
+        os.utime(path)
+        return fit
+    except Exception as e:
+        print(f"读取聚类结果失败: {str(e)}")
+        return None
+
+
+def save_fit(path, fit):
+    """保存聚类结果（先写临时文件再改名，并发读取不会读到写了一半的文件）"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        joblib.dump(dict(fit, format=CLUSTER_FIT_FORMAT), tmp_path)
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        print(f"保存聚类结果失败: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def prune(store_dir, max_files=CLUSTER_STORE_MAX_FITS, keep=None):
+    """保存的聚类结果超过max_files个时，按最近使用时间删除最久未用的结果，返回删除的文件数"""
+    keep = os.path.abspath(keep) if keep else None
+    try:
+        with os.scandir(store_dir) as it:
+            entries = sorted((entry.stat().st_mtime, entry.path) for entry in it
+                             if entry.is_file() and entry.name.endswith(CLUSTER_FIT_SUFFIX))
+    except OSError:
+        return 0
+
+    removed = 0
+    for _, path in entries[:max(0, len(entries) - max_files)]:
+        if os.path.abspath(path) == keep:
+            continue
+        try:
+            os.remove(path)
+            removed += 1
+        except OSError:
+            continue
+    if removed:
+        print(f"聚类结果超出上限，已删除{removed}个最久未使用的结果")
+    return removed
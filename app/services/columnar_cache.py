@@ -0,0 +1,262 @@
+import os
+import json
+import uuid
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # 未安装pyarrow时不使用列式缓存，直接解析原始文件
+    pa = None
+    pq = None
+
+# 列式缓存文件的后缀，缓存文件与原始文件放在同一目录下
+SIDECAR_SUFFIX = '.parquet'
+# 缓存格式版本，格式变化时递增，旧缓存会被视为过期
+SIDECAR_FORMAT = 1
+# 每个行组的行数，行组统计信息可用于后续的过滤下推
+ROW_GROUP_SIZE = 64 * 1024
+
+_META_KEY = b'pyexp.source'
+
+
+def is_available():
+    """列式缓存是否可用（依赖pyarrow）"""
+    return pq is not None
+
+
+def is_parquet(file_path):
+    """数据文件本身是否为parquet文件（清洗生成的数据集版本），这类文件无需另建缓存"""
+    return file_path.endswith(SIDECAR_SUFFIX)
+
+
+def sidecar_path(file_path):
+    """返回原始数据文件对应的列式缓存文件路径"""
+    if is_parquet(file_path):
+        return file_path
+    return file_path + SIDECAR_SUFFIX
+
+
+def _source_stamp(file_path):
+    """原始文件的版本戳：文件大小和修改时间，任一变化都说明缓存已过期"""
+    stat = os.stat(file_path)
+    return {
+        'format': SIDECAR_FORMAT,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns
+    }
+
+
+def is_fresh(file_path):
+    """检查缓存文件是否存在且与原始文件一致（只读取parquet文件尾部的元数据）"""
+    if not is_available():
+        return False
+    if is_parquet(file_path):
+        return os.path.exists(file_path)
+
+    cache_path = sidecar_path(file_path)
+    if not os.path.exists(cache_path) or not os.path.exists(file_path):
+        return False
+
+    try:
+        metadata = pq.read_schema(cache_path).metadata or {}
+        stamp = json.loads(metadata.get(_META_KEY, b'{}'))
+    except Exception:
+        return False
+
+    return stamp == _source_stamp(file_path)
+
+
+def read_sidecar(file_path, columns=None):
+    """从列式缓存中读取数据，可以只读取部分列"""
+    table = pq.read_table(sidecar_path(file_path), columns=columns)
+    return table.to_pandas()
+
+
+def write_sidecar(df, file_path):
+    """将DataFrame写入列式缓存，并记录原始文件的版本戳
+
+    写入失败（例如列中混合了无法转换的类型）时只打印提示并返回False，
+    读取时会继续使用原始文件。
+    """
+    if not is_available():
+        return False
+    if is_parquet(file_path):
+        return True
+
+    return _write_table(df, sidecar_path(file_path), _source_stamp(file_path))
+
+
+def write_parquet(df, path):
+    """将DataFrame写为独立的parquet数据文件（数据集版本），写入失败时返回False"""
+    if not is_available():
+        return False
+    return _write_table(df, path)
+
+
+def _write_table(df, path, stamp=None):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        if stamp is not None:
+            metadata = dict(table.schema.metadata or {})
+            metadata[_META_KEY] = json.dumps(stamp).encode('utf-8')
+            table = table.replace_schema_metadata(metadata)
+
+        # 先写临时文件再替换，避免并发读取到写了一半的文件
+        pq.write_table(table, tmp_path, row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        print(f"写入parquet文件失败: {path}, {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def _unify_types(types):
+    """各块中同一列的Arrow类型不同时（例如某块有缺失值，整数列被推断为浮点），取能容纳所有块的类型"""
+    types = [t for t in types if not pa.types.is_null(t)]
+    if not types:
+        return pa.null()
+    if all(t == types[0] for t in types):
+        return types[0]
+    if all(pa.types.is_integer(t) for t in types):
+        return pa.int64()
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in types):
+        return pa.float64()
+    return pa.string()
+
+
+class ChunkedParquetWriter:
+    """逐块把DataFrame写为一个parquet文件，每块为一个或多个行组，内存中只保留当前块
+
+    分块解析CSV时同一列在不同块中推断出的类型可能不同。各块类型一致时直接写入目标文件；
+    出现不一致时改为把各块暂存为临时parquet文件，写完后按统一的类型（见_unify_types）
+    逐块转换写入目标文件。close()成功时返回True，目标文件先写临时文件再替换。
+    """
+
+    def __init__(self, path, spool_dir):
+        self.path = path
+        self.tmp_path = path + '.tmp'
+        self.spool_dir = spool_dir
+        self.writer = None
+        self.schema = None
+        self.spooled = []
+        self.types = {}
+
+    def _spool(self, table):
+        spool_path = os.path.join(self.spool_dir, f'spool_{len(self.spooled)}.parquet')
+        pq.write_table(table, spool_path, row_group_size=ROW_GROUP_SIZE)
+        self.spooled.append(spool_path)
+
+    def write(self, df):
+        table = pa.Table.from_pandas(df, preserve_index=False).replace_schema_metadata(None)
+        for field in table.schema:
+            self.types.setdefault(field.name, []).append(field.type)
+
+        if self.schema is None:
+            self.schema = table.schema
+            self.writer = pq.ParquetWriter(self.tmp_path, self.schema)
+        if self.writer is not None and table.schema.equals(self.schema):
+            self.writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+            return
+
+        if self.writer is not None:
+            # 类型第一次不一致：已写入的部分作为第一个暂存文件
+            self.writer.close()
+            self.writer = None
+            spool_path = os.path.join(self.spool_dir, 'spool_head.parquet')
+            os.replace(self.tmp_path, spool_path)
+            self.spooled.append(spool_path)
+        self._spool(table)
+
+    def close(self):
+        try:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+            elif self.spooled:
+                schema = pa.schema([pa.field(name, _unify_types(types)) for name, types in self.types.items()])
+                with pq.ParquetWriter(self.tmp_path, schema) as writer:
+                    for spool_path in self.spooled:
+                        parquet_file = pq.ParquetFile(spool_path)
+                        for i in range(parquet_file.num_row_groups):
+                            group = parquet_file.read_row_group(i).select(schema.names)
+                            writer.write_table(group.cast(schema), row_group_size=ROW_GROUP_SIZE)
+                        os.remove(spool_path)
+            os.replace(self.tmp_path, self.path)
+            return True
+        except Exception as e:
+            print(f"写入parquet文件失败: {self.path}, {str(e)}")
+            self.abort()
+            return False
+
+    def abort(self):
+        """放弃写入，删除临时文件"""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        for path in self.spooled + [self.tmp_path]:
+            if os.path.exists(path):
+                os.remove(path)
+        self.spooled = []
+
+
+def uncompressed_bytes(file_path):
+    """parquet文件（或列式缓存）中数据未压缩的大小，用于估计读入内存后的大小"""
+    metadata = pq.ParquetFile(sidecar_path(file_path)).metadata
+    return sum(metadata.row_group(i).total_byte_size for i in range(metadata.num_row_groups))
+
+
+def remove_sidecar(file_path):
+    """删除原始文件对应的列式缓存"""
+    if is_parquet(file_path):
+        return
+    cache_path = sidecar_path(file_path)
+    if os.path.exists(cache_path):
+        os.remove(cache_path)
+
+
+def read_sidecar_head(file_path, rows):
+    """只读取缓存中的前几行（只解码第一个批次，与数据集大小无关）"""
+    parquet_file = pq.ParquetFile(sidecar_path(file_path))
+    for batch in parquet_file.iter_batches(batch_size=rows):
+        return batch.to_pandas()
+    return parquet_file.schema_arrow.empty_table().to_pandas()
+
+
+def row_count(file_path):
+    """从缓存文件的元数据中读取总行数"""
+    return pq.ParquetFile(sidecar_path(file_path)).metadata.num_rows
+
+
+def take_rows(file_path, columns, positions):
+    """按行号读取指定的行，只读取包含这些行的行组
+
+    positions为行号数组，返回的行按positions的顺序排列。
+    """
+    parquet_file = pq.ParquetFile(sidecar_path(file_path))
+    metadata = parquet_file.metadata
+    positions = np.asarray(positions, dtype=np.int64)
+    if len(positions) == 0:
+        return parquet_file.schema_arrow.empty_table().select(columns).to_pandas()
+
+    # 每个行组的起始行号
+    group_rows = np.array([metadata.row_group(i).num_rows for i in range(metadata.num_row_groups)])
+    group_starts = np.concatenate([[0], np.cumsum(group_rows)[:-1]])
+    groups = np.searchsorted(group_starts, positions, side='right') - 1
+
+    selected = np.unique(groups)
+    table = parquet_file.read_row_groups(selected.tolist(), columns=columns)
+
+    # 行号在读取出的行组中的位置
+    selected_starts = np.concatenate([[0], np.cumsum(group_rows[selected])[:-1]])
+    local = positions - group_starts[groups] + selected_starts[np.searchsorted(selected, groups)]
+    return table.take(local).to_pandas()
+
+
+def iter_batches(file_path, batch_size, columns=None):
+    """按批次读取缓存，逐批返回pyarrow的RecordBatch"""
+    parquet_file = pq.ParquetFile(sidecar_path(file_path))
+    yield from parquet_file.iter_batches(batch_size=batch_size, columns=columns)
@@ -0,0 +1,186 @@
+import os
+import json
+import uuid
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+# 相关系数充分统计量文件的后缀，与数据文件放在同一目录下
+CORRELATION_SUFFIX = '.corr.json'
+# 文件格式版本，格式变化时递增，旧文件会被视为过期
+CORRELATION_FORMAT = 1
+# 进程内缓存的已读取统计量个数（按数据文件）
+CORRELATION_CACHE_ENTRIES = 8
+
+_loaded = OrderedDict()
+_loaded_lock = threading.Lock()
+
+
+class CorrelationStats:
+    """数值列两两之间的Pearson相关系数的充分统计量
+
+    对每一对列(i, j)只统计两列都不为空的行（与DataFrame.corr的成对删除一致）：
+    共同非空行数n、列i在这些行上的和sx与平方和sxx、两列的乘积和sxy。
+    每个数据块用四次矩阵乘法累加，统计量可以直接相加，追加数据时只需对新数据调用update()。
+    任意列子集的相关系数矩阵只需从中取出对应的行列组装，与行数无关。
+    为减少大数值平方和的精度损失，各列先减去第一块数据的均值（相关系数不受平移影响）。
+    """
+
+    def __init__(self):
+        self.columns = None
+        self.shift = None
+        self.n = None
+        self.sx = None
+        self.sxx = None
+        self.sxy = None
+
+    def update(self, chunk):
+        """累加一个数据块，列集合以第一个数据块的数值列为准"""
+        if self.columns is None:
+            numeric = chunk.select_dtypes(include='number')
+            self.columns = list(numeric.columns)
+            k = len(self.columns)
+            shift = numeric.replace([np.inf, -np.inf], np.nan).mean().to_numpy(dtype='float64') if k else np.empty(0)
+            self.shift = np.nan_to_num(shift)
+            self.n = np.zeros((k, k))
+            self.sx = np.zeros((k, k))
+            self.sxx = np.zeros((k, k))
+            self.sxy = np.zeros((k, k))
+        if not self.columns or len(chunk) == 0:
+            return
+
+        values = chunk.reindex(columns=self.columns).apply(pd.to_numeric, errors='coerce')
+        values = values.to_numpy(dtype='float64', na_value=np.nan) - self.shift
+        # 无穷值与绘图时一样视为缺失值
+        mask = np.isfinite(values)
+        x = np.where(mask, values, 0.0)
+        m = mask.astype('float64')
+
+        self.n += m.T @ m
+        self.sx += x.T @ m
+        self.sxx += (x * x).T @ m
+        self.sxy += x.T @ x
+
+    def covers(self, columns):
+        return self.columns is not None and all(col in self.columns for col in columns)
+
+    def correlation(self, columns):
+        """返回columns之间的相关系数矩阵（DataFrame），与df[columns].corr()一致"""
+        index = [self.columns.index(col) for col in columns]
+        grid = np.ix_(index, index)
+        n, sx, sxx, sxy = self.n[grid], self.sx[grid], self.sxx[grid], self.sxy[grid]
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # sx[i, j]为列i在列i、j共同非空行上的和，sx.T[i, j]为列j在同样的行上的和
+            cov = sxy - sx * sx.T / n
+            var = sxx - sx * sx / n
+            corr = cov / np.sqrt(var * var.T)
+        corr = np.clip(corr, -1.0, 1.0)
+        # 方差不为零的列与自身的相关系数为1
+        diagonal = np.diag(var) > 0
+        corr[diagonal, diagonal] = 1.0
+        return pd.DataFrame(corr, index=list(columns), columns=list(columns))
+
+    def to_dict(self):
+        return {
+            'columns': self.columns,
+            'shift': self.shift.tolist(),
+            'n': self.n.tolist(),
+            'sx': self.sx.tolist(),
+            'sxx': self.sxx.tolist(),
+            'sxy': self.sxy.tolist()
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        k = len(data['columns'])
+        stats.columns = list(data['columns'])
+        stats.shift = np.asarray(data['shift'], dtype='float64')
+        for name in ('n', 'sx', 'sxx', 'sxy'):
+            setattr(stats, name, np.asarray(data[name], dtype='float64').reshape(k, k))
+        return stats
+
+
+def build_correlation_stats(chunks):
+    """按块遍历一次数据，累加相关系数的充分统计量"""
+    stats = CorrelationStats()
+    for chunk in chunks:
+        stats.update(chunk)
+    return stats
+
+
+def correlation_path(file_path):
+    """返回数据文件对应的统计量文件路径"""
+    return file_path + CORRELATION_SUFFIX
+
+
+def _source_stamp(file_path):
+    stat = os.stat(file_path)
+    return {
+        'format': CORRELATION_FORMAT,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns
+    }
+
+
+def _remember(file_path, stamp, stats):
+    with _loaded_lock:
+        _loaded[file_path] = (stamp, stats)
+        _loaded.move_to_end(file_path)
+        while len(_loaded) > CORRELATION_CACHE_ENTRIES:
+            _loaded.popitem(last=False)
+
+
+def save_correlation_stats(file_path, stats):
+    """保存数据文件的相关系数统计量，并记录数据文件的版本戳"""
+    path = correlation_path(file_path)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        stamp = _source_stamp(file_path)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'source': stamp, 'stats': stats.to_dict()}, f)
+        os.replace(tmp_path, path)
+        _remember(file_path, stamp, stats)
+        return True
+    except Exception as e:
+        print(f"保存相关系数统计量失败: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def load_correlation_stats(file_path):
+    """读取数据文件的相关系数统计量，文件不存在或与数据文件不一致时返回None
+
+    读取过的统计量在进程内缓存，数据文件未变化时不再重复解析。
+    """
+    path = correlation_path(file_path)
+    if not os.path.exists(path) or not os.path.exists(file_path):
+        return None
+    try:
+        stamp = _source_stamp(file_path)
+        with _loaded_lock:
+            cached = _loaded.get(file_path)
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('source') != stamp:
+            return None
+        stats = CorrelationStats.from_dict(data['stats'])
+        _remember(file_path, stamp, stats)
+        return stats
+    except Exception:
+        return None
+
+
+def remove_correlation_stats(file_path):
+    """删除数据文件对应的相关系数统计量"""
+    with _loaded_lock:
+        _loaded.pop(file_path, None)
+    path = correlation_path(file_path)
+    if os.path.exists(path):
+        os.remove(path)
@@ -1,141 +1,168 @@
 import pandas as pd
 import numpy as np
 import os
-from sklearn.preprocessing import LabelEncoder
-import itertools
+from app.services import columnar_cache, snapshot_cache
+from app.services.profiler import build_profiler, update_profile, frame_statistics
+from app.services.sketches import SKETCH_MIN_ROWS, build_sketches, load_sketches, save_sketches
+from app.services.correlation import build_correlation_stats, save_correlation_stats
+from app.services.clean_planner import run_plan
+from app.services.duplicate_finder import find_duplicate_keys
 
-def read_file(file_path, file_type):
-    """读取数据文件"""
+# 列组合中重复行的比例不超过该值时，才认为该组合可以标识记录并给出去重建议
+DUPLICATE_KEY_RATIO = 0.05
+
+def parse_file(file_path, file_type, columns=None):
+    """直接解析原始的CSV/Excel文件"""
     if file_type == 'csv':
-        return pd.read_csv(file_path)
+        return pd.read_csv(file_path, usecols=columns)
     elif file_type in ['xlsx', 'xls']:
-        return pd.read_excel(file_path)
+        return pd.read_excel(file_path, usecols=columns)
+    elif file_type == 'parquet':
+        return pd.read_parquet(file_path, columns=columns)
     else:
         raise ValueError(f"不支持的文件类型: {file_type}")
 
+def read_file(file_path, file_type, columns=None, use_cache=True):
+    """读取数据文件
+
+    优先读取列式缓存；缓存不存在或已过期时解析原始文件，并重新生成缓存。
+    指定columns时只读取这些列。
+    """
+    if not use_cache:
+        return parse_file(file_path, file_type, columns=columns)
+    
+    if columnar_cache.is_fresh(file_path):
+        return columnar_cache.read_sidecar(file_path, columns=columns)
+    
+    df = parse_file(file_path, file_type)
+    columnar_cache.write_sidecar(df, file_path)
+    
+    if columns is not None:
+        df = df[list(columns)]
+    return df
+
+def iter_chunks(file_path, file_type, chunksize=50000, columns=None):
+    """按块读取数据文件，每次返回一个DataFrame，内存占用与文件大小无关
+
+    优先按批次读取列式缓存；没有缓存时CSV文件使用分块解析。
+    Excel文件不支持分块解析，只能整体读取后再分块返回。
+    """
+    if columnar_cache.is_fresh(file_path):
+        for batch in columnar_cache.iter_batches(file_path, chunksize, columns=columns):
+            yield batch.to_pandas()
+    elif file_type == 'csv':
+        yield from pd.read_csv(file_path, chunksize=chunksize, usecols=columns)
+    else:
+        df = read_file(file_path, file_type, columns=columns)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start:start + chunksize]
+
+def read_head(file_path, file_type, rows=10):
+    """只读取数据文件的前几行，不加载整个文件"""
+    if columnar_cache.is_fresh(file_path):
+        return columnar_cache.read_sidecar_head(file_path, rows)
+    if file_type == 'csv':
+        return pd.read_csv(file_path, nrows=rows)
+    elif file_type in ['xlsx', 'xls']:
+        return pd.read_excel(file_path, nrows=rows)
+    elif file_type == 'parquet':
+        return pd.read_parquet(file_path).head(rows)
+    else:
+        raise ValueError(f"不支持的文件类型: {file_type}")
+
+def read_preview(file_path, file_type, rows=10):
+    """读取前几行作为预览，开销只与预览行数有关"""
+    try:
+        df = read_head(file_path, file_type, rows)
+        # 将 NaN 值替换为 None，这样在 JSON 序列化时会变成 null
+        return df.replace({np.nan: None}).to_dict(orient='records')
+    except Exception:
+        return []
+
 def preview_data(file_path, file_type, rows=10):
-    """预览数据，返回前几行、总行数和列信息"""
+    """预览数据，返回前几行、总行数和列信息
+
+    读取整个文件一次并生成列统计信息（上传时调用，结果保存在Dataset.columns中），
+    之后查看数据集时使用read_preview和保存的列信息即可。
+    """
     try:
         df = read_file(file_path, file_type)
         
         # 获取列信息
-        columns = []
-        for col in df.columns:
-            dtype = str(df[col].dtype)
-            # 判断数据类型
-            if np.issubdtype(df[col].dtype, np.number):
-                data_type = 'numeric'
-            elif dtype == 'object':
-                data_type = 'categorical'
-            else:
-                data_type = 'other'
-                
-            columns.append({
-                'name': col,
-                'type': data_type,
-                'missing_count': int(df[col].isna().sum()),
-                'unique_count': int(df[col].nunique())
-            })
+        profiler = build_profiler(df)
+        columns = profiler.result()
+        # 数据较大时保存统计过程中生成的分位数草图，之后计算IQR边界等无需再排序整列；
+        # 同时保存相关系数统计量，热图无需再读取数据
+        if len(df) >= SKETCH_MIN_ROWS:
+            save_sketches(file_path, profiler.sketches())
+            save_correlation_stats(file_path, build_correlation_stats([df]))
         
         # 将 NaN 值替换为 None，这样在 JSON 序列化时会变成 null
-        df = df.replace({np.nan: None})
-        
-        # 转换为列表形式，便于JSON序列化
-        preview_data = df.head(rows).to_dict(orient='records')
+        preview_data = df.head(rows).replace({np.nan: None}).to_dict(orient='records')
         
         return preview_data, len(df), columns
-    except Exception as e:
+    except Exception:
         return [], 0, []
 
-def clean_data(file_path, file_type, operations):
-    """根据指定的操作清洗数据"""
+def get_sketches(file_path, file_type):
+    """返回数据文件各数值列的分位数草图
+
+    优先读取保存的草图；不存在或已过期时按块遍历一次数据生成草图并保存。
+    """
+    column_sketches = load_sketches(file_path)
+    if column_sketches is None:
+        column_sketches = build_sketches(iter_chunks(file_path, file_type))
+        save_sketches(file_path, column_sketches)
+    return column_sketches
+
+def write_version(df, output_path):
+    """将清洗结果写为新的数据集版本文件，返回(文件路径, 文件类型)
+
+    output_path为不带扩展名的路径。优先写为parquet（读取时无需解析，也不需要再建缓存），
+    无法写为parquet时退回CSV。先写临时文件再替换，读取方不会看到写了一半的文件。
+    """
+    if columnar_cache.write_parquet(df, output_path + '.parquet'):
+        return output_path + '.parquet', 'parquet'
+    
+    path = output_path + '.csv'
+    df.to_csv(path + '.tmp', index=False)
+    os.replace(path + '.tmp', path)
+    columnar_cache.write_sidecar(df, path)
+    return path, 'csv'
+
+def clean_data(file_path, file_type, operations, profile=None, output_path=None,
+               source_key=None, result_key=None, cache_bytes=0):
+    """根据指定的操作清洗数据
+
+    profile为清洗前保存的列信息，用于增量更新列统计信息。
+    清洗结果写为新的版本文件（output_path为不带扩展名的路径），原文件保持不变，
+    返回结果中的file_path和file_type为新版本文件；output_path为空时只返回预览，不保存结果。
+    source_key/result_key为清洗前后数据版本的键，数据会保存在内存缓存中（总大小不超过cache_bytes），
+    在此基础上继续清洗时无需重新读取文件。
+    数据较大时，未修改过的列的中位数和IQR边界取自分位数草图；
+    操作中指定 'exact': True 时精确计算。
+    """
+    if output_path is not None:
+        # 在函数内导入，避免与chunked_cleaner循环导入
+        from app.services.chunked_cleaner import should_use_chunks, clean_data_chunked
+        if should_use_chunks(file_path, file_type):
+            # 大文件按块清洗，不读入整个数据集（也不放入内存缓存）
+            return clean_data_chunked(file_path, file_type, operations, output_path)
+    
     try:
-        df = read_file(file_path, file_type)
+        df = snapshot_cache.get(source_key)
+        if df is None:
+            df = read_file(file_path, file_type)
+            snapshot_cache.put(source_key, df, cache_bytes)
         original_count = len(df)
         original_columns = list(df.columns)
         
-        for op in operations:
-            op_type = op.get('type')
-            column = op.get('column')
-            
-            if op_type == 'drop_column':
-                # 删除列
-                df = df.drop(columns=[column])
-                
-            elif op_type == 'fill_na':
-                # 填充缺失值
-                method = op.get('method', 'mean')
-                value = op.get('value')
-                
-                if method == 'drop':
-                    # 删除含有缺失值的行
-                    df = df.dropna(subset=[column])
-                elif method == 'mean' and pd.api.types.is_numeric_dtype(df[column]):
-                    df[column] = df[column].fillna(df[column].mean())
-                elif method == 'median' and pd.api.types.is_numeric_dtype(df[column]):
-                    df[column] = df[column].fillna(df[column].median())
-                elif method == 'mode':
-                    df[column] = df[column].fillna(df[column].mode()[0])
-                elif method == 'value' and value is not None:
-                    df[column] = df[column].fillna(value)
-                    
-            elif op_type == 'drop_na':
-                # 删除包含缺失值的行
-                df = df.dropna(subset=[column])
-                
-            elif op_type == 'drop_duplicates':
-                # 删除重复行
-                columns = op.get('columns', [])
-                keep = op.get('keep', 'first')
-                
-                if columns:
-                    df = df.drop_duplicates(subset=columns, keep=keep)
-                else:
-                    df = df.drop_duplicates(keep=keep)
-                    
-            elif op_type == 'handle_outliers':
-                # 处理异常值
-                if pd.api.types.is_numeric_dtype(df[column]):
-                    method = op.get('method', 'drop')
-                    threshold = op.get('threshold', 1.5)
-                    
-                    # 计算IQR和异常值边界
-                    Q1 = df[column].quantile(0.25)
-                    Q3 = df[column].quantile(0.75)
-                    IQR = Q3 - Q1
-                    lower_bound = Q1 - threshold * IQR
-                    upper_bound = Q3 + threshold * IQR
-                    
-                    if method == 'drop':
-                        # 删除异常值
-                        df = df[(df[column] >= lower_bound) & (df[column] <= upper_bound)]
-                    elif method == 'cap':
-                        # 截断异常值
-                        df[column] = df[column].clip(lower=lower_bound, upper=upper_bound)
-                    
-            elif op_type == 'remove_outliers':
-                # 移除异常值 (使用IQR方法)
-                if pd.api.types.is_numeric_dtype(df[column]):
-                    Q1 = df[column].quantile(0.25)
-                    Q3 = df[column].quantile(0.75)
-                    IQR = Q3 - Q1
-                    lower_bound = Q1 - 1.5 * IQR
-                    upper_bound = Q3 + 1.5 * IQR
-                    df = df[(df[column] >= lower_bound) & (df[column] <= upper_bound)]
-                    
-            elif op_type == 'categorical_encoding':
-                # 分类变量编码
-                method = op.get('method', 'one_hot')
-                
-                if method == 'one_hot':
-                    # 独热编码
-                    dummies = pd.get_dummies(df[column], prefix=column)
-                    df = pd.concat([df.drop(column, axis=1), dummies], axis=1)
-                    
-                elif method == 'label':
-                    # 标签编码
-                    le = LabelEncoder()
-                    df[column] = le.fit_transform(df[column])
+        # 将操作列表编译为执行计划：删除行的条件合并为一个掩码，统计量按阶段批量计算，
+        # 只在最后生成一次结果
+        column_sketches = get_sketches(file_path, file_type) if original_count >= SKETCH_MIN_ROWS else None
+        df = run_plan(df, operations, column_sketches)
+        
+        snapshot_cache.put(result_key, df, cache_bytes)
         
         # 计算行列变化情况
         cleaned_count = len(df)
@@ -143,52 +170,33 @@ def clean_data(file_path, file_type, operations):
         column_count = len(df.columns)
         added_column_count = len(df.columns) - len(original_columns)
         
-        # 创建备份文件（但不作为主要修改文件）
-        backup_path = file_path + '.bak'
-        if not os.path.exists(backup_path):
-            if file_type == 'csv':
-                read_file(file_path, file_type).to_csv(backup_path, index=False)
-            else:
-                read_file(file_path, file_type).to_excel(backup_path, index=False)
-        
-        # 直接保存到原始文件
-        if file_type == 'csv':
-            df.to_csv(file_path, index=False)
-        else:
-            df.to_excel(file_path, index=False)
+        # 保存为新版本，原文件不修改，也无需再读取一次原文件做备份
+        version_path, version_type = None, None
+        if output_path is not None:
+            version_path, version_type = write_version(df, output_path)
+            if cleaned_count >= SKETCH_MIN_ROWS:
+                save_correlation_stats(version_path, build_correlation_stats([df]))
             
-        # 将 NaN 值替换为 None，这样在 JSON 序列化时会变成 null
-        df_preview = df.replace({np.nan: None})
+        # 将 NaN 值替换为 None，这样在 JSON 序列化时会变成 null（只处理预览的行）
+        df_preview = df.head(10).replace({np.nan: None})
         
         # 获取列信息 (与 preview_data 函数返回格式保持一致)
-        columns_info = []
-        for col in df.columns:
-            dtype = str(df[col].dtype)
-            # 判断数据类型
-            if np.issubdtype(df[col].dtype, np.number):
-                data_type = 'numeric'
-            elif dtype == 'object':
-                data_type = 'categorical'
-            else:
-                data_type = 'other'
-                
-            columns_info.append({
-                'name': col,
-                'type': data_type,
-                'missing_count': int(df[col].isna().sum()),
-                'unique_count': int(df[col].nunique())
-            })
+        # 清洗操作只会删除行，行数不变说明只有操作涉及的列发生了变化
+        changed_columns = {op.get('column') for op in operations if op.get('column')}
+        columns_info = update_profile(profile, df, changed_columns, cleaned_count != original_count)
             
         # 返回清洗后的预览和统计信息
         return {
             'success': True,
-            'preview': df_preview.head(10).to_dict(orient='records'),
+            'preview': df_preview.to_dict(orient='records'),
             'original_count': original_count,
             'cleaned_count': cleaned_count,
             'removed_count': removed_count,
             'column_count': column_count,
             'added_column_count': added_column_count,
-            'columns': columns_info
+            'columns': columns_info,
+            'file_path': version_path,
+            'file_type': version_type
         }
     except Exception as e:
         return {
@@ -196,12 +204,12 @@ def clean_data(file_path, file_type, operations):
             'error': str(e)
         }
 
-def detect_missing_values(df):
+def detect_missing_values(df, stats=None):
     """检测缺失值并生成清洗建议"""
+    stats = stats or frame_statistics(df)
     suggestions = []
     
-    for col in df.columns:
-        missing_count = df[col].isna().sum()
+    for col, missing_count in stats['missing'].items():
         if missing_count > 0:
             missing_ratio = missing_count / len(df)
             
@@ -234,34 +242,25 @@ def detect_missing_values(df):
     
     return suggestions
 
-def detect_outliers(df):
-    """检测异常值并生成清洗建议"""
+def detect_outliers(df, stats=None):
+    """检测异常值并生成清洗建议（使用IQR方法，异常值个数由frame_statistics统一计算）"""
+    stats = stats or frame_statistics(df)
     suggestions = []
     
-    for col in df.columns:
-        if pd.api.types.is_numeric_dtype(df[col]):
-            # 使用IQR方法检测异常值
-            Q1 = df[col].quantile(0.25)
-            Q3 = df[col].quantile(0.75)
-            IQR = Q3 - Q1
-            lower_bound = Q1 - 1.5 * IQR
-            upper_bound = Q3 + 1.5 * IQR
-            
-            outliers = df[(df[col] < lower_bound) | (df[col] > upper_bound)]
-            outlier_count = len(outliers)
-            
-            if outlier_count > 0 and outlier_count < len(df) * 0.1:  # 少于10%是异常值
-                suggestions.append({
-                    'type': 'remove_outliers',
-                    'column': col,
-                    'reason': f'发现{outlier_count}个异常值',
-                    'priority': 'medium'
-                })
+    for col, outlier_count in stats['outlier_counts'].items():
+        if outlier_count > 0 and outlier_count < len(df) * 0.1:  # 少于10%是异常值
+            suggestions.append({
+                'type': 'remove_outliers',
+                'column': col,
+                'reason': f'发现{outlier_count}个异常值',
+                'priority': 'medium'
+            })
     
     return suggestions
 
-def detect_duplicates(df):
+def detect_duplicates(df, stats=None):
     """检测重复数据并生成清洗建议"""
+    stats = stats or frame_statistics(df)
     suggestions = []
     
     # 检查整行重复
@@ -280,25 +279,26 @@ def detect_duplicates(df):
     
     # 检查特定列组合的重复
     # 针对分类型和ID型特征列查找可能的重复
-    categorical_columns = [col for col in df.columns if df[col].dtype == 'object' and df[col].nunique() < len(df) * 0.5]
+    categorical_columns = [col for col, nunique in stats['nunique'].items() if nunique < len(df) * 0.5]
+    # 唯一值较多的列更可能是记录的标识，优先检查
+    categorical_columns.sort(key=lambda col: stats['nunique'][col], reverse=True)
     
     # 尝试常见的ID列名
     id_columns = [col for col in df.columns if 'id' in col.lower() or 'key' in col.lower() or 'code' in col.lower()]
     
-    # 组合这些列查找重复
-    columns_to_check = categorical_columns + id_columns
-    if len(columns_to_check) > 1 and len(columns_to_check) < 5:  # 只检查少量列的组合，避免计算太复杂
-        for i in range(2, min(4, len(columns_to_check) + 1)):
-            for columns_combo in itertools.combinations(columns_to_check, i):
-                duplicate_count = df.duplicated(subset=list(columns_combo)).sum()
-                if duplicate_count > 0:
-                    suggestions.append({
-                        'type': 'drop_duplicates',
-                        'columns': list(columns_combo),
-                        'keep': 'first',
-                        'reason': f'在列 {", ".join(columns_combo)} 中发现{duplicate_count}条重复记录',
-                        'priority': 'medium'
-                    })
+    # 组合这些列查找重复：每列只编码一次，组合之间共用编码结果
+    columns_to_check = id_columns + categorical_columns
+    for columns_combo, duplicate_count in find_duplicate_keys(df, columns_to_check):
+        # 只有组合几乎能唯一确定一行时，重复的值才可能是重复记录
+        if duplicate_count > len(df) * DUPLICATE_KEY_RATIO:
+            continue
+        suggestions.append({
+            'type': 'drop_duplicates',
+            'columns': list(columns_combo),
+            'keep': 'first',
+            'reason': f'在列 {", ".join(columns_combo)} 中发现{duplicate_count}条重复记录',
+            'priority': 'medium'
+        })
     
     return suggestions
 
@@ -307,27 +307,31 @@ def auto_suggest_cleaning(file_path, file_type):
     try:
         df = read_file(file_path, file_type)
         
+        # 所有建议共用一次向量化计算得到的统计量，数据较大时四分位数取自分位数草图
+        column_sketches = get_sketches(file_path, file_type) if len(df) >= SKETCH_MIN_ROWS else None
+        stats = frame_statistics(df, sketches=column_sketches)
+        
         suggestions = []
         
         # 检测缺失值
-        missing_suggestions = detect_missing_values(df)
+        missing_suggestions = detect_missing_values(df, stats)
         suggestions.extend(missing_suggestions)
         
         # 检测重复数据
-        duplicate_suggestions = detect_duplicates(df)
+        duplicate_suggestions = detect_duplicates(df, stats)
         suggestions.extend(duplicate_suggestions)
         
         # 检测异常值
-        outlier_suggestions = detect_outliers(df)
+        outlier_suggestions = detect_outliers(df, stats)
         suggestions.extend(outlier_suggestions)
         
         # 检测分类变量，提供编码建议
-        for col in df.columns:
-            if df[col].dtype == 'object' and df[col].nunique() < len(df) * 0.2:  # 唯一值较少的列
+        for col, nunique in stats['nunique'].items():
+            if nunique < len(df) * 0.2:  # 唯一值较少的列
                 suggestions.append({
                     'type': 'categorical_encoding',
                     'column': col,
-                    'method': 'one_hot' if df[col].nunique() < 10 else 'label',
+                    'method': 'one_hot' if nunique < 10 else 'label',
                     'reason': f'分类变量，建议进行编码',
                     'priority': 'low'
                 })
@@ -0,0 +1,94 @@
+import io
+from app.services import columnar_cache
+from app.services.data_cleaner import iter_chunks, read_head
+
+# 流式导出每块的行数
+EXPORT_CHUNK_ROWS = 50000
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+CSV_MIMETYPE = 'text/csv'
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+# format参数与MIME类型的对应关系
+EXPORT_FORMATS = {
+    'ndjson': NDJSON_MIMETYPE,
+    'csv': CSV_MIMETYPE,
+    'arrow': ARROW_MIMETYPE
+}
+
+
+def stream_ndjson(file_path, file_type, chunksize=EXPORT_CHUNK_ROWS):
+    """逐块生成NDJSON（每行一个JSON对象）"""
+    for chunk in iter_chunks(file_path, file_type, chunksize):
+        if len(chunk) == 0:
+            continue
+        text = chunk.to_json(orient='records', lines=True, force_ascii=False, date_format='iso')
+        yield text.rstrip('\n') + '\n'
+
+
+def stream_csv(file_path, file_type, chunksize=EXPORT_CHUNK_ROWS):
+    """逐块生成CSV，只在第一块输出表头"""
+    header = True
+    for chunk in iter_chunks(file_path, file_type, chunksize):
+        yield chunk.to_csv(index=False, header=header)
+        header = False
+    if header:
+        # 空数据集也返回表头
+        yield read_head(file_path, file_type, 0).to_csv(index=False)
+
+
+def _drain(sink):
+    """取出缓冲区中已写入的数据并清空缓冲区"""
+    data = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return data
+
+
+def _arrow_batches(file_path, file_type, chunksize):
+    """逐批返回RecordBatch，有列式缓存时直接读取，不经过pandas转换"""
+    import pyarrow as pa
+
+    if columnar_cache.is_fresh(file_path):
+        yield from columnar_cache.iter_batches(file_path, chunksize)
+        return
+
+    schema = None
+    for chunk in iter_chunks(file_path, file_type, chunksize):
+        # 分块解析CSV时各块推断的类型可能不同，统一转换为第一块的类型
+        table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+        schema = table.schema
+        yield from table.to_batches()
+
+
+def stream_arrow(file_path, file_type, chunksize=EXPORT_CHUNK_ROWS):
+    """逐批生成Arrow IPC流格式的数据"""
+    import pyarrow as pa
+
+    sink = io.BytesIO()
+    writer = None
+    for batch in _arrow_batches(file_path, file_type, chunksize):
+        if writer is None:
+            writer = pa.ipc.new_stream(sink, batch.schema)
+        writer.write_batch(batch)
+        yield _drain(sink)
+
+    if writer is None:
+        # 空数据集只输出schema
+        schema = pa.Schema.from_pandas(read_head(file_path, file_type, 0), preserve_index=False)
+        writer = pa.ipc.new_stream(sink, schema)
+    writer.close()
+    yield _drain(sink)
+
+
+def stream_export(file_path, file_type, mimetype):
+    """根据MIME类型返回对应的数据生成器"""
+    if mimetype == NDJSON_MIMETYPE:
+        return stream_ndjson(file_path, file_type)
+    elif mimetype == CSV_MIMETYPE:
+        return stream_csv(file_path, file_type)
+    elif mimetype == ARROW_MIMETYPE:
+        if not columnar_cache.is_available():
+            raise ValueError("服务器未安装pyarrow，不支持Arrow格式")
+        return stream_arrow(file_path, file_type)
+    raise ValueError(f"不支持的导出格式: {mimetype}")
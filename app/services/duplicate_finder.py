@@ -0,0 +1,90 @@
+import itertools
+import numpy as np
+import pandas as pd
+
+# 参与组合检查的候选列个数上限
+MAX_KEY_COLUMNS = 10
+# 检查的列组合大小
+COMBINATION_SIZES = (2, 3)
+# 组合编码的取值范围不超过行数的这么多倍时，直接用计数数组统计唯一值
+BINCOUNT_FACTOR = 4
+# 组合编码的取值上限，超过时先把前缀组合压缩为连续编码，避免int64溢出
+CODE_LIMIT = 2 ** 62
+
+
+class KeyCodes:
+    """把候选列各自编码一次，之后通过组合整数编码检查任意列组合的重复情况
+
+    每列只做一次factorize（缺失值也作为一个取值，与DataFrame.duplicated一致），
+    列组合的编码由已有组合的编码与新列的编码相乘相加得到，前缀组合的结果会被缓存，
+    不需要对每个组合重新哈希原始数据。
+    组合编码的取值范围始终不超过行数的BINCOUNT_FACTOR倍，唯一值个数用计数数组精确统计，
+    每个组合的开销与行数成线性关系。
+    """
+
+    def __init__(self, df, columns):
+        self.row_count = len(df)
+        self._codes = {}
+        for col in columns:
+            codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+            self._codes[(col,)] = (codes.astype(np.int64), len(uniques))
+
+    def codes(self, combo):
+        """返回列组合的整数编码（取值范围为 [0, 基数)）以及基数"""
+        combo = tuple(combo)
+        if combo in self._codes:
+            return self._codes[combo]
+
+        prefix_codes, prefix_size = self.codes(combo[:-1])
+        last_codes, last_size = self.codes(combo[-1:])
+        if prefix_size * last_size < CODE_LIMIT:
+            combined = prefix_codes * last_size + last_codes
+            size = prefix_size * last_size
+        else:
+            # 编码可能溢出时先把前缀组合压缩为连续编码
+            prefix_codes, uniques = pd.factorize(prefix_codes)
+            combined = prefix_codes.astype(np.int64) * last_size + last_codes
+            size = len(uniques) * last_size
+
+        # 取值范围过大时压缩为连续编码，便于后续组合继续相乘
+        if size > BINCOUNT_FACTOR * max(self.row_count, 1):
+            combined, uniques = pd.factorize(combined)
+            combined = combined.astype(np.int64)
+            size = len(uniques)
+
+        self._codes[combo] = (combined, size)
+        return combined, size
+
+    def distinct_count(self, combo):
+        codes, size = self.codes(combo)
+        return int(np.count_nonzero(np.bincount(codes, minlength=size)))
+
+    def duplicate_count(self, combo):
+        """与 df.duplicated(subset=combo).sum() 相同"""
+        return max(self.row_count - self.distinct_count(combo), 0)
+
+
+def find_duplicate_keys(df, columns, sizes=COMBINATION_SIZES, max_columns=MAX_KEY_COLUMNS):
+    """检查候选列的组合中的重复记录
+
+    返回:
+        (列组合, 重复行数) 的列表，按列组合的生成顺序排列，只包含有重复的组合
+    """
+    columns = list(dict.fromkeys(columns))[:max_columns]
+    if len(columns) < 2:
+        return []
+
+    engine = KeyCodes(df, columns)
+    results = []
+    # 某个组合没有重复时，包含它的更大组合也不会有重复，直接跳过
+    unique_combos = set()
+    for size in sizes:
+        for combo in itertools.combinations(columns, size):
+            if any(sub in unique_combos for sub in itertools.combinations(combo, size - 1)):
+                continue
+            duplicate_count = engine.duplicate_count(combo)
+            if duplicate_count > 0:
+                results.append((combo, duplicate_count))
+            else:
+                unique_combos.add(combo)
+    return results
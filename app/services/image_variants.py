@@ -0,0 +1,98 @@
+import os
+import uuid
+import hashlib
+import threading
+from collections import OrderedDict
+
+# 图表图片的尺寸（原图或缩略图）和格式
+IMAGE_SIZES = ('full', 'thumb')
+IMAGE_FORMATS = {'png': 'image/png', 'webp': 'image/webp'}
+# 缩略图的最大宽高（保持宽高比）
+THUMBNAIL_SIZE = (320, 192)
+WEBP_QUALITY = 80
+# 进程内缓存的图片内容哈希个数
+CONTENT_HASH_ENTRIES = 4096
+
+_hashes = OrderedDict()
+_hashes_lock = threading.Lock()
+
+
+def webp_available():
+    """Pillow编译时未包含WebP支持时返回False，此时WebP请求退回为PNG"""
+    try:
+        from PIL import features
+        return bool(features.check('webp'))
+    except Exception:
+        return False
+
+
+def content_hash(image_path):
+    """图片内容的sha256，用作ETag和URL中的版本参数
+
+    按(路径, inode, 大小)在进程内缓存：图片只会整体替换（os.replace得到新的inode），
+    渲染缓存命中时更新修改时间不会使缓存失效。
+    """
+    stat = os.stat(image_path)
+    key = (image_path, stat.st_ino, stat.st_size)
+    with _hashes_lock:
+        digest = _hashes.get(key)
+        if digest is not None:
+            _hashes.move_to_end(key)
+            return digest
+
+    sha = hashlib.sha256()
+    with open(image_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(block)
+    digest = sha.hexdigest()
+
+    with _hashes_lock:
+        _hashes[key] = digest
+        while len(_hashes) > CONTENT_HASH_ENTRIES:
+            _hashes.popitem(last=False)
+    return digest
+
+
+def variant_path(image_path, size, fmt):
+    """图片变体的路径，与原图放在同一目录下，如 bar_<key>.thumb.webp；原尺寸的PNG即原图"""
+    if size == 'full' and fmt == 'png':
+        return image_path
+    root, _ = os.path.splitext(image_path)
+    return f"{root}.{size}.{fmt}"
+
+
+def remove_variants(image_path):
+    """删除由原图生成的全部变体（原图重新生成后，下次请求时按新图片生成变体）"""
+    for size in IMAGE_SIZES:
+        for fmt in IMAGE_FORMATS:
+            path = variant_path(image_path, size, fmt)
+            if path != image_path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+
+
+def get_variant(image_path, size='full', fmt='png'):
+    """返回图片变体的路径，变体不存在时由原图生成（每个变体只生成一次）"""
+    path = variant_path(image_path, size, fmt)
+    if os.path.exists(path):
+        return path
+
+    from PIL import Image
+    with Image.open(image_path) as image:
+        image = image.convert('RGBA')
+        if size == 'thumb':
+            image.thumbnail(THUMBNAIL_SIZE, Image.LANCZOS)
+        # 先写临时文件再改名，并发请求不会读到写了一半的图片
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            if fmt == 'webp':
+                image.save(tmp_path, format='WEBP', quality=WEBP_QUALITY, method=4)
+            else:
+                image.save(tmp_path, format='PNG', optimize=True)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return path
@@ -0,0 +1,286 @@
+import os
+import json
+import uuid
+import threading
+import multiprocessing
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# 任务状态
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED_STATUSES = {SUCCEEDED, FAILED, CANCELLED}
+
+# 本进程中的工作进程池和已提交任务的Future
+_executor = None
+_executor_lock = threading.Lock()
+_futures = {}
+_process_started_at = datetime.utcnow()
+_recovered = False
+
+# 工作进程中当前正在执行的任务
+_current_job = None
+# 工作进程中连接数据库的引擎（按数据库URI缓存），用于在任务开始时更新任务记录
+_engines = {}
+
+
+class JobCancelled(Exception):
+    """任务被取消，由report_progress在工作进程中抛出"""
+
+
+def _progress_path(job_dir, job_id):
+    return os.path.join(job_dir, f'{job_id}.progress')
+
+
+def _cancel_path(job_dir, job_id):
+    return os.path.join(job_dir, f'{job_id}.cancel')
+
+
+def report_progress(fraction, message=''):
+    """在任务中报告进度（0~1），进度写入任务目录下的文件，由查询状态的请求读取
+
+    任务已被取消时抛出JobCancelled，任务在下一个检查点停止。
+    不在后台任务中执行（同步调用）时不做任何事。
+    """
+    if _current_job is None:
+        return
+    job_dir, job_id, started_at = _current_job
+    if os.path.exists(_cancel_path(job_dir, job_id)):
+        raise JobCancelled('任务已取消')
+
+    path = _progress_path(job_dir, job_id)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'progress': float(fraction), 'message': message, 'started_at': started_at}, f)
+    os.replace(path + '.tmp', path)
+
+
+def _mark_running(database_uri, job_id, started_at):
+    """在工作进程中把任务记录更新为running（只更新仍在排队的任务），失败时只打印提示"""
+    try:
+        from sqlalchemy import create_engine
+        from app.models.job import Job
+        engine = _engines.get(database_uri)
+        if engine is None:
+            engine = _engines[database_uri] = create_engine(database_uri)
+        jobs = Job.__table__
+        with engine.begin() as conn:
+            conn.execute(jobs.update()
+                         .where(jobs.c.id == job_id)
+                         .where(jobs.c.status == QUEUED)
+                         .values(status=RUNNING, started_at=started_at))
+    except Exception as e:
+        print(f"更新任务状态失败: {job_id}, {str(e)}")
+
+
+def _run_task(job_dir, job_id, task, kwargs, database_uri=None):
+    """在工作进程中执行任务，开始执行时把任务记录更新为running"""
+    global _current_job
+    started_at = datetime.utcnow()
+    _current_job = (job_dir, job_id, started_at.isoformat())
+    if database_uri is not None:
+        _mark_running(database_uri, job_id, started_at)
+    try:
+        report_progress(0.0, '开始执行')
+        return task(**kwargs)
+    finally:
+        _current_job = None
+
+
+def _read_progress(job_dir, job_id):
+    try:
+        with open(_progress_path(job_dir, job_id), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _remove_files(job_dir, job_id):
+    for path in (_progress_path(job_dir, job_id), _cancel_path(job_dir, job_id)):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _get_executor(app):
+    """按需创建工作进程池
+
+    使用spawn方式启动工作进程：Web服务进程中有多个线程，fork可能复制其他线程持有的锁。
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=app.config['JOB_WORKERS'],
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def _reset_executor():
+    """工作进程异常退出后进程池不可再用，下次提交时重新创建"""
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+
+def _recover_interrupted():
+    """本进程启动之前创建、仍未结束的任务已随上一个进程中断，标记为失败"""
+    global _recovered
+    if _recovered:
+        return
+    from app import db
+    from app.models.job import Job
+    Job.query.filter(Job.status.in_([QUEUED, RUNNING]),
+                     Job.created_at < _process_started_at).update(
+        {'status': FAILED, 'error': '服务重启，任务已中断', 'finished_at': datetime.utcnow()},
+        synchronize_session=False)
+    db.session.commit()
+    _recovered = True
+
+
+def _finish(app, job_id, future, on_success):
+    """任务结束后（在进程池的回调线程中）更新任务记录"""
+    from app import db
+    from app.models.job import Job
+    job_dir = app.config['JOB_FOLDER']
+    with app.app_context():
+        try:
+            job = Job.query.get(job_id)
+            progress = _read_progress(job_dir, job_id)
+            if progress is not None and progress.get('started_at'):
+                job.started_at = datetime.fromisoformat(progress['started_at'])
+
+            if future.cancelled():
+                job.status = CANCELLED
+            else:
+                error = future.exception()
+                if isinstance(error, JobCancelled):
+                    job.status = CANCELLED
+                elif error is not None:
+                    if isinstance(error, BrokenProcessPool):
+                        _reset_executor()
+                    job.status = FAILED
+                    job.error = str(error) or error.__class__.__name__
+                else:
+                    result = future.result()
+                    # 需要写数据库的后续处理（保存版本、模型记录等）在服务进程中完成
+                    if on_success is not None:
+                        result = on_success(result)
+                    if isinstance(result, dict) and result.get('success') is False:
+                        job.status = FAILED
+                        job.error = result.get('error')
+                    else:
+                        job.status = SUCCEEDED
+                        job.progress = 1.0
+                        job.result = json.dumps(result)
+        except Exception as e:
+            db.session.rollback()
+            job = Job.query.get(job_id)
+            job.status = FAILED
+            job.error = str(e)
+            print(f"任务结果处理失败: {job_id}, {str(e)}")
+        finally:
+            job.finished_at = datetime.utcnow()
+            db.session.commit()
+            _futures.pop(job_id, None)
+            _remove_files(job_dir, job_id)
+
+
+def submit(app, kind, user_id, task, kwargs, params=None, on_success=None):
+    """提交后台任务，立即返回任务记录
+
+    task为模块级函数（在工作进程中以kwargs调用，参数和返回值需要可以pickle），
+    on_success在任务成功后于服务进程中调用，参数为任务的返回值，返回值作为任务结果保存。
+    """
+    from app import db
+    from app.models.job import Job
+    _recover_interrupted()
+
+    job = Job(id=uuid.uuid4().hex, user_id=user_id, kind=kind, status=QUEUED,
+              params=json.dumps(params or {}, default=str))
+    db.session.add(job)
+    db.session.commit()
+
+    job_dir = app.config['JOB_FOLDER']
+    os.makedirs(job_dir, exist_ok=True)
+    database_uri = db.engine.url.render_as_string(hide_password=False)
+    args = (_run_task, job_dir, job.id, task, kwargs, database_uri)
+    try:
+        future = _get_executor(app).submit(*args)
+    except BrokenProcessPool:
+        _reset_executor()
+        future = _get_executor(app).submit(*args)
+    _futures[job.id] = future
+    future.add_done_callback(lambda f, job_id=job.id: _finish(app, job_id, f, on_success))
+    return job
+
+
+def record(kind, user_id, result, params=None):
+    """记录一个无需执行就已完成的任务（例如结果可以直接复用），返回任务记录"""
+    from app import db
+    from app.models.job import Job
+    now = datetime.utcnow()
+    job = Job(id=uuid.uuid4().hex, user_id=user_id, kind=kind, status=SUCCEEDED, progress=1.0,
+              params=json.dumps(params or {}, default=str), result=json.dumps(result),
+              started_at=now, finished_at=now)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def pending_count(user_id):
+    """用户排队中和正在执行的任务数"""
+    from app.models.job import Job
+    return Job.query.filter(Job.user_id == user_id, Job.status.in_([QUEUED, RUNNING])).count()
+
+
+def job_status(app, job):
+    """任务状态，未结束的任务附带工作进程报告的最新进度"""
+    status = job.to_dict()
+    if job.status not in FINISHED_STATUSES:
+        progress = _read_progress(app.config['JOB_FOLDER'], job.id)
+        if progress is not None:
+            status.update({
+                'status': RUNNING,
+                'progress': progress['progress'],
+                'message': progress['message'],
+                'started_at': progress['started_at']
+            })
+    return status
+
+
+def cancel(app, job):
+    """取消任务
+
+    排队中的任务直接取消；正在执行的任务写入取消标记，在下一次报告进度时停止。
+    返回False表示任务已经结束，无法取消。
+    """
+    if job.status in FINISHED_STATUSES:
+        return False
+
+    future = _futures.get(job.id)
+    if future is not None and future.cancel():
+        # 取消成功时回调已将任务标记为cancelled
+        return True
+
+    job_dir = app.config['JOB_FOLDER']
+    os.makedirs(job_dir, exist_ok=True)
+    open(_cancel_path(job_dir, job.id), 'w').close()
+    return True
+
+
+def wants_async(data):
+    """请求是否要求以后台任务方式执行（请求体中 "async": true）"""
+    return isinstance(data, dict) and bool(data.get('async'))
+
+
+def accepted_response(job):
+    """提交后台任务后返回给客户端的内容"""
+    return {
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/api/jobs/{job.id}',
+        'result_url': f'/api/jobs/{job.id}/result'
+    }
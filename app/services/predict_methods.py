@@ -9,14 +9,17 @@ from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 import xgboost as xgb
 from sklearn.metrics import mean_squared_error, r2_score
+from app.services.data_cleaner import read_file
 import warnings
 warnings.filterwarnings('ignore')
 
-def load_data(file_path: str) -> pd.DataFrame:
-    """加载CSV数据文件
+def load_data(file_path: str, file_type: str = 'csv', use_cache: bool = True) -> pd.DataFrame:
+    """加载数据文件
     
     Args:
-        file_path: CSV文件路径
+        file_path: 数据文件路径
+        file_type: 文件类型(csv, xlsx等)
+        use_cache: 是否使用列式缓存(临时文件不需要缓存)
         
     Returns:
         加载的数据DataFrame
@@ -27,7 +30,7 @@ def load_data(file_path: str) -> pd.DataFrame:
     
     # 尝试加载数据
     try:
-        df = pd.read_csv(file_path)
+        df = read_file(file_path, file_type, use_cache=use_cache)
         print(f"成功加载数据，共{len(df)}行，{len(df.columns)}列")
         return df
     except Exception as e:
@@ -222,16 +225,18 @@ def predict(test_features: pd.DataFrame, model_path: str, preprocessor_path: str
     
     return predictions, id_column
 
-def full_training_pipeline(train_file_path: str, model_save_path: str, preprocessor_save_path: str):
+def full_training_pipeline(train_file_path: str, model_save_path: str, preprocessor_save_path: str,
+                           file_type: str = 'csv'):
     """完整的训练流程
     
     Args:
         train_file_path: 训练数据文件路径
         model_save_path: 模型保存路径
         preprocessor_save_path: 预处理器保存路径
+        file_type: 训练数据文件类型
     """
     # 加载数据
-    df = load_data(train_file_path)
+    df = load_data(train_file_path, file_type)
     
     # 预处理数据
     features_df, target, _, preprocessor_objects = preprocess_data(df, training=True)
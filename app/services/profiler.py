@@ -0,0 +1,241 @@
+import numpy as np
+import pandas as pd
+from app.services.sketches import QuantileSketch
+
+# 每列保存的高频值个数
+TOP_K = 5
+# 高频值计数器的容量，超出后只保留计数最高的值（近似统计，避免高基数列占用过多内存）
+TOP_K_CAPACITY = 1000
+# 按块统计时每块的行数
+CHUNK_ROWS = 100000
+# 保存的分位数
+QUANTILES = [0.25, 0.5, 0.75]
+
+
+def column_type(dtype):
+    """将pandas的dtype归类为numeric/categorical/other，与原有的列信息格式保持一致"""
+    if np.issubdtype(dtype, np.number):
+        return 'numeric'
+    elif str(dtype) == 'object':
+        return 'categorical'
+    return 'other'
+
+
+def _json_value(value):
+    """把numpy/pandas标量转换为可以JSON序列化的值"""
+    if value is None:
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not np.isfinite(value):
+        return None
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    return str(value)
+
+
+class _ColumnState:
+    """单列的累积统计状态"""
+
+    def __init__(self, name):
+        self.name = name
+        self.dtype = None
+        self.count = 0
+        self.missing = 0
+        self.hashes = np.empty(0, dtype=np.uint64)
+        self.counts = pd.Series(dtype='int64')
+        self.min = None
+        self.max = None
+        self.total = 0.0
+        self.sketch = QuantileSketch()
+
+    def merge_dtype(self, dtype):
+        if self.dtype is None:
+            self.dtype = dtype
+        elif self.dtype != dtype:
+            # 不同数据块推断出的类型不一致时，数值类型取公共类型，否则视为object
+            if np.issubdtype(self.dtype, np.number) and np.issubdtype(dtype, np.number):
+                self.dtype = np.result_type(self.dtype, dtype)
+            else:
+                self.dtype = np.dtype('object')
+
+
+class ColumnProfiler:
+    """按数据块累积每列的统计信息
+
+    对每个数据块调用update()，最后调用result()得到列信息列表。
+    每列统计: dtype、缺失数、精确唯一值个数（基于64位哈希）、最小值/最大值/均值、
+    分位数以及高频值。数值列的分位数来自可合并的分位数草图（数据较小时是精确的），
+    草图可以通过sketches()取出保存，供后续计算IQR边界、中位数时使用。
+    """
+
+    def __init__(self, top_k=TOP_K):
+        self.top_k = top_k
+        self.row_count = 0
+        self._columns = {}
+
+    def update(self, chunk):
+        """累积一个数据块的统计信息"""
+        self.row_count += len(chunk)
+        missing = chunk.isna().sum()
+
+        # 数值列的统计一次性向量化计算
+        numeric = chunk.select_dtypes(include='number')
+        if len(numeric.columns) > 0:
+            mins = numeric.min()
+            maxs = numeric.max()
+            sums = numeric.sum()
+
+        for col in chunk.columns:
+            state = self._columns.get(col)
+            if state is None:
+                state = self._columns[col] = _ColumnState(col)
+
+            series = chunk[col]
+            state.merge_dtype(series.dtype)
+            state.count += len(series)
+            state.missing += int(missing[col])
+
+            values = series.dropna()
+            if len(values) == 0:
+                continue
+
+            is_numeric = col in numeric.columns
+            raw = values.to_numpy(dtype='float64') if is_numeric else values.to_numpy()
+
+            # 唯一值: 保存排序后的哈希值，合并时取并集
+            hashes = np.unique(pd.util.hash_array(raw))
+            state.hashes = np.union1d(state.hashes, hashes)
+
+            # 高频值计数
+            counts = values.value_counts(sort=False)
+            state.counts = state.counts.add(counts, fill_value=0)
+            if len(state.counts) > TOP_K_CAPACITY:
+                state.counts = state.counts.nlargest(TOP_K_CAPACITY)
+
+            if is_numeric:
+                col_min, col_max = float(mins[col]), float(maxs[col])
+                state.min = col_min if state.min is None else min(state.min, col_min)
+                state.max = col_max if state.max is None else max(state.max, col_max)
+                state.total += float(sums[col])
+                # 每块单独生成草图后合并，与追加数据时合并草图的方式相同
+                chunk_sketch = QuantileSketch()
+                chunk_sketch.update(raw)
+                state.sketch.merge(chunk_sketch)
+
+    def _column_result(self, state):
+        dtype = state.dtype if state.dtype is not None else np.dtype('object')
+        info = {
+            'name': state.name,
+            'type': column_type(dtype),
+            'dtype': str(dtype),
+            'missing_count': int(state.missing),
+            'unique_count': int(len(state.hashes))
+        }
+
+        if info['type'] == 'numeric' and state.sketch.n > 0:
+            quantiles = state.sketch.quantile(QUANTILES)
+            info.update({
+                'min': _json_value(state.min),
+                'max': _json_value(state.max),
+                'mean': _json_value(state.total / state.sketch.n),
+                'quantiles': {f'{int(q * 100)}%': _json_value(v) for q, v in zip(QUANTILES, quantiles)}
+            })
+
+        # 计数相同的值按字符串顺序排列，保证分块统计与整体统计的结果一致
+        counts = state.counts.sort_index(key=lambda index: index.astype(str))
+        top = counts.sort_values(ascending=False, kind='mergesort').head(self.top_k)
+        info['top_values'] = [
+            {'value': _json_value(value), 'count': int(count)}
+            for value, count in top.items()
+        ]
+        return info
+
+    def result(self):
+        """返回列信息列表（顺序与数据中的列顺序一致）"""
+        return [self._column_result(state) for state in self._columns.values()]
+
+    def sketches(self):
+        """返回数值列的分位数草图 {列名: QuantileSketch}"""
+        return {
+            name: state.sketch for name, state in self._columns.items()
+            if state.dtype is not None and column_type(state.dtype) == 'numeric' and state.sketch.n > 0
+        }
+
+
+def build_profiler(df, chunk_rows=CHUNK_ROWS):
+    """对DataFrame按块做一次遍历，返回累积了统计信息的ColumnProfiler"""
+    profiler = ColumnProfiler()
+    if len(df) == 0:
+        profiler.update(df)
+    for start in range(0, len(df), chunk_rows):
+        profiler.update(df.iloc[start:start + chunk_rows])
+    return profiler
+
+
+def profile_dataframe(df, chunk_rows=CHUNK_ROWS):
+    """对DataFrame按块做一次遍历，返回列信息列表"""
+    return build_profiler(df, chunk_rows).result()
+
+
+def update_profile(profile, df, changed_columns, rows_changed):
+    """清洗之后增量更新列信息
+
+    行发生变化时所有列的统计都会变化，需要重新统计；
+    否则只重新统计被修改或新增的列，其余列直接沿用原有的统计信息。
+    """
+    previous = {col['name']: col for col in (profile or []) if 'dtype' in col}
+    if rows_changed or not previous:
+        return profile_dataframe(df)
+
+    stale = [col for col in df.columns if col in changed_columns or col not in previous]
+    fresh = {col['name']: col for col in profile_dataframe(df[stale])} if stale else {}
+
+    return [fresh[col] if col in fresh else previous[col] for col in df.columns]
+
+
+def frame_statistics(df, outlier_threshold=1.5, sketches=None):
+    """一次性计算清洗建议需要的统计量，供各个建议生成函数共用
+
+    数值列（不含布尔列）作为一个整体矩阵计算四分位数和IQR异常值个数，
+    不再逐列调用quantile或生成过滤后的DataFrame。
+    sketches为保存的分位数草图，有草图的列直接从草图取四分位数，不再排序整列。
+
+    返回:
+        字典，包含行数、每列缺失数、数值列的Q1/Q3/异常值个数以及object列的唯一值个数
+    """
+    numeric = df.select_dtypes(include='number')
+    objects = df.select_dtypes(include='object')
+
+    if len(numeric.columns) > 0:
+        sketches = sketches or {}
+        sketched = [col for col in numeric.columns if col in sketches]
+        rest = [col for col in numeric.columns if col not in sketches]
+        quantiles = numeric[rest].quantile([0.25, 0.75]) if rest else pd.DataFrame(index=[0.25, 0.75])
+        for col in sketched:
+            quantiles[col] = sketches[col].quantile([0.25, 0.75])
+        quantiles = quantiles[list(numeric.columns)]
+        q1 = quantiles.iloc[0]
+        q3 = quantiles.iloc[1]
+        iqr = q3 - q1
+        lower = (q1 - outlier_threshold * iqr).to_numpy()
+        upper = (q3 + outlier_threshold * iqr).to_numpy()
+
+        # 缺失值与边界比较的结果为False，不计为异常值
+        values = numeric.to_numpy(dtype='float64', na_value=np.nan)
+        outliers = ((values < lower) | (values > upper)).sum(axis=0)
+        outlier_counts = pd.Series(outliers, index=numeric.columns)
+    else:
+        q1 = q3 = outlier_counts = pd.Series(dtype='float64')
+
+    return {
+        'row_count': len(df),
+        'missing': df.isna().sum(),
+        'numeric_columns': list(numeric.columns),
+        'q1': q1,
+        'q3': q3,
+        'outlier_counts': outlier_counts,
+        'nunique': objects.nunique()
+    }
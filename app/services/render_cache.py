@@ -0,0 +1,80 @@
+import os
+import re
+import json
+import hashlib
+
+# 缓存图表的文件后缀，文件名为 {图表类型}_{缓存键}.png
+RENDER_CACHE_EXTENSION = '.png'
+# 渲染缓存生成的图片及其变体（缩略图、WebP）的文件名：{图表类型}_{64位缓存键}[.变体].png/webp
+# 其他图片（如按uuid命名的旧图片）不属于缓存，不会被清理
+CACHED_IMAGE_NAME = re.compile(r'^[a-z]+_[0-9a-f]{64}(\.[a-z]+)?\.(png|webp)$')
+
+
+def normalize_config(config):
+    """规范化图表配置：去掉未设置的参数，键按字母顺序排列
+
+    {"hue": null} 与不传hue画出的图相同，应命中同一个缓存。
+    """
+    return {key: value for key, value in sorted((config or {}).items())
+            if value is not None and value != '' and value != []}
+
+
+def render_key(data_key, chart_type, config):
+    """图表的缓存键：数据版本、图表类型和规范化后的配置共同决定图表内容"""
+    text = '\n'.join([
+        data_key,
+        chart_type,
+        json.dumps(normalize_config(config), sort_keys=True, ensure_ascii=False, default=str)
+    ])
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def cached_image_path(image_dir, chart_type, key):
+    return os.path.join(image_dir, f"{chart_type}_{key}{RENDER_CACHE_EXTENSION}")
+
+
+def lookup(image_path):
+    """缓存命中时更新文件的修改时间（作为最近使用时间）并返回True"""
+    try:
+        os.utime(image_path)
+        return True
+    except OSError:
+        return False
+
+
+def prune(image_dir, max_bytes, keep=None):
+    """缓存图片的总大小超过max_bytes时，按最近使用时间删除最久未用的图片
+
+    只处理按缓存键命名的图片（见CACHED_IMAGE_NAME）。keep为不能删除的图片路径列表
+    （刚生成、需要返回给客户端的图片），不计入总大小。图表记录引用的图片被删除后，
+    请求时按记录重新绘制；图片变体删除后会在下次请求时重新生成。返回删除的文件数。
+    """
+    keep = {os.path.abspath(path) for path in keep or ()}
+    entries = []
+    total = 0
+    try:
+        with os.scandir(image_dir) as it:
+            for entry in it:
+                if not entry.is_file() or not CACHED_IMAGE_NAME.match(entry.name):
+                    continue
+                if os.path.abspath(entry.path) in keep:
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+                total += stat.st_size
+    except OSError:
+        return 0
+
+    removed = 0
+    for _, path, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    if removed:
+        print(f"图表缓存超出上限，已删除{removed}个最久未使用的图片")
+    return removed
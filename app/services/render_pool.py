@@ -0,0 +1,154 @@
+import os
+import uuid
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app.services import columnar_cache
+
+# Arrow IPC共享数据文件的后缀
+SHARED_FRAME_SUFFIX = '.arrow'
+
+# 本进程中的渲染进程池
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _init_worker():
+    """渲染进程启动时导入matplotlib/seaborn并设置图表风格，之后的每次渲染都不再重复"""
+    import app.services.visualizer  # noqa: F401
+
+
+def _load_frame(source):
+    """在渲染进程中取得绘图数据
+
+    source为 ('file', 文件路径, 文件类型, 列) 时由渲染进程自己读取（只读取用到的列），
+    为 ('shared', 路径) 时映射服务进程写入共享内存的Arrow数据，为 ('frame', DataFrame) 时直接使用。
+    """
+    from app.services.chart_data import load_chart_frame
+    kind = source[0]
+    if kind == 'file':
+        _, file_path, file_type, columns = source
+        return load_chart_frame(file_path, file_type, columns)
+    if kind == 'shared':
+        import pyarrow as pa
+        with pa.memory_map(source[1], 'r') as mapped:
+            return pa.ipc.open_file(mapped).read_all().to_pandas()
+    return source[1]
+
+
+def _render_task(source, chart_type, config, image_path, file_path, file_type, corr=None):
+    """在渲染进程中绘制一个图表，corr为服务进程中由保存的统计量得到的热图相关系数矩阵，此时不读取数据"""
+    from app.services.visualizer import render_chart
+    df = None if corr is not None else _load_frame(source)
+    return render_chart(df, chart_type, config, image_path, file_path, file_type, corr)
+
+
+def _cluster_task(file_path, file_type, config, image_path, store_dir):
+    """在渲染进程中绘制聚类图，保存的聚类结果可用时不读取数据"""
+    from app.services.visualizer import create_cluster_visualization
+    return create_cluster_visualization(file_path, file_type, config, image_path, store_dir)
+
+
+def _get_executor(app):
+    """按需创建渲染进程池
+
+    与后台任务相同使用spawn方式启动，渲染进程常驻，matplotlib只在启动时导入一次。
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=app.config['RENDER_WORKERS'],
+                                            mp_context=multiprocessing.get_context('spawn'),
+                                            initializer=_init_worker)
+        return _executor
+
+
+def _reset_executor():
+    """渲染进程异常退出后进程池不可再用，下次提交时重新创建"""
+    global _executor
+    with _executor_lock:
+        _executor = None
+
+
+def _submit(app, task, *args):
+    """提交task到渲染进程池，RENDER_WORKERS为0时在当前线程中执行（返回已完成的Future）"""
+    if not app.config['RENDER_WORKERS']:
+        from concurrent.futures import Future
+        future = Future()
+        future.set_result(task(*args))
+        return future
+
+    try:
+        return _get_executor(app).submit(task, *args)
+    except BrokenProcessPool:
+        _reset_executor()
+        return _get_executor(app).submit(task, *args)
+
+
+def submit(app, source, chart_type, config, image_path=None, file_path=None, file_type=None, corr=None):
+    """提交一个渲染任务，返回Future，结果与create_visualization相同"""
+    return _submit(app, _render_task, source, chart_type, config, image_path, file_path, file_type, corr)
+
+
+def result(future):
+    """等待渲染结果，渲染进程异常退出时返回失败结果"""
+    try:
+        return future.result()
+    except BrokenProcessPool as e:
+        _reset_executor()
+        return {'success': False, 'error': f'渲染进程异常退出: {str(e)}'}
+
+
+def render_file(app, file_path, file_type, chart_type, config, image_path=None):
+    """在渲染进程中读取数据文件并绘制图表，返回与create_visualization相同的结果"""
+    from app.services.chart_data import required_columns, saved_correlation
+    # 热图可以由保存的统计量得到时只把相关系数矩阵交给渲染进程，不读取数据
+    corr = saved_correlation(file_path, chart_type, config)
+    source = ('frame', None) if corr is not None else ('file', file_path, file_type, required_columns(chart_type, config))
+    return result(submit(app, source, chart_type, config, image_path, file_path, file_type, corr))
+
+
+def render_clusters(app, file_path, file_type, config, image_path=None):
+    """在渲染进程中绘制聚类图，返回与create_cluster_visualization相同的结果
+
+    聚类结果保存在CLUSTER_FOLDER中，相同数据版本、特征和算法配置只拟合一次。
+    """
+    return result(_submit(app, _cluster_task, file_path, file_type, config, image_path,
+                          app.config['CLUSTER_FOLDER']))
+
+
+def share_frame(app, df):
+    """把已读取的数据交给渲染进程，返回渲染任务使用的数据来源
+
+    安装了pyarrow时写为Arrow IPC文件放在共享内存目录（RENDER_SHARED_FOLDER，默认/dev/shm）中，
+    各渲染进程直接映射读取，不需要pickle整个DataFrame；否则退回为随任务传递DataFrame。
+    用完后调用release_frame删除。
+    """
+    if not app.config['RENDER_WORKERS']:
+        return ('frame', df)
+    if not columnar_cache.is_available():
+        return ('frame', df)
+
+    import pyarrow as pa
+    folder = app.config['RENDER_SHARED_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f'render_{uuid.uuid4().hex}{SHARED_FRAME_SUFFIX}')
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.OSFile(path, 'wb') as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        return ('shared', path)
+    except Exception as e:
+        # 混合类型的object列等无法转换为Arrow时退回为直接传递
+        print(f"写入共享绘图数据失败，改为直接传递: {str(e)}")
+        if os.path.exists(path):
+            os.remove(path)
+        return ('frame', df)
+
+
+def release_frame(source):
+    """删除share_frame写入的共享数据"""
+    if source[0] == 'shared' and os.path.exists(source[1]):
+        os.remove(source[1])
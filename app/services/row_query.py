@@ -0,0 +1,151 @@
+import os
+import json
+import threading
+from collections import OrderedDict
+import numpy as np
+from app.services import columnar_cache
+from app.services.data_cleaner import read_file
+
+# 每页最多返回的行数
+MAX_LIMIT = 1000
+# 缓存的查询结果（行号索引）个数
+POSITION_CACHE_SIZE = 32
+
+# 支持的过滤条件
+FILTER_OPS = {'eq', 'ne', 'gt', 'ge', 'lt', 'le', 'in', 'contains', 'isnull', 'notnull'}
+
+_position_cache = OrderedDict()
+_position_lock = threading.Lock()
+
+
+def _apply_filter(series, op, value):
+    """对单列计算过滤条件，返回布尔数组"""
+    if op == 'eq':
+        return series == value
+    elif op == 'ne':
+        return series != value
+    elif op == 'gt':
+        return series > value
+    elif op == 'ge':
+        return series >= value
+    elif op == 'lt':
+        return series < value
+    elif op == 'le':
+        return series <= value
+    elif op == 'in':
+        return series.isin(value if isinstance(value, list) else [value])
+    elif op == 'contains':
+        return series.astype(str).str.contains(str(value), regex=False, na=False)
+    elif op == 'isnull':
+        return series.isna()
+    elif op == 'notnull':
+        return series.notna()
+    raise ValueError(f"不支持的过滤条件: {op}")
+
+
+def _validate(all_columns, columns, filters, sort):
+    """检查查询参数中引用的列和过滤条件"""
+    for col in columns:
+        if col not in all_columns:
+            raise ValueError(f"列不存在: {col}")
+    for f in filters:
+        if f.get('column') not in all_columns:
+            raise ValueError(f"过滤列不存在: {f.get('column')}")
+        if f.get('op', 'eq') not in FILTER_OPS:
+            raise ValueError(f"不支持的过滤条件: {f.get('op')}")
+    if sort and sort not in all_columns:
+        raise ValueError(f"排序列不存在: {sort}")
+
+
+def _cache_key(file_path, filters, sort, descending):
+    stat = os.stat(file_path)
+    return (file_path, stat.st_size, stat.st_mtime_ns,
+            json.dumps(filters, sort_keys=True, default=str), sort, bool(descending))
+
+
+def _matching_positions(file_path, file_type, filters, sort, descending):
+    """计算满足过滤条件的行号，并按排序列排好序
+
+    只读取过滤列和排序列，结果按查询条件缓存，翻页时无需重新计算。
+    """
+    key = _cache_key(file_path, filters, sort, descending)
+    with _position_lock:
+        if key in _position_cache:
+            _position_cache.move_to_end(key)
+            return _position_cache[key]
+
+    needed = list(dict.fromkeys([f['column'] for f in filters] + ([sort] if sort else [])))
+    if needed:
+        df = read_file(file_path, file_type, columns=needed).reset_index(drop=True)
+        mask = np.ones(len(df), dtype=bool)
+        for f in filters:
+            mask &= np.asarray(_apply_filter(df[f['column']], f.get('op', 'eq'), f.get('value')), dtype=bool)
+        positions = np.flatnonzero(mask)
+
+        if sort:
+            values = df[sort].iloc[positions]
+            order = values.reset_index(drop=True).sort_values(
+                ascending=not descending, kind='mergesort', na_position='last').index
+            positions = positions[np.asarray(order)]
+    else:
+        positions = np.arange(_row_count(file_path, file_type))
+
+    with _position_lock:
+        _position_cache[key] = positions
+        while len(_position_cache) > POSITION_CACHE_SIZE:
+            _position_cache.popitem(last=False)
+    return positions
+
+
+def _row_count(file_path, file_type):
+    if columnar_cache.is_fresh(file_path):
+        return columnar_cache.row_count(file_path)
+    return len(read_file(file_path, file_type))
+
+
+def _take_rows(file_path, file_type, columns, positions):
+    """按行号读取指定列，列式缓存可用时只读取包含这些行的行组"""
+    if columnar_cache.is_fresh(file_path):
+        return columnar_cache.take_rows(file_path, columns, positions)
+    return read_file(file_path, file_type, columns=columns).iloc[positions]
+
+
+def query_rows(file_path, file_type, all_columns, columns=None, filters=None,
+               sort=None, descending=False, offset=0, limit=100):
+    """分页查询数据行
+
+    参数:
+        all_columns: 数据集的全部列名（来自保存的列信息，无需读取文件）
+        columns: 需要返回的列，默认返回全部列
+        filters: 过滤条件列表，如 [{'column': 'price', 'op': 'gt', 'value': 100}]
+        sort: 排序列
+        descending: 是否降序
+        offset, limit: 分页参数
+
+    返回:
+        包含当前页数据和满足条件的总行数的字典
+    """
+    columns = list(columns) if columns else list(all_columns)
+    filters = filters or []
+    offset = max(int(offset), 0)
+    limit = min(max(int(limit), 0), MAX_LIMIT)
+
+    _validate(all_columns, columns, filters, sort)
+
+    # 确保列式缓存存在（缓存过期时会重新生成）
+    if columnar_cache.is_available() and not columnar_cache.is_fresh(file_path):
+        read_file(file_path, file_type, columns=[])
+
+    positions = _matching_positions(file_path, file_type, filters, sort, descending)
+    page = _take_rows(file_path, file_type, columns, positions[offset:offset + limit])
+
+    # 将 NaN 值替换为 None，这样在 JSON 序列化时会变成 null
+    rows = page.replace({np.nan: None}).to_dict(orient='records')
+
+    return {
+        'rows': rows,
+        'columns': columns,
+        'offset': offset,
+        'limit': limit,
+        'total': int(len(positions))
+    }
@@ -0,0 +1,184 @@
+import math
+import time
+import functools
+import itertools
+import threading
+from collections import Counter
+from flask import current_app, jsonify, request
+from flask_login import current_user
+from app.services import job_queue
+
+# 优先级：数值越小越先执行
+INTERACTIVE = 'interactive'
+BATCH = 'batch'
+PRIORITY_RANK = {INTERACTIVE: 0, BATCH: 1}
+# 估计排队时间的初始值（秒），之后按实际执行时间的滑动平均更新
+INITIAL_SERVICE_SECONDS = {INTERACTIVE: 1.0, BATCH: 30.0}
+# 滑动平均中最新一次执行时间的权重
+SERVICE_TIME_WEIGHT = 0.2
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+class _Ticket:
+    """一个等待执行的请求"""
+
+    def __init__(self, user_id, priority, seq):
+        self.user_id = user_id
+        self.priority = priority
+        self.seq = seq
+        self.granted = False
+        self.started_at = None
+        self.retry_after = None
+
+    def sort_key(self):
+        return PRIORITY_RANK[self.priority], self.seq
+
+
+class Scheduler:
+    """按优先级分配CPU预算的准入控制
+
+    同时执行的重请求不超过cpu_slots个，其中interactive_reserved个只留给交互请求
+    （预览、可视化），批量请求（训练、聚类、分类等）最多使用其余部分，
+    且每个用户同时执行的批量请求不超过user_slots个。
+    没有空闲预算时请求按(优先级, 到达顺序)排队，等待超时或队列已满时拒绝，
+    并根据各类请求的平均执行时间给出建议的重试间隔。
+    """
+
+    def __init__(self, cpu_slots, interactive_reserved, user_slots, max_queue, wait_seconds):
+        self.cpu_slots = cpu_slots
+        self.batch_slots = max(1, cpu_slots - interactive_reserved)
+        self.user_slots = user_slots
+        self.max_queue = max_queue
+        self.wait_seconds = wait_seconds
+        self.running = Counter()
+        self.user_running = Counter()
+        self.service_seconds = dict(INITIAL_SERVICE_SECONDS)
+        self.waiting = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _admissible(self, ticket):
+        if sum(self.running.values()) >= self.cpu_slots:
+            return False
+        if ticket.priority == BATCH:
+            if self.running[BATCH] >= self.batch_slots:
+                return False
+            if self.user_running[ticket.user_id] >= self.user_slots:
+                return False
+        return True
+
+    def _grant(self, ticket):
+        ticket.granted = True
+        ticket.started_at = time.time()
+        self.running[ticket.priority] += 1
+        if ticket.priority == BATCH:
+            self.user_running[ticket.user_id] += 1
+
+    def _dispatch(self):
+        """按优先级顺序放行可以执行的请求（被用户配额挡住的请求不阻塞其他用户）"""
+        granted = False
+        for ticket in sorted(self.waiting, key=_Ticket.sort_key):
+            if self._admissible(ticket):
+                self._grant(ticket)
+                self.waiting.remove(ticket)
+                granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def _retry_after(self, ticket):
+        """建议的重试间隔（秒）：排在前面的请求按平均执行时间全部完成所需的时间"""
+        ahead = sum(1 for other in self.waiting if other.sort_key() < ticket.sort_key())
+        if ticket.priority == BATCH:
+            slots = self.batch_slots
+            if self.user_running[ticket.user_id] >= self.user_slots:
+                slots = self.user_slots
+        else:
+            slots = self.cpu_slots
+        seconds = self.service_seconds[ticket.priority] * (ahead + 1) / slots
+        return max(1, int(math.ceil(seconds)))
+
+    def acquire(self, user_id, priority):
+        """申请执行预算，返回ticket；ticket.granted为False时表示被拒绝"""
+        with self._cond:
+            ticket = _Ticket(user_id, priority, next(self._seq))
+            if len(self.waiting) >= self.max_queue:
+                ticket.retry_after = self._retry_after(ticket)
+                return ticket
+
+            self.waiting.append(ticket)
+            self._dispatch()
+            deadline = time.time() + self.wait_seconds[priority]
+            while not ticket.granted:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    ticket.retry_after = self._retry_after(ticket)
+                    self.waiting.remove(ticket)
+                    break
+                self._cond.wait(remaining)
+            return ticket
+
+    def release(self, ticket):
+        """请求执行完毕，归还预算并放行排队的请求"""
+        with self._cond:
+            elapsed = time.time() - ticket.started_at
+            self.service_seconds[ticket.priority] += SERVICE_TIME_WEIGHT * (
+                elapsed - self.service_seconds[ticket.priority])
+            self.running[ticket.priority] -= 1
+            if ticket.priority == BATCH:
+                self.user_running[ticket.user_id] -= 1
+            self._dispatch()
+
+
+def get_scheduler(app):
+    """按应用配置创建本进程的调度器"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = Scheduler(
+                cpu_slots=app.config['SCHEDULER_CPU_SLOTS'],
+                interactive_reserved=app.config['SCHEDULER_INTERACTIVE_RESERVED'],
+                user_slots=app.config['SCHEDULER_USER_SLOTS'],
+                max_queue=app.config['SCHEDULER_MAX_QUEUE'],
+                wait_seconds=app.config['SCHEDULER_WAIT_SECONDS']
+            )
+        return _scheduler
+
+
+def _reject(message, retry_after):
+    response = jsonify({'success': False, 'error': message, 'retry_after': retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def scheduled(priority, allows_async=False):
+    """路由装饰器：请求在调度器分配到执行预算后才执行，超出预算时排队或返回429
+
+    allows_async为True的路由可以提交后台任务（"async": true），这样的请求本身开销很小，
+    不占用执行预算，但每个用户未完成的后台任务数不能超过SCHEDULER_USER_JOBS。
+    其他路由忽略请求中的async，始终按预算执行。
+    放在login_required之后，未登录的请求不参与排队。
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            user_id = current_user.id if current_user.is_authenticated else None
+
+            if allows_async and job_queue.wants_async(request.get_json(silent=True)):
+                if user_id is not None and job_queue.pending_count(user_id) >= current_app.config['SCHEDULER_USER_JOBS']:
+                    return _reject('未完成的后台任务过多，请等待已提交的任务完成',
+                                   int(math.ceil(INITIAL_SERVICE_SECONDS[BATCH])))
+                return view(*args, **kwargs)
+
+            scheduler = get_scheduler(current_app)
+            ticket = scheduler.acquire(user_id, priority)
+            if not ticket.granted:
+                return _reject('服务器繁忙，请稍后重试', ticket.retry_after)
+            try:
+                return view(*args, **kwargs)
+            finally:
+                scheduler.release(ticket)
+        return wrapper
+    return decorator
@@ -0,0 +1,195 @@
+import os
+import json
+import uuid
+import numpy as np
+
+# KLL草图的精度参数，分位数的秩误差约为 1.7/SKETCH_K
+SKETCH_K = 200
+# 非空值不超过这么多个时草图保存全部数值，分位数是精确的（与pandas的线性插值一致）
+SKETCH_EXACT_ROWS = 4096
+# 行数达到该值时才用草图代替精确分位数（数据较小时直接排序的开销可以忽略）
+SKETCH_MIN_ROWS = 100000
+# 草图文件的后缀，与数据文件放在同一目录下
+SKETCH_SUFFIX = '.sketch.json'
+# 草图文件格式版本，格式变化时递增，旧文件会被视为过期
+SKETCH_FORMAT = 1
+
+
+class QuantileSketch:
+    """可合并的KLL分位数草图
+
+    第h层中的每个值代表2^h个原始值。某层超出容量时排序后隔一个取一个提升到上一层，
+    因此内存占用约为 3*k 个数值，与数据量无关。两个草图逐层拼接后再压缩即完成合并，
+    分块统计、追加数据时把各部分的草图合并即可，无需重新扫描已有数据。
+    """
+
+    def __init__(self, k=SKETCH_K):
+        self.k = k
+        self.n = 0
+        self.min = None
+        self.max = None
+        self.levels = [np.empty(0)]
+        self._offset = 0
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        capacity = max(2, int(np.ceil(self.k * (2.0 / 3.0) ** depth)))
+        if len(self.levels) == 1:
+            # 尚未压缩过时保留全部数值，数据量较小时结果是精确的
+            capacity = max(capacity, SKETCH_EXACT_ROWS)
+        return capacity
+
+    def _compress(self):
+        while True:
+            full = [h for h in range(len(self.levels)) if len(self.levels[h]) > self._capacity(h)]
+            if not full:
+                return
+            level = full[0]
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+
+            items = np.sort(self.levels[level])
+            # 个数为奇数时留下一个值在本层，保证总权重不变
+            leftover = items[len(items) - len(items) % 2:]
+            items = items[:len(items) - len(items) % 2]
+            # 交替选取奇数位和偶数位，避免系统性地偏向较大或较小的值
+            promoted = items[self._offset::2]
+            self._offset ^= 1
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            self.levels[level] = leftover
+
+    def update(self, values):
+        """加入一批数值（缺失值忽略）"""
+        values = np.asarray(values, dtype='float64')
+        values = values[~np.isnan(values)]
+        if len(values) == 0:
+            return
+        self.n += len(values)
+        self.min = float(values.min()) if self.min is None else min(self.min, float(values.min()))
+        self.max = float(values.max()) if self.max is None else max(self.max, float(values.max()))
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self._compress()
+
+    def merge(self, other):
+        """把另一个草图合并进来"""
+        if other.n == 0:
+            return self
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self.min = other.min if self.min is None else min(self.min, other.min)
+        self.max = other.max if self.max is None else max(self.max, other.max)
+        self._compress()
+        return self
+
+    def is_exact(self):
+        return len(self.levels) == 1
+
+    def quantile(self, q):
+        """返回分位数，q可以是单个值或列表；没有数据时返回nan"""
+        if self.n == 0:
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else np.nan
+        if self.is_exact():
+            return np.quantile(self.levels[0], q)
+
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2 ** h, dtype='int64')
+                                  for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind='mergesort')
+        items = items[order]
+        ranks = np.cumsum(weights[order])
+
+        # 第一个累计权重超过目标秩（0起始）的值
+        targets = np.asarray(q, dtype='float64') * (self.n - 1)
+        positions = np.minimum(np.searchsorted(ranks, targets, side='right'), len(items) - 1)
+        result = items[positions]
+        result = np.where(np.asarray(q) <= 0, self.min, result)
+        result = np.where(np.asarray(q) >= 1, self.max, result)
+        return result if np.ndim(q) else float(result)
+
+    def to_dict(self):
+        return {
+            'k': self.k,
+            'n': self.n,
+            'min': self.min,
+            'max': self.max,
+            'levels': [items.tolist() for items in self.levels]
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['k'])
+        sketch.n = data['n']
+        sketch.min = data['min']
+        sketch.max = data['max']
+        sketch.levels = [np.asarray(items, dtype='float64') for items in data['levels']] or [np.empty(0)]
+        return sketch
+
+
+def build_sketches(chunks):
+    """按块为数值列生成草图，每块单独生成后合并"""
+    sketches = {}
+    for chunk in chunks:
+        for col in chunk.select_dtypes(include='number').columns:
+            part = QuantileSketch()
+            part.update(chunk[col].to_numpy(dtype='float64', na_value=np.nan))
+            sketches.setdefault(col, QuantileSketch()).merge(part)
+    return sketches
+
+
+def sketch_path(file_path):
+    """返回数据文件对应的草图文件路径"""
+    return file_path + SKETCH_SUFFIX
+
+
+def _source_stamp(file_path):
+    stat = os.stat(file_path)
+    return {
+        'format': SKETCH_FORMAT,
+        'size': stat.st_size,
+        'mtime_ns': stat.st_mtime_ns
+    }
+
+
+def save_sketches(file_path, sketches):
+    """保存数据文件各数值列的草图，并记录数据文件的版本戳"""
+    path = sketch_path(file_path)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        data = {
+            'source': _source_stamp(file_path),
+            'columns': {col: sketch.to_dict() for col, sketch in sketches.items()}
+        }
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+        return True
+    except Exception as e:
+        print(f"保存分位数草图失败: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def load_sketches(file_path):
+    """读取数据文件的草图，文件不存在或与数据文件不一致时返回None"""
+    path = sketch_path(file_path)
+    if not os.path.exists(path) or not os.path.exists(file_path):
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get('source') != _source_stamp(file_path):
+            return None
+        return {col: QuantileSketch.from_dict(item) for col, item in data['columns'].items()}
+    except Exception:
+        return None
+
+
+def remove_sketches(file_path):
+    """删除数据文件对应的草图"""
+    path = sketch_path(file_path)
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,66 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+_snapshots = OrderedDict()
+_snapshot_sizes = {}
+_snapshot_lock = threading.Lock()
+_total_bytes = 0
+
+
+def file_key(file_path):
+    """没有内容哈希的文件，用路径、大小和修改时间作为数据版本的键"""
+    stat = os.stat(file_path)
+    text = f"{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def operations_key(source_key, operations):
+    """对源数据依次执行operations之后的数据版本的键
+
+    逐个操作折叠哈希，因此先执行[a]再执行[b]与一次执行[a, b]得到相同的键。
+    """
+    key = source_key
+    for op in operations:
+        text = key + '\n' + json.dumps(op, sort_keys=True, ensure_ascii=False, default=str)
+        key = hashlib.sha256(text.encode('utf-8')).hexdigest()
+    return key
+
+
+def _frame_bytes(df):
+    # 包括字符串等对象的实际大小（只在放入缓存时统计一次），否则以字符串为主的数据会被严重低估
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def get(key):
+    """返回缓存的DataFrame（多个请求共享，调用方不能原地修改），不存在时返回None"""
+    if key is None:
+        return None
+    with _snapshot_lock:
+        df = _snapshots.get(key)
+        if df is not None:
+            _snapshots.move_to_end(key)
+        return df
+
+
+def put(key, df, max_bytes):
+    """缓存DataFrame，缓存总大小超出max_bytes（配置项SNAPSHOT_CACHE_BYTES）时淘汰最久未使用的结果"""
+    global _total_bytes
+    if key is None or not max_bytes:
+        return
+    size = _frame_bytes(df)
+    if size > max_bytes:
+        return
+
+    with _snapshot_lock:
+        if key in _snapshots:
+            _total_bytes -= _snapshot_sizes.pop(key)
+            del _snapshots[key]
+        _snapshots[key] = df
+        _snapshot_sizes[key] = size
+        _total_bytes += size
+        while _total_bytes > max_bytes:
+            old_key, _ = _snapshots.popitem(last=False)
+            _total_bytes -= _snapshot_sizes.pop(old_key)
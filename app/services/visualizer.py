@@ -1,28 +1,155 @@
 import pandas as pd
+import numpy as np
 import os
 import uuid
-from app.services.data_cleaner import read_file
+from app.services.chart_data import (DENSITY_POINTS, aggregate_bars, sketch_box_statistics,
+                                     density_grid, density_scatter, binned_lines,
+                                     required_columns, load_chart_frame,
+                                     saved_correlation)
 from flask import current_app
 
 # 明确设置matplotlib使用非交互式后端，必须在导入pyplot之前设置
 import matplotlib
 matplotlib.use('Agg')  # 使用Agg后端，适合服务器端生成图像
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.colors import ListedColormap, LogNorm
+from matplotlib.patches import Patch
 import seaborn as sns
 
-def create_visualization(file_path, file_type, chart_type, config):
-    """根据配置创建可视化图表"""
+# 图表风格在导入时设置一次（渲染进程启动时即已设置），绘图使用Figure对象，不经过pyplot的全局状态
+sns.set_theme(style="whitegrid")
+
+# create_visualization支持的图表类型
+CHART_TYPES = ('bar', 'line', 'scatter', 'histogram', 'heatmap', 'box')
+# 柱状图误差线：ci为按标准误计算的95%置信区间（默认），bootstrap为seaborn的自助法置信区间，none不画误差线
+BAR_ERRORBARS = ('ci', 'bootstrap', 'none')
+# 95%置信区间对应的正态分位数
+CI_Z = 1.96
+
+
+def image_directory():
+    """图表图片的保存目录（项目根目录下的static/images）"""
+    app_root = os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
+    return os.path.join(app_root, 'static', 'images')
+
+def _draw_aggregated_bars(ax, agg, x, y, hue=None, errorbar='ci'):
+    """用聚合后的表绘制柱状图，布局与seaborn的分组柱状图一致"""
+    categories = agg[x].drop_duplicates().tolist()
+    positions = np.arange(len(categories))
+    levels = agg[hue].drop_duplicates().tolist() if hue else [None]
+    palette = sns.color_palette(n_colors=max(len(levels), 1))
+    width = 0.8 / len(levels)
+    
+    for i, level in enumerate(levels):
+        part = agg if level is None else agg[agg[hue] == level]
+        part = part.set_index(x).reindex(categories)
+        yerr = None
+        if errorbar == 'ci':
+            yerr = (CI_Z * part['sem']).fillna(0.0).to_numpy()
+        ax.bar(positions - 0.4 + width * (i + 0.5), part['mean'].to_numpy(), width,
+               yerr=yerr, color=palette[i], label=None if level is None else str(level),
+               error_kw={'ecolor': '.26', 'elinewidth': 1.5})
+    
+    ax.set_xticks(positions)
+    ax.set_xticklabels([str(category) for category in categories])
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    if hue:
+        ax.legend(title=hue)
+
+def _show_grid(ax, grid, xedges, yedges, **kwargs):
+    """把网格作为一张图片绘制在坐标轴上"""
+    return ax.imshow(grid.T, origin='lower', aspect='auto', interpolation='nearest',
+                     extent=[xedges[0], xedges[-1], yedges[0], yedges[-1]], **kwargs)
+
+def _draw_density_scatter(ax, data, x, y, hue=None):
+    """按点的密度绘制散点图：每个格子的颜色表示点数、hue的均值或hue中最多的类别
+
+    x或y不是数值列时无法分格，返回False，由调用方按普通散点图绘制。
+    """
+    density = density_scatter(data, x, y, hue)
+    if density is None:
+        return False
+    
+    grid, xedges, yedges = density['grid'], density['x_edges'], density['y_edges']
+    if density['kind'] == 'count':
+        image = _show_grid(ax, grid, xedges, yedges, cmap='viridis', norm=LogNorm())
+        ax.figure.colorbar(image, ax=ax, label='点数')
+    elif density['kind'] == 'mean':
+        image = _show_grid(ax, grid, xedges, yedges, cmap='viridis')
+        ax.figure.colorbar(image, ax=ax, label=f'{hue}（均值）')
+    else:
+        categories = density['categories']
+        palette = sns.color_palette(n_colors=len(categories))
+        _show_grid(ax, grid, xedges, yedges, cmap=ListedColormap(palette),
+                   vmin=-0.5, vmax=len(categories) - 0.5)
+        handles = [Patch(color=palette[i], label=category) for i, category in enumerate(categories)]
+        ax.legend(handles=handles, title=hue)
+    
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    return True
+
+def _draw_binned_line(ax, data, x, y, hue=None):
+    """按x分段绘制折线：每段画y的均值，并用阴影表示段内y的最小值到最大值
+
+    x或y不是数值列时返回False，由调用方按普通折线图绘制。
+    """
+    lines = binned_lines(data, x, y, hue)
+    if lines is None:
+        return False
+    
+    palette = sns.color_palette(n_colors=len(lines))
+    for i, line in enumerate(lines):
+        ax.plot(line['x'], line['mean'], color=palette[i],
+                label=None if line['hue'] is None else str(line['hue']))
+        ax.fill_between(line['x'], line['min'], line['max'], color=palette[i], alpha=0.2, linewidth=0)
+    
+    ax.set_xlabel(x)
+    ax.set_ylabel(y)
+    if hue is not None:
+        ax.legend(title=hue)
+    return True
+
+def _draw_cluster_points(ax, px, py, labels, density_threshold=DENSITY_POINTS):
+    """绘制聚类结果的点，点数较多时每个格子显示其中最多的聚类标签，返回用于颜色条的对象"""
+    labels = np.asarray(labels)
+    if len(labels) > density_threshold:
+        lowest = int(labels.min())
+        _, grid, xedges, yedges = density_grid(np.asarray(px, dtype='float64'), np.asarray(py, dtype='float64'),
+                                               codes=labels - lowest)
+        return _show_grid(ax, grid + lowest, xedges, yedges, cmap='viridis',
+                          vmin=lowest, vmax=int(labels.max()))
+    return ax.scatter(px, py, c=labels, cmap='viridis', s=50, alpha=0.8)
+
+def create_visualization(file_path, file_type, chart_type, config, image_path=None):
+    """根据配置创建可视化图表
+
+    image_path为图片的保存路径（渲染缓存使用按内容生成的文件名），不指定时生成随机文件名。
+    """
     try:
-        # 读取数据
-        df = read_file(file_path, file_type)
-        
-        # 处理无穷值
-        # 替换掉可能的inf值，这比使用已弃用的mode.use_inf_as_null更好
-        df = df.replace([float('inf'), -float('inf')], pd.NA)
-        
-        # 设置图表风格
-        sns.set_theme(style="whitegrid")
-        plt.figure(figsize=(10, 6))
+        # 只读取图表用到的列，处理无穷值；热图可以由保存的统计量得到时不读取数据
+        corr = saved_correlation(file_path, chart_type, config)
+        df = None
+        if corr is None:
+            df = load_chart_frame(file_path, file_type, required_columns(chart_type, config))
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return {'success': False, 'error': str(e)}
+    
+    return render_chart(df, chart_type, config, image_path, file_path, file_type, corr)
+
+def render_chart(df, chart_type, config, image_path=None, file_path=None, file_type=None, corr=None):
+    """用已读取的数据绘制图表并保存为图片
+
+    每个图表使用独立的Figure对象，不依赖pyplot的全局状态，可以在多个线程或渲染进程中同时执行。
+    file_path/file_type为数据文件，用于读取分位数草图，未指定时精确计算。
+    corr为热图由保存的统计量得到的相关系数矩阵（见saved_correlation），此时df可以为None。
+    """
+    try:
+        fig = Figure(figsize=(10, 6))
+        ax = fig.subplots()
         
         # 根据图表类型绘制不同的图
         if chart_type == 'bar':
@@ -30,15 +157,26 @@ def create_visualization(file_path, file_type, chart_type, config):
             y = config.get('y')
             hue = config.get('hue')
             
+            errorbar = config.get('errorbar', 'ci')
+            
             if not x or not y:
                 return {'success': False, 'error': '缺少必要的参数: x和y'}
+            if errorbar not in BAR_ERRORBARS:
+                return {'success': False, 'error': f'不支持的误差线类型: {errorbar}'}
             
-            if hue:
-                sns.barplot(data=df, x=x, y=y, hue=hue)
+            if errorbar == 'bootstrap':
+                # 自助法置信区间需要对每个类别重采样1000次，数据量大时很慢，只在明确要求时使用
+                if hue:
+                    sns.barplot(data=df, x=x, y=y, hue=hue, ax=ax)
+                else:
+                    sns.barplot(data=df, x=x, y=y, ax=ax)
             else:
-                sns.barplot(data=df, x=x, y=y)
+                # 先聚合再绘图，绘图只处理每个分组一行的结果表
+                hue = hue if hue in df.columns else None
+                agg = aggregate_bars(df, x, y, hue)
+                _draw_aggregated_bars(ax, agg, x, y, hue, errorbar)
             
-            plt.title(config.get('title', f'Bar Chart - {y} by {x}'))
+            ax.set_title(config.get('title', f'Bar Chart - {y} by {x}'))
             
         elif chart_type == 'line':
             x = config.get('x')
@@ -49,18 +187,19 @@ def create_visualization(file_path, file_type, chart_type, config):
                 return {'success': False, 'error': '缺少必要的参数: x和y'}
             
             # 确保line图的数据没有NaN值
-            line_df = df[[x, y]].dropna()
-            
-            if hue:
-                if hue in df.columns:
-                    line_df = df[[x, y, hue]].dropna()
-                    sns.lineplot(data=line_df, x=x, y=y, hue=hue)
-                else:
-                    sns.lineplot(data=line_df, x=x, y=y)
+            hue = hue if hue and hue in df.columns else None
+            line_df = df[[x, y, hue]].dropna() if hue else df[[x, y]].dropna()
+            
+            # 点数较多时按x分段聚合后绘制，不逐点绘制
+            density = len(line_df) > config.get('density_threshold', DENSITY_POINTS)
+            if density and _draw_binned_line(ax, line_df, x, y, hue):
+                pass
+            elif hue:
+                sns.lineplot(data=line_df, x=x, y=y, hue=hue, ax=ax)
             else:
-                sns.lineplot(data=line_df, x=x, y=y)
+                sns.lineplot(data=line_df, x=x, y=y, ax=ax)
             
-            plt.title(config.get('title', f'Line Chart - {y} over {x}'))
+            ax.set_title(config.get('title', f'Line Chart - {y} over {x}'))
             
         elif chart_type == 'scatter':
             x = config.get('x')
@@ -71,18 +210,19 @@ def create_visualization(file_path, file_type, chart_type, config):
                 return {'success': False, 'error': '缺少必要的参数: x和y'}
             
             # 过滤掉NaN值
-            scatter_df = df[[x, y]].dropna()
-            
-            if hue:
-                if hue in df.columns:
-                    scatter_df = df[[x, y, hue]].dropna()
-                    sns.scatterplot(data=scatter_df, x=x, y=y, hue=hue)
-                else:
-                    sns.scatterplot(data=scatter_df, x=x, y=y)
+            hue = hue if hue and hue in df.columns else None
+            scatter_df = df[[x, y, hue]].dropna() if hue else df[[x, y]].dropna()
+            
+            # 点数较多时按密度分格绘制为一张图片，不逐点绘制
+            density = len(scatter_df) > config.get('density_threshold', DENSITY_POINTS)
+            if density and _draw_density_scatter(ax, scatter_df, x, y, hue):
+                pass
+            elif hue:
+                sns.scatterplot(data=scatter_df, x=x, y=y, hue=hue, ax=ax)
             else:
-                sns.scatterplot(data=scatter_df, x=x, y=y)
+                sns.scatterplot(data=scatter_df, x=x, y=y, ax=ax)
             
-            plt.title(config.get('title', f'Scatter Plot - {y} vs {x}'))
+            ax.set_title(config.get('title', f'Scatter Plot - {y} vs {x}'))
             
         elif chart_type == 'histogram':
             x = config.get('x')
@@ -94,8 +234,8 @@ def create_visualization(file_path, file_type, chart_type, config):
             # 过滤掉NaN值
             hist_df = df[[x]].dropna()
             
-            sns.histplot(data=hist_df, x=x, bins=bins)
-            plt.title(config.get('title', f'Histogram of {x}'))
+            sns.histplot(data=hist_df, x=x, bins=bins, ax=ax)
+            ax.set_title(config.get('title', f'Histogram of {x}'))
             
         elif chart_type == 'heatmap':
             columns = config.get('columns', [])
@@ -103,15 +243,17 @@ def create_visualization(file_path, file_type, chart_type, config):
             if not columns or len(columns) < 2:
                 return {'success': False, 'error': '需要至少两列进行热图分析'}
             
-            # 确保所选列存在
-            valid_columns = [col for col in columns if col in df.columns]
-            if len(valid_columns) < 2:
-                return {'success': False, 'error': '选择的列不存在于数据集中'}
-                
-            # 计算相关性，处理NaN值
-            corr = df[valid_columns].corr()
-            sns.heatmap(corr, annot=True, cmap='coolwarm')
-            plt.title(config.get('title', 'Correlation Heatmap'))
+            # 没有由统计量得到的相关系数矩阵时由所选列的数据计算
+            if corr is None:
+                # 确保所选列存在
+                valid_columns = [col for col in columns if col in df.columns]
+                if len(valid_columns) < 2:
+                    return {'success': False, 'error': '选择的列不存在于数据集中'}
+                    
+                # 计算相关性，处理NaN值
+                corr = df[valid_columns].corr()
+            sns.heatmap(corr, annot=True, cmap='coolwarm', ax=ax)
+            ax.set_title(config.get('title', 'Correlation Heatmap'))
             
         elif chart_type == 'box':
             x = config.get('x')
@@ -123,35 +265,41 @@ def create_visualization(file_path, file_type, chart_type, config):
             # 过滤掉y列中的NaN值
             box_df = df[[y]].dropna()
             
+            # 单列箱线图的数据较大时使用分位数草图，config中指定exact时精确计算
+            box_stats = None
+            if not (x and x in df.columns) and not config.get('exact') and file_path is not None:
+                box_stats = sketch_box_statistics(file_path, file_type, y, box_df[y])
+            
             if x and x in df.columns:
                 box_df = df[[x, y]].dropna()
-                sns.boxplot(data=box_df, x=x, y=y)
+                sns.boxplot(data=box_df, x=x, y=y, ax=ax)
+            elif box_stats is not None:
+                ax.bxp([box_stats], widths=0.8, patch_artist=True)
+                ax.set_xticks([])
+                ax.set_ylabel(y)
             else:
-                sns.boxplot(data=box_df, y=y)
+                sns.boxplot(data=box_df, y=y, ax=ax)
             
-            plt.title(config.get('title', f'Box Plot of {y}'))
+            ax.set_title(config.get('title', f'Box Plot of {y}'))
             
         else:
             return {'success': False, 'error': f'不支持的图表类型: {chart_type}'}
         
         # 保存图表到项目根目录的static/images文件夹
-        # 获取应用的根目录
-        app_root = os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-        image_dir = os.path.join(app_root, 'static', 'images')
+        image_dir = image_directory()
         
         # 确保目录存在
         os.makedirs(image_dir, exist_ok=True)
             
-        filename = f"{chart_type}_{uuid.uuid4().hex}.png"
-        image_path = os.path.join(image_dir, filename)
-        
-        plt.tight_layout()
-        plt.savefig(image_path)
-        plt.close('all')  # 关闭所有figure，释放资源
+        if image_path is None:
+            filename = f"{chart_type}_{uuid.uuid4().hex}.png"
+            image_path = os.path.join(image_dir, filename)
         
-        # 明确触发Python的垃圾回收
-        import gc
-        gc.collect()
+        fig.tight_layout()
+        # 先写临时文件再改名，相同图表的并发请求不会读到写了一半的图片
+        tmp_path = f"{image_path}.{uuid.uuid4().hex}.tmp"
+        fig.savefig(tmp_path, format='png')
+        os.replace(tmp_path, image_path)
         
         return {
             'success': True,
@@ -162,151 +310,114 @@ def create_visualization(file_path, file_type, chart_type, config):
         import traceback
         traceback.print_exc()
         
-        # 确保清理任何打开的图像
-        plt.close('all')
-        
         return {
             'success': False,
             'error': str(e)
         }
 
-def create_cluster_visualization(file_path, file_type, config):
-    """创建聚类分析可视化图表"""
+def cluster_request(config):
+    """从图表配置中取出聚类的特征列和算法配置
+
+    支持与聚类分析接口相同的 feature_columns/algorithm_config，
+    以及之前的 features/algorithm/n_clusters/eps/min_samples（与之前一样先标准化再聚类）。
+    """
+    if 'feature_columns' in config or 'algorithm_config' in config:
+        return list(config.get('feature_columns') or []), dict(config.get('algorithm_config') or {})
+    
+    algorithm = config.get('algorithm', 'kmeans')
+    if algorithm == 'dbscan':
+        params = {'eps': config.get('eps', 0.5), 'min_samples': config.get('min_samples', 5)}
+    else:
+        params = {'n_clusters': config.get('n_clusters', 3)}
+    return list(config.get('features') or []), {'algorithm': algorithm, 'params': params, 'standardize': True}
+
+def create_cluster_visualization(file_path, file_type, config, image_path=None, store_dir=None):
+    """创建聚类分析可视化图表
+
+    聚类结果由fit_clusters取得：store_dir中已保存相同数据版本、特征和算法配置的结果
+    （例如刚执行过的聚类分析）时直接用保存的标签、中心和二维坐标绘图，不重新读取数据和拟合。
+    """
     try:
-        # 读取数据
-        df = read_file(file_path, file_type)
-        
-        # 处理无穷值
-        df = df.replace([float('inf'), -float('inf')], pd.NA)
+        from app.services.analysis_tasks import fit_clusters
         
         # 获取配置参数
-        features = config.get('features', [])
-        n_clusters = config.get('n_clusters', 3)
-        algorithm = config.get('algorithm', 'kmeans')
+        features, algorithm_config = cluster_request(config)
         
         if not features or len(features) < 2:
             return {'success': False, 'error': '聚类分析至少需要选择两个特征'}
         
-        # 确保所选特征存在于数据集中
-        valid_features = [col for col in features if col in df.columns]
-        if len(valid_features) < 2:
-            return {'success': False, 'error': '选择的特征不存在于数据集中'}
+        fit, _ = fit_clusters(file_path, file_type, features, algorithm_config, store_dir)
+        if fit is None or fit['projection'] is None:
+            return {'success': False, 'error': '聚类分析至少需要两个数值特征'}
         
-        # 选择特征并删除缺失值
-        X = df[valid_features].dropna()
+        algorithm = fit['algorithm']
+        labels = fit['labels']
+        points = fit['projection']
+        centers = fit['projected_centers']
+        valid_features = fit['feature_columns']
+        n_clusters = fit.get('n_clusters', len(centers) if centers is not None else 0)
         
-        # 标准化数据
-        from sklearn.preprocessing import StandardScaler
-        scaler = StandardScaler()
-        X_scaled = scaler.fit_transform(X)
+        # 创建图表
+        fig = Figure(figsize=(10, 6))
+        ax = fig.subplots()
         
-        # 根据算法进行聚类
-        labels = None
-        if algorithm == 'kmeans':
-            from sklearn.cluster import KMeans
-            model = KMeans(n_clusters=n_clusters, random_state=42)
-            labels = model.fit_predict(X_scaled)
-        elif algorithm == 'dbscan':
-            from sklearn.cluster import DBSCAN
-            eps = config.get('eps', 0.5)
-            min_samples = config.get('min_samples', 5)
-            model = DBSCAN(eps=eps, min_samples=min_samples)
-            labels = model.fit_predict(X_scaled)
-        elif algorithm == 'hierarchical':
-            from sklearn.cluster import AgglomerativeClustering
-            model = AgglomerativeClustering(n_clusters=n_clusters)
-            labels = model.fit_predict(X_scaled)
-        else:
-            return {'success': False, 'error': f'不支持的聚类算法: {algorithm}'}
+        scatter = _draw_cluster_points(ax, points[:, 0], points[:, 1], labels,
+                                       config.get('density_threshold', DENSITY_POINTS))
         
-        # 将聚类结果添加到原始数据
-        X_with_clusters = pd.DataFrame(X_scaled, columns=valid_features)
-        X_with_clusters['cluster'] = labels
+        # 添加聚类中心（对于KMeans，多维数据时为中心点在主成分上的位置）
+        if centers is not None:
+            ax.scatter(centers[:, 0], centers[:, 1], c='red',
+                       s=100, alpha=0.8, marker='X')
         
-        # 创建图表
-        plt.figure(figsize=(12, 8))
+        fig.colorbar(scatter, ax=ax, label='聚类标签')
+        ax.grid(True, linestyle='--', alpha=0.7)
         
         # 如果是二维数据，直接绘制散点图
-        if len(valid_features) == 2:
-            fig, ax = plt.subplots(figsize=(10, 6))
-            scatter = ax.scatter(X_scaled[:, 0], X_scaled[:, 1], 
-                      c=labels, cmap='viridis', s=50, alpha=0.8)
-            
-            # 添加聚类中心（对于KMeans）
-            if algorithm == 'kmeans':
-                centers = model.cluster_centers_
-                ax.scatter(centers[:, 0], centers[:, 1], c='red', 
-                         s=100, alpha=0.8, marker='X')
+        if fit['explained_variance'] is None:
+            ax.set_xlabel(valid_features[0])
+            ax.set_ylabel(valid_features[1])
+            ax.set_title(f'聚类分析结果（算法: {algorithm}, 聚类数: {n_clusters}）')
             
-            plt.colorbar(scatter, label='聚类标签')
-            plt.xlabel(valid_features[0])
-            plt.ylabel(valid_features[1])
-            plt.title(f'聚类分析结果（算法: {algorithm}, 聚类数: {n_clusters}）')
-            plt.grid(True, linestyle='--', alpha=0.7)
-            
-        # 如果是多维数据，使用PCA降维后绘制
+        # 如果是多维数据，绘制PCA降维后的坐标
         else:
-            from sklearn.decomposition import PCA
-            pca = PCA(n_components=2)
-            X_pca = pca.fit_transform(X_scaled)
-            
-            fig, ax = plt.subplots(figsize=(10, 6))
-            scatter = ax.scatter(X_pca[:, 0], X_pca[:, 1], 
-                      c=labels, cmap='viridis', s=50, alpha=0.8)
-            
-            # 添加聚类中心（对于KMeans，需要将中心点也进行PCA转换）
-            if algorithm == 'kmeans':
-                centers = model.cluster_centers_
-                centers_pca = pca.transform(centers)
-                ax.scatter(centers_pca[:, 0], centers_pca[:, 1], c='red', 
-                         s=100, alpha=0.8, marker='X')
-            
-            plt.colorbar(scatter, label='聚类标签')
-            plt.xlabel('主成分 1')
-            plt.ylabel('主成分 2')
-            plt.title(f'聚类分析结果（算法: {algorithm}, 聚类数: {n_clusters}，PCA降维后）')
-            plt.grid(True, linestyle='--', alpha=0.7)
+            ax.set_xlabel('主成分 1')
+            ax.set_ylabel('主成分 2')
+            ax.set_title(f'聚类分析结果（算法: {algorithm}, 聚类数: {n_clusters}，PCA降维后）')
             
             # 添加方差解释图
-            explained_variance = pca.explained_variance_ratio_ * 100
-            plt.figtext(0.02, 0.02, f'主成分1解释方差: {explained_variance[0]:.2f}%\n'
-                        f'主成分2解释方差: {explained_variance[1]:.2f}%',
-                        fontsize=10)
+            explained_variance = fit['explained_variance'] * 100
+            fig.text(0.02, 0.02, f'主成分1解释方差: {explained_variance[0]:.2f}%\n'
+                     f'主成分2解释方差: {explained_variance[1]:.2f}%',
+                     fontsize=10)
         
         # 保存图表
-        app_root = os.path.abspath(os.path.dirname(os.path.dirname(os.path.dirname(__file__))))
-        image_dir = os.path.join(app_root, 'static', 'images')
-        os.makedirs(image_dir, exist_ok=True)
-            
-        filename = f"cluster_{algorithm}_{uuid.uuid4().hex}.png"
-        image_path = os.path.join(image_dir, filename)
+        if image_path is None:
+            image_dir = image_directory()
+            os.makedirs(image_dir, exist_ok=True)
+            image_path = os.path.join(image_dir, f"cluster_{algorithm}_{uuid.uuid4().hex}.png")
         
-        plt.tight_layout()
-        plt.savefig(image_path)
-        plt.close('all')
+        fig.tight_layout()
+        tmp_path = f"{image_path}.{uuid.uuid4().hex}.tmp"
+        fig.savefig(tmp_path, format='png')
+        os.replace(tmp_path, image_path)
         
         # 获取每个聚类的样本数量
         cluster_counts = pd.Series(labels).value_counts().sort_index().to_dict()
         
-        # 垃圾回收
-        import gc
-        gc.collect()
-        
         return {
             'success': True,
             'image_path': image_path,
-            'cluster_counts': cluster_counts,
+            'cluster_counts': {int(label): int(count) for label, count in cluster_counts.items()},
             'algorithm': algorithm,
-            'n_clusters': n_clusters,
+            'n_clusters': int(n_clusters),
             'feature_count': len(valid_features)
         }
         
     except Exception as e:
         import traceback
         traceback.print_exc()
-        plt.close('all')
         
         return {
             'success': False,
             'error': str(e)
-        } 
\ No newline at end of file
+        }
@@ -1,12 +1,31 @@
 from flask import current_app
 import os
 
+def split_file_extension(filename):
+    """拆分文件扩展名，返回(文件类型, 压缩格式)
+
+    例如 data.csv -> ('csv', None)，data.csv.gz -> ('csv', 'gz')
+    """
+    parts = filename.lower().rsplit('.', 2)
+    if len(parts) == 3 and parts[2] in current_app.config['COMPRESSED_EXTENSIONS']:
+        return parts[1], parts[2]
+    return parts[-1] if len(parts) > 1 else '', None
+
+def file_extension(filename):
+    """返回保存文件时使用的扩展名（压缩文件保留压缩后缀，如 csv.gz）"""
+    file_type, compression = split_file_extension(filename)
+    return f"{file_type}.{compression}" if compression else file_type
+
 def allowed_file(filename):
-    """检查文件是否为允许的类型"""
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in current_app.config['ALLOWED_EXTENSIONS']
+    """检查文件是否为允许的类型（压缩格式只支持CSV文件）"""
+    if '.' not in filename:
+        return False
+    file_type, compression = split_file_extension(filename)
+    if compression and file_type != 'csv':
+        return False
+    return file_type in current_app.config['ALLOWED_EXTENSIONS']
 
 def ensure_dir(directory):
     """确保目录存在，如不存在则创建"""
     if not os.path.exists(directory):
-        os.makedirs(directory) 
\ No newline at end of file
+        os.makedirs(directory) 
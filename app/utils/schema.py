@@ -0,0 +1,38 @@
+from sqlalchemy import inspect, text
+
+
+def upgrade_schema(db):
+    """创建缺少的数据表，并为已有的表补充模型中新增的列和索引
+
+    db.create_all()不会修改已存在的表，旧数据库中缺少新增的列（如datasets.content_hash）时
+    查询会失败。这里逐表比较模型与数据库中的列，用ALTER TABLE补充缺少的列，
+    已有行按列的默认值填充。返回补充的列名列表（"表.列"）。
+    """
+    db.create_all()
+    engine = db.engine
+    inspector = inspect(engine)
+    quote = engine.dialect.identifier_preparer.quote
+    added = []
+
+    for table in db.metadata.sorted_tables:
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        missing = [column for column in table.columns if column.name not in existing]
+        if not missing:
+            continue
+
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        with engine.begin() as conn:
+            for column in missing:
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f'ALTER TABLE {quote(table.name)} ADD COLUMN {quote(column.name)} {column_type}'))
+                if column.default is not None and column.default.is_scalar:
+                    conn.execute(table.update().values({column.name: column.default.arg}))
+                added.append(f'{table.name}.{column.name}')
+
+            for index in table.indexes:
+                if index.name not in existing_indexes and any(column.name in index.columns.keys() for column in missing):
+                    index.create(conn)
+
+    if added:
+        print(f"已为数据库补充新增的列: {', '.join(added)}")
+    return added
@@ -12,10 +12,57 @@ class Config:
     # 上传文件配置
     UPLOAD_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'uploads')
     ALLOWED_EXTENSIONS = {'csv', 'xlsx', 'xls'}
+    # 支持的CSV压缩格式（解析时流式解压，不保存解压后的文件）
+    COMPRESSED_EXTENSIONS = {'gz', 'bz2', 'zst'}
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
+    # 按内容哈希保存的上传文件，相同内容只保存一份
+    BLOB_FOLDER = os.path.join(UPLOAD_FOLDER, 'blobs')
+    # 清洗生成的数据集版本文件，每个版本创建后不再修改
+    VERSION_FOLDER = os.path.join(UPLOAD_FOLDER, 'versions')
+    # 每个数据集最多保留的版本文件数（原始文件和当前版本除外），超出时删除最久未使用的版本文件
+    MAX_VERSION_FILES = 20
+    
+    # 分块上传配置（可续传，不受MAX_CONTENT_LENGTH限制）
+    CHUNKED_UPLOAD_FOLDER = os.path.join(UPLOAD_FOLDER, 'partial')
+    UPLOAD_CHUNK_SIZE = 8 * 1024 * 1024  # 8MB，需小于MAX_CONTENT_LENGTH
+    MAX_UPLOAD_SIZE = 20 * 1024 * 1024 * 1024  # 20GB
+    CHUNKED_UPLOAD_EXPIRE_SECONDS = 24 * 3600  # 超过该时间没有收到数据的上传任务在创建新任务时被删除
+    
+    # 内存中缓存的清洗结果（DataFrame）总大小上限，超出时淘汰最久未使用的结果
+    SNAPSHOT_CACHE_BYTES = 512 * 1024 * 1024
+    
+    # 批量创建图表时一次最多包含的图表数
+    VISUALIZE_BATCH_MAX = 16
+    # 图表渲染缓存：按数据版本和图表配置命名的图片总大小上限，超出时删除最久未使用的图片
+    # （图表记录引用的图片被删除后，请求时重新绘制）
+    RENDER_CACHE_BYTES = 512 * 1024 * 1024
+    # 带内容版本参数的图表图片URL允许浏览器缓存的时间（秒），图片内容变化时URL随之变化
+    IMAGE_CACHE_MAX_AGE = 365 * 24 * 3600
     
     # 临时文件配置
     TEMP_FOLDER = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'temp')
+    
+    # 后台任务配置（清洗、训练、分析等耗时请求可以提交为后台任务，在独立的工作进程中执行）
+    JOB_WORKERS = 2
+    # 后台任务的进度和取消标记文件
+    JOB_FOLDER = os.path.join(TEMP_FOLDER, 'jobs')
+    # 保存的聚类结果（按数据版本、特征和算法配置命名），绘制聚类图时直接使用，不重新拟合
+    CLUSTER_FOLDER = os.path.join(TEMP_FOLDER, 'clusters')
+    
+    # 图表渲染进程数（常驻进程，matplotlib只导入一次），为0时在请求线程中渲染
+    RENDER_WORKERS = min(os.cpu_count() or 2, 4)
+    # 交给渲染进程的数据（Arrow IPC文件）所在目录，优先使用内存文件系统
+    RENDER_SHARED_FOLDER = '/dev/shm' if os.path.isdir('/dev/shm') else os.path.join(TEMP_FOLDER, 'render')
+    
+    # 请求调度配置：同时执行的重请求数（CPU预算），其中一部分只留给预览、可视化等交互请求
+    SCHEDULER_CPU_SLOTS = os.cpu_count() or 2
+    SCHEDULER_INTERACTIVE_RESERVED = 1
+    # 每个用户同时执行的批量请求（训练、聚类、分类等）数，以及未完成的后台任务数上限
+    SCHEDULER_USER_SLOTS = 1
+    SCHEDULER_USER_JOBS = 4
+    # 排队请求数上限，以及各类请求在队列中的最长等待时间（秒），超出时返回429和建议的重试间隔
+    SCHEDULER_MAX_QUEUE = 32
+    SCHEDULER_WAIT_SECONDS = {'interactive': 30, 'batch': 5}
 
 class DevelopmentConfig(Config):
     DEBUG = True
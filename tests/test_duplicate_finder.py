@@ -0,0 +1,63 @@
+import itertools
+import numpy as np
+import pandas as pd
+import pytest
+from app.services import duplicate_finder
+from app.services.duplicate_finder import KeyCodes, find_duplicate_keys
+
+
+def make_frame(rows=2000, seed=0):
+    """包含缺失值和不同基数的列，部分行完全重复"""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({
+        'id': rng.integers(0, rows, rows),
+        'city': rng.choice(['a', 'b', 'c', None], rows),
+        'code': rng.choice([1.0, 2.0, np.nan], rows),
+        'name': rng.choice([f'n{i}' for i in range(300)], rows),
+    })
+    df.loc[df.sample(frac=0.05, random_state=seed).index, 'city'] = np.nan
+    return pd.concat([df, df.head(50)], ignore_index=True)
+
+
+def all_combos(columns):
+    # 只比较多列组合：单列时DataFrame.duplicated会区分None和NaN，多列组合与KeyCodes一样视为相同
+    for size in (2, 3, 4):
+        yield from itertools.combinations(columns, size)
+
+
+def test_duplicate_count_matches_pandas():
+    df = make_frame()
+    engine = KeyCodes(df, df.columns)
+    for combo in all_combos(df.columns):
+        assert engine.duplicate_count(combo) == df.duplicated(subset=list(combo)).sum(), combo
+
+
+def test_duplicate_count_with_nan_keys():
+    df = pd.DataFrame({
+        'a': [1, 1, np.nan, np.nan, None, 2],
+        'b': ['x', 'x', None, None, np.nan, 'y'],
+    })
+    engine = KeyCodes(df, df.columns)
+    for combo in all_combos(df.columns):
+        assert engine.duplicate_count(combo) == df.duplicated(subset=list(combo)).sum(), combo
+
+
+@pytest.mark.parametrize('code_limit, bincount_factor', [(64, 4), (2 ** 62, 0), (64, 0)])
+def test_duplicate_count_when_codes_are_refactorized(monkeypatch, code_limit, bincount_factor):
+    # 调小上限，覆盖前缀组合压缩（防止溢出）和取值范围压缩两个分支
+    monkeypatch.setattr(duplicate_finder, 'CODE_LIMIT', code_limit)
+    monkeypatch.setattr(duplicate_finder, 'BINCOUNT_FACTOR', bincount_factor)
+    df = make_frame(rows=500, seed=1)
+    engine = KeyCodes(df, df.columns)
+    for combo in all_combos(df.columns):
+        assert engine.duplicate_count(combo) == df.duplicated(subset=list(combo)).sum(), combo
+
+
+def test_find_duplicate_keys_skips_unique_combos():
+    df = pd.DataFrame({
+        'id': range(6),
+        'a': [1, 1, 2, 2, 3, 3],
+        'b': ['x', 'x', 'y', 'y', 'z', 'w'],
+    })
+    results = dict(find_duplicate_keys(df, ['a', 'b', 'id']))
+    assert results == {('a', 'b'): 2}